@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# Módulos compartilhados com os scripts de src/ (detecção, modelo LBPH, filtro de movimento)
+SRC_DIR = str(Path(__file__).resolve().parent.parent / 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
@@ -0,0 +1,496 @@
+import argparse
+import heapq
+import json
+import threading
+import time
+
+import numpy as np
+
+
+class _SlotIndex:
+    """Base comum: vetores em matriz float32 contígua endereçada por slot"""
+
+    kind = None
+
+    def __init__(self, dim, capacity=1024):
+        self.dim = dim
+        self._vectors = np.empty((capacity, dim), dtype=np.float32)
+        self._used = 0
+        self._keys = []
+        self._slots = {}
+        self._free = []
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, key):
+        return key in self._slots
+
+    def _alloc(self, key, vector):
+        if self._free:
+            slot = self._free.pop()
+            self._keys[slot] = key
+        else:
+            if self._used == self._vectors.shape[0]:
+                grown = np.empty((2 * self._vectors.shape[0], self.dim), dtype=np.float32)
+                grown[:self._used] = self._vectors[:self._used]
+                self._vectors = grown
+            slot = self._used
+            self._used += 1
+            self._keys.append(key)
+        self._vectors[slot] = vector
+        self._slots[key] = slot
+        return slot
+
+    def _release(self, key, reuse=True):
+        slot = self._slots.pop(key)
+        self._keys[slot] = None
+        if reuse:
+            self._free.append(slot)
+        return slot
+
+    def has_vectors(self, keys, vectors):
+        """True se o índice tem exatamente essas chaves, cada uma com o vetor correspondente de `vectors`"""
+        with self._lock:
+            if len(keys) != len(self._slots) or any(key not in self._slots for key in keys):
+                return False
+            slots = [self._slots[key] for key in keys]
+            return bool(np.array_equal(self._vectors[slots], np.asarray(vectors, dtype=np.float32)))
+
+    def _distances(self, slots, query):
+        diff = self._vectors[slots] - query
+        return np.sqrt(np.einsum('ij,ij->i', diff, diff))
+
+    def add(self, key, vector):
+        """Insere ou substitui o vetor de uma chave"""
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        with self._lock:
+            if key in self._slots:
+                self._remove(key)
+            self._insert(key, vector)
+
+    def remove(self, key):
+        with self._lock:
+            if key not in self._slots:
+                return False
+            self._remove(key)
+            return True
+
+    def search(self, query, k=1):
+        """Retorna [(chave, distância L2)] dos k vizinhos encontrados, do mais próximo ao mais distante"""
+        query = np.asarray(query, dtype=np.float32).ravel()
+        with self._lock:
+            if not self._slots:
+                return []
+            return self._search(query, k)
+
+    def _state(self):
+        return {}, {}
+
+    def _restore(self, meta, arrays):
+        pass
+
+    def save(self, path):
+        with self._lock:
+            extra_meta, extra_arrays = self._state()
+            meta = dict(kind=self.kind, dim=self.dim, used=self._used, keys=self._keys,
+                        free=self._free, params=self.params(), **extra_meta)
+            np.savez(path, meta=np.array(json.dumps(meta)),
+                     vectors=self._vectors[:self._used], **extra_arrays)
+
+    def params(self):
+        return {}
+
+    @classmethod
+    def _from_saved(cls, meta, arrays):
+        index = cls(meta['dim'], **meta['params'])
+        vectors = arrays['vectors']
+        index._vectors = np.empty((max(len(vectors), 1024), index.dim), dtype=np.float32)
+        index._vectors[:len(vectors)] = vectors
+        index._used = meta['used']
+        index._keys = meta['keys']
+        index._free = meta['free']
+        index._slots = {key: slot for slot, key in enumerate(index._keys) if key is not None}
+        index._restore(meta, arrays)
+        return index
+
+
+class FlatIndex(_SlotIndex):
+    """Busca exata: compara a consulta com todos os vetores"""
+
+    kind = 'flat'
+
+    def _insert(self, key, vector):
+        self._alloc(key, vector)
+
+    def _remove(self, key):
+        self._release(key)
+
+    def _search(self, query, k):
+        slots = np.fromiter(self._slots.values(), dtype=np.int64, count=len(self._slots))
+        return _top_k(self._keys, slots, self._distances(slots, query), k)
+
+
+class IVFIndex(_SlotIndex):
+    """Quantização grossa (IVF): k-means em `nlist` centróides e listas invertidas.
+
+    A busca só visita as `nprobe` listas mais próximas da consulta. Enquanto
+    houver poucos vetores (ou após crescer muito desde o último treino) o
+    índice retreina os centróides automaticamente.
+    """
+
+    kind = 'ivf'
+
+    def __init__(self, dim, nlist=None, nprobe=8, min_train=256, kmeans_iters=10, seed=0, capacity=1024):
+        super().__init__(dim, capacity)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train = min_train
+        self.kmeans_iters = kmeans_iters
+        self.seed = seed
+        self.centroids = None
+        self._lists = []
+        self._assign = {}
+        self._trained_size = 0
+
+    def params(self):
+        return dict(nlist=self.nlist, nprobe=self.nprobe, min_train=self.min_train,
+                    kmeans_iters=self.kmeans_iters, seed=self.seed)
+
+    def _nearest_centroids(self, vectors, n):
+        d = (np.sum(vectors ** 2, axis=1)[:, None] - 2 * vectors @ self.centroids.T
+             + np.sum(self.centroids ** 2, axis=1)[None, :])
+        if n == 1:
+            return np.argmin(d, axis=1)[:, None]
+        n = min(n, self.centroids.shape[0])
+        part = np.argpartition(d, n - 1, axis=1)[:, :n]
+        return np.take_along_axis(part, np.argsort(np.take_along_axis(d, part, axis=1), axis=1), axis=1)
+
+    def train(self):
+        """(Re)calcula os centróides por k-means sobre uma amostra e redistribui as listas"""
+        slots = np.fromiter(self._slots.values(), dtype=np.int64, count=len(self._slots))
+        if len(slots) == 0:
+            return
+        nlist = self.nlist or max(1, int(np.sqrt(len(slots))))
+        nlist = min(nlist, len(slots))
+        rng = np.random.default_rng(self.seed)
+        sample = self._vectors[rng.choice(slots, size=min(len(slots), 64 * nlist), replace=False)]
+        self.centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(self.kmeans_iters):
+            assign = self._nearest_centroids(sample, 1)[:, 0]
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=nlist)
+            filled = counts > 0
+            self.centroids[filled] = sums[filled] / counts[filled, None]
+        self._lists = [[] for _ in range(nlist)]
+        self._assign = {}
+        assign = self._nearest_centroids(self._vectors[slots], 1)[:, 0]
+        for slot, list_id in zip(slots.tolist(), assign.tolist()):
+            self._assign[slot] = (list_id, len(self._lists[list_id]))
+            self._lists[list_id].append(slot)
+        self._trained_size = len(slots)
+
+    def _insert(self, key, vector):
+        slot = self._alloc(key, vector)
+        if self.centroids is None or len(self._slots) > 2 * max(self._trained_size, self.min_train // 2):
+            if len(self._slots) >= self.min_train:
+                self.train()
+            return
+        list_id = int(self._nearest_centroids(vector[None, :], 1)[0, 0])
+        self._assign[slot] = (list_id, len(self._lists[list_id]))
+        self._lists[list_id].append(slot)
+
+    def _remove(self, key):
+        slot = self._release(key)
+        placed = self._assign.pop(slot, None)
+        if placed is None:
+            return
+        list_id, pos = placed
+        members = self._lists[list_id]
+        last = members.pop()
+        if last != slot:
+            members[pos] = last
+            self._assign[last] = (list_id, pos)
+
+    def _search(self, query, k):
+        if self.centroids is None:
+            slots = np.fromiter(self._slots.values(), dtype=np.int64, count=len(self._slots))
+        else:
+            probe = self._nearest_centroids(query[None, :], self.nprobe)[0]
+            members = [self._lists[i] for i in probe.tolist() if self._lists[i]]
+            if not members:
+                return []
+            slots = np.fromiter((s for m in members for s in m), dtype=np.int64)
+        return _top_k(self._keys, slots, self._distances(slots, query), k)
+
+    def _state(self):
+        if self.centroids is None:
+            return {'trained_size': 0}, {}
+        assign = np.full(self._used, -1, dtype=np.int64)
+        for slot, (list_id, _) in self._assign.items():
+            assign[slot] = list_id
+        return {'trained_size': self._trained_size}, {'centroids': self.centroids, 'assign': assign}
+
+    def _restore(self, meta, arrays):
+        self._trained_size = meta['trained_size']
+        if 'centroids' not in arrays:
+            return
+        self.centroids = arrays['centroids']
+        self._lists = [[] for _ in range(self.centroids.shape[0])]
+        for slot, list_id in enumerate(arrays['assign'].tolist()):
+            if list_id >= 0:
+                self._assign[slot] = (list_id, len(self._lists[list_id]))
+                self._lists[list_id].append(slot)
+
+
+class HNSWIndex(_SlotIndex):
+    """Grafo navegável hierárquico (estilo HNSW).
+
+    Cada vetor recebe um nível aleatório e é ligado aos M vizinhos mais
+    próximos em cada camada. Remoções marcam o nó como apagado (ele continua
+    servindo de caminho no grafo); quando os apagados passam de
+    `rebuild_ratio` dos nós, o grafo é reconstruído.
+
+    Experimental: em Python puro a construção é lenta e a busca não ganha da
+    FlatIndex nos tamanhos de galeria da API (ver `python ann_index.py
+    --kinds flat ivf hnsw`). Não é oferecido como opção do GALLERY_INDEX.
+    """
+
+    kind = 'hnsw'
+
+    def __init__(self, dim, M=16, ef_construction=100, ef_search=64, rebuild_ratio=0.5, seed=0, capacity=1024):
+        super().__init__(dim, capacity)
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.rebuild_ratio = rebuild_ratio
+        self.seed = seed
+        self._rng = np.random.default_rng(seed)
+        self._level_mult = 1.0 / np.log(max(M, 2))
+        self._links = []
+        self._deleted = set()
+        self.entry = None
+        self.max_level = -1
+
+    def params(self):
+        return dict(M=self.M, ef_construction=self.ef_construction, ef_search=self.ef_search,
+                    rebuild_ratio=self.rebuild_ratio, seed=self.seed)
+
+    def _search_layer(self, query, entry_points, ef, level):
+        visited = set(entry_points)
+        dists = self._distances(np.array(entry_points, dtype=np.int64), query)
+        candidates = [(float(d), s) for d, s in zip(dists, entry_points)]
+        heapq.heapify(candidates)
+        found = [(-d, s) for d, s in candidates]
+        heapq.heapify(found)
+        while candidates:
+            dist, slot = heapq.heappop(candidates)
+            if dist > -found[0][0] and len(found) >= ef:
+                break
+            neighbors = [n for n in self._links[slot][level] if n not in visited]
+            if not neighbors:
+                continue
+            visited.update(neighbors)
+            for d, n in zip(self._distances(np.array(neighbors, dtype=np.int64), query).tolist(), neighbors):
+                if len(found) < ef or d < -found[0][0]:
+                    heapq.heappush(candidates, (d, n))
+                    heapq.heappush(found, (-d, n))
+                    if len(found) > ef:
+                        heapq.heappop(found)
+        return sorted((-d, s) for d, s in found)
+
+    def _greedy(self, query, level_from, level_to):
+        entry = [self.entry]
+        for level in range(level_from, level_to, -1):
+            entry = [self._search_layer(query, entry, 1, level)[0][1]]
+        return entry
+
+    def _shrink(self, slot, level, limit):
+        links = self._links[slot][level]
+        if len(links) <= limit:
+            return
+        dists = self._distances(np.array(links, dtype=np.int64), self._vectors[slot])
+        self._links[slot][level] = [links[i] for i in np.argsort(dists)[:limit].tolist()]
+
+    def _insert(self, key, vector):
+        slot = self._alloc(key, vector)
+        level = int(-np.log(max(self._rng.random(), 1e-12)) * self._level_mult)
+        links = [[] for _ in range(level + 1)]
+        if slot < len(self._links):
+            self._links[slot] = links
+        else:
+            self._links.append(links)
+        if self.entry is None:
+            self.entry, self.max_level = slot, level
+            return
+        entry = self._greedy(vector, self.max_level, level)
+        for lvl in range(min(level, self.max_level), -1, -1):
+            found = self._search_layer(vector, entry, self.ef_construction, lvl)
+            limit = 2 * self.M if lvl == 0 else self.M
+            neighbors = [s for _, s in found if s != slot][:self.M]
+            self._links[slot][lvl] = neighbors
+            for n in neighbors:
+                self._links[n][lvl].append(slot)
+                self._shrink(n, lvl, limit)
+            entry = [s for _, s in found]
+        if level > self.max_level:
+            self.entry, self.max_level = slot, level
+
+    def _remove(self, key):
+        # o slot não é reaproveitado: o nó continua no grafo como caminho até a reconstrução
+        slot = self._release(key, reuse=False)
+        self._deleted.add(slot)
+        if len(self._deleted) > self.rebuild_ratio * max(len(self._links), 1):
+            self.rebuild()
+
+    def rebuild(self):
+        """Reconstrói o grafo só com os nós ativos (descarta os apagados)"""
+        live = [(key, self._vectors[slot].copy()) for key, slot in self._slots.items()]
+        self._vectors = np.empty((max(len(live), 1024), self.dim), dtype=np.float32)
+        self._used = 0
+        self._keys = []
+        self._slots = {}
+        self._free = []
+        self._links = []
+        self._deleted = set()
+        self.entry = None
+        self.max_level = -1
+        for key, vector in live:
+            self._insert(key, vector)
+
+    def _search(self, query, k):
+        entry = self._greedy(query, self.max_level, 0)
+        ef = max(self.ef_search, k)
+        # com nós apagados, amplia o ef para ainda devolver k resultados ativos
+        if self._deleted:
+            ef = min(len(self._links), ef + len(self._deleted))
+        found = self._search_layer(query, entry, ef, 0)
+        result = [(self._keys[s], d) for d, s in found if s not in self._deleted]
+        return result[:k]
+
+    def _state(self):
+        offsets, flat, levels = [0], [], []
+        for links in self._links:
+            levels.append(len(links))
+            for layer in links:
+                flat.extend(layer)
+                offsets.append(len(flat))
+        meta = {'entry': self.entry, 'max_level': self.max_level, 'deleted': sorted(self._deleted)}
+        arrays = {'levels': np.array(levels, dtype=np.int32),
+                  'link_offsets': np.array(offsets, dtype=np.int64),
+                  'link_data': np.array(flat, dtype=np.int64)}
+        return meta, arrays
+
+    def _restore(self, meta, arrays):
+        self.entry = meta['entry']
+        self.max_level = meta['max_level']
+        self._deleted = set(meta['deleted'])
+        offsets = arrays['link_offsets'].tolist()
+        data = arrays['link_data'].tolist()
+        self._links = []
+        pos = 0
+        for n_levels in arrays['levels'].tolist():
+            layers = []
+            for _ in range(n_levels):
+                layers.append(data[offsets[pos]:offsets[pos + 1]])
+                pos += 1
+            self._links.append(layers)
+
+
+INDEX_KINDS = {cls.kind: cls for cls in (FlatIndex, IVFIndex, HNSWIndex)}
+# índices que a API aceita no GALLERY_INDEX (o HNSW fica só para comparação)
+GALLERY_KINDS = ('flat', 'ivf')
+
+
+def _top_k(keys, slots, distances, k):
+    k = min(k, len(slots))
+    if k == 0:
+        return []
+    top = np.argpartition(distances, k - 1)[:k] if k < len(slots) else np.arange(len(slots))
+    top = top[np.argsort(distances[top], kind='stable')]
+    return [(keys[slots[i]], float(distances[i])) for i in top]
+
+
+def create_index(kind, dim, **params):
+    if kind not in INDEX_KINDS:
+        raise ValueError(f"Índice desconhecido: {kind} (opções: {', '.join(INDEX_KINDS)})")
+    return INDEX_KINDS[kind](dim, **params)
+
+
+def load_index(path):
+    with np.load(path, allow_pickle=False) as data:
+        arrays = {name: data[name] for name in data.files}
+    meta = json.loads(str(arrays.pop('meta')))
+    return INDEX_KINDS[meta['kind']]._from_saved(meta, arrays)
+
+
+def evaluate(index, vectors, keys, queries, k=10):
+    """Recall@k e latência do índice comparados à busca exata (força bruta)"""
+    exact_times, index_times, hits = [], [], 0
+    for query in queries:
+        start = time.perf_counter()
+        dists = np.sqrt(np.sum((vectors - query) ** 2, axis=1))
+        truth = np.argpartition(dists, min(k, len(dists)) - 1)[:k]
+        exact_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        found = index.search(query, k)
+        index_times.append(time.perf_counter() - start)
+        hits += len({keys[i] for i in truth.tolist()} & {key for key, _ in found})
+    exact_ms = np.array(exact_times) * 1000
+    index_ms = np.array(index_times) * 1000
+    return {
+        'kind': index.kind,
+        'size': len(index),
+        'k': k,
+        'recall': hits / float(len(queries) * min(k, len(vectors))),
+        'exact_p50_ms': float(np.percentile(exact_ms, 50)),
+        'exact_p99_ms': float(np.percentile(exact_ms, 99)),
+        'index_p50_ms': float(np.percentile(index_ms, 50)),
+        'index_p99_ms': float(np.percentile(index_ms, 99)),
+    }
+
+
+def print_comparison(reports):
+    """Tabela dos relatórios do `evaluate`, com a aceleração relativa à força bruta"""
+    print(f"{'índice':<8}{'vetores':>9}{'build (s)':>11}{'recall':>8}{'p50 (ms)':>10}{'p99 (ms)':>10}{'vs exata':>10}")
+    for report in reports:
+        speedup = report['exact_p50_ms'] / report['index_p50_ms'] if report['index_p50_ms'] else float('inf')
+        print(f"{report['kind']:<8}{report['size']:>9}{report['build_s']:>11.2f}{report['recall']:>8.3f}"
+              f"{report['index_p50_ms']:>10.3f}{report['index_p99_ms']:>10.3f}{speedup:>9.2f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Recall e latência dos índices contra a busca exata')
+    parser.add_argument('--size', type=int, default=20000, help='Número de vetores na galeria sintética')
+    parser.add_argument('--dim', type=int, default=64)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--kinds', nargs='+', default=list(INDEX_KINDS), choices=list(INDEX_KINDS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='Imprime um relatório JSON por índice em vez da tabela')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    # galeria sintética agrupada (pessoas com várias amostras parecidas)
+    centers = rng.normal(size=(max(1, args.size // 20), args.dim)).astype(np.float32)
+    vectors = (centers[rng.integers(len(centers), size=args.size)]
+               + 0.1 * rng.normal(size=(args.size, args.dim))).astype(np.float32)
+    keys = [f"user_{i}" for i in range(args.size)]
+    queries = vectors[rng.integers(args.size, size=args.queries)] + 0.05 * rng.normal(size=(args.queries, args.dim))
+
+    reports = []
+    for kind in args.kinds:
+        index = create_index(kind, args.dim)
+        start = time.perf_counter()
+        for key, vector in zip(keys, vectors):
+            index.add(key, vector)
+        build_s = time.perf_counter() - start
+        report = evaluate(index, vectors, keys, queries.astype(np.float32), args.k)
+        report['build_s'] = build_s
+        reports.append(report)
+        if args.json:
+            print(json.dumps(report))
+    if not args.json:
+        print_comparison(reports)
@@ -1,84 +1,290 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g
 from flask_cors import CORS
-import base64
-import os
+import atexit
 import json
-import io
-import numpy as np
+import logging
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from PIL import Image
 import cv2
+import numpy as np
+
+import _paths  # coloca src/ no sys.path antes de qualquer import de src/ (lbph_engine, motion, detection)
+from detectors import registry, DEFAULT_CASCADE, DEFAULT_CASCADE_PATH
+from user_store import open_store
+from gallery import Gallery
+from ann_index import GALLERY_KINDS
+from descriptors import DescriptorExtractor, DescriptorStore, crop_face, DIM as DESCRIPTOR_DIM, FACE_SIZE
+from face_writer import FaceImageWriter
+from live_sessions import LiveSessionStore, DescriptorCache, face_hash
+from image_io import decode_image, read_image_request, base64_payload
+from metrics import REGISTRY, RequestTimings
+from profiler import SamplingProfiler
+from lbph_engine import open_model as open_lbph_model
+from motion import MotionGate
 
 app = Flask(__name__)
 CORS(app)
 
 # Configurações
-USERS_FILE = "users.json"
+USERS_FILE = "users.json"  # formato legado, importado na primeira execução
+USER_STORE = os.environ.get("USER_STORE", "sqlite")  # 'sqlite' ou 'log'
+USER_STORE_PATH = os.environ.get("USER_STORE_PATH", "users.db" if USER_STORE == "sqlite" else "users.log")
+USER_FLUSH_INTERVAL = float(os.environ.get("USER_FLUSH_INTERVAL", "2.0"))  # segundos
+GALLERY_INDEX = os.environ.get("GALLERY_INDEX", "flat")  # 'flat' (exato) ou 'ivf' (aproximado)
+if GALLERY_INDEX not in GALLERY_KINDS:
+    raise ValueError(f"GALLERY_INDEX desconhecido: {GALLERY_INDEX} (opções: {', '.join(GALLERY_KINDS)})")
+GALLERY_INDEX_PATH = os.environ.get("GALLERY_INDEX_PATH", "gallery_index.npz")
+DESCRIPTORS_FILE = "descriptors.bin"  # descritores LBP dos rostos cadastrados (binário)
+MATCH_THRESHOLD = float(os.environ.get("MATCH_THRESHOLD", "0.6"))  # similaridade mínima para login
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", str(os.cpu_count() or 4)))
+BATCH_MAX_FRAMES = int(os.environ.get("BATCH_MAX_FRAMES", "32"))
+STREAM_PORT = int(os.environ.get("STREAM_PORT", "5001"))  # WebSocket ao vivo (0 desativa)
+LBPH_MODEL = os.environ.get("LBPH_MODEL", "")  # modelo do train_lbph.py (.lbph em memmap ou .yml); vazio desativa
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()  # DEBUG mostra cada requisição e suas etapas
+PROFILER_ENABLED = os.environ.get("PROFILER_ENABLED", "0") == "1"  # habilita GET /debug/profile
 FACES_DIR = "faces"
+FACE_DEBUG_OVERLAY = os.environ.get("FACE_DEBUG_OVERLAY", "0") == "1"  # grava também o frame com a caixa desenhada
+# Filtro de movimento do ao vivo: com a cena parada o cascade não roda e valem as detecções anteriores
+MOTION_GATE = os.environ.get("MOTION_GATE", "1") == "1"
+MOTION_PIXEL_THRESHOLD = int(os.environ.get("MOTION_PIXEL_THRESHOLD", "12"))  # níveis de cinza
+MOTION_MIN_AREA = float(os.environ.get("MOTION_MIN_AREA", "0.005"))  # fração da imagem que precisa mudar
+MOTION_REFRESH_FRAMES = int(os.environ.get("MOTION_REFRESH_FRAMES", "15"))  # roda o cascade ao menos a cada N frames
+MOTION_REFRESH_SECONDS = float(os.environ.get("MOTION_REFRESH_SECONDS", "2.0"))  # ... ou a cada N segundos
+# Cache de resultados do /verify-live-face por sessão: rosto quase idêntico (hash perceptual) devolve o resultado anterior
+LIVE_RESULT_CACHE = os.environ.get("LIVE_RESULT_CACHE", "1") == "1"
+LIVE_RESULT_CACHE_SIZE = int(os.environ.get("LIVE_RESULT_CACHE_SIZE", "8"))  # descritores por sessão
+LIVE_RESULT_CACHE_TTL = float(os.environ.get("LIVE_RESULT_CACHE_TTL", "10"))  # segundos
+LIVE_HASH_DISTANCE = int(os.environ.get("LIVE_HASH_DISTANCE", "2"))  # bits diferentes (de 64) ainda considerados o mesmo rosto
+LIVE_SESSIONS_MAX = int(os.environ.get("LIVE_SESSIONS_MAX", "1024"))
+LIVE_SESSION_TTL = float(os.environ.get("LIVE_SESSION_TTL", "300"))  # segundos sem frames até esquecer a sessão
+
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s")
+log = logging.getLogger("face_api")
 
 # Criar diretórios se não existirem
 for directory in [FACES_DIR]:
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-def load_users():
-    if os.path.exists(USERS_FILE):
-        with open(USERS_FILE, 'r') as f:
-            return json.load(f)
-    return {}
+# Cascade carregado uma vez por processo e compartilhado entre as requisições
+registry.register(DEFAULT_CASCADE, DEFAULT_CASCADE_PATH)
 
-def save_users(users):
-    with open(USERS_FILE, 'w') as f:
-        json.dump(users, f, indent=2)
+# Parâmetros de detecção por endpoint (minSize maior para evitar falsos positivos).
+# Com minSize=100 o cascade roda em ~metade da resolução (work_min_size=48).
+registry.set_params('register_face', scale_factor=1.1, min_neighbors=5, min_size=(100, 100))
+registry.set_params('verify_face', scale_factor=1.1, min_neighbors=5, min_size=(100, 100))
+registry.set_params('verify_live_face', scale_factor=1.1, min_neighbors=5, min_size=(100, 100))
+registry.set_params('verify_batch', scale_factor=1.1, min_neighbors=5, min_size=(100, 100))
+registry.set_params('stream', scale_factor=1.1, min_neighbors=5, min_size=(100, 100))
 
-def base64_to_image(base64_string):
-    try:
-        if ',' in base64_string:
-            base64_string = base64_string.split(',')[1]
-        
-        image_data = base64.b64decode(base64_string)
-        image = Image.open(io.BytesIO(image_data))
-        return np.array(image)
-    except Exception as e:
-        print(f"Erro ao converter base64: {e}")
+# Usuários em memória; logins são persistidos em lote pelo store
+users_store = open_store(USER_STORE, USER_STORE_PATH, legacy_json=USERS_FILE,
+                         flush_interval=USER_FLUSH_INTERVAL)
+
+# Descritores calculados uma vez no cadastro e guardados no sidecar binário
+descriptor_extractor = DescriptorExtractor()
+descriptor_store = DescriptorStore(DESCRIPTORS_FILE)
+
+# Recorte + miniatura do cadastro gravados por uma thread, fora do tempo de resposta
+face_writer = FaceImageWriter(FACES_DIR, debug_overlay=FACE_DEBUG_OVERLAY)
+atexit.register(face_writer.close)
+
+def make_motion_gate():
+    if not MOTION_GATE:
         return None
+    return MotionGate(pixel_threshold=MOTION_PIXEL_THRESHOLD, min_area=MOTION_MIN_AREA,
+                      refresh_frames=MOTION_REFRESH_FRAMES, refresh_seconds=MOTION_REFRESH_SECONDS)
 
-def detect_faces_opencv(image_array):
-    """Detecta faces usando OpenCV Haar Cascades"""
+def make_descriptor_cache():
+    if not LIVE_RESULT_CACHE:
+        return None
+    return DescriptorCache(LIVE_RESULT_CACHE_SIZE, ttl=LIVE_RESULT_CACHE_TTL, max_distance=LIVE_HASH_DISTANCE)
+
+# Estado do /verify-live-face por `session_id` (filtro de movimento, última detecção e match, cache de descritores)
+live_sessions = LiveSessionStore(make_motion_gate, make_descriptor_cache,
+                                 max_sessions=LIVE_SESSIONS_MAX, ttl=LIVE_SESSION_TTL)
+
+def detect_faces_opencv(gray, endpoint=None):
+    """Detecta faces usando OpenCV Haar Cascades (imagem em escala de cinza)"""
     try:
-        # Converter para escala de cinza
-        gray = cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
-        
-        # Carregar classificador de faces
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        
-        # Detectar faces
-        faces = face_cascade.detectMultiScale(
-            gray,
-            scaleFactor=1.1,
-            minNeighbors=5,
-            minSize=(100, 100),  # Tamanho mínimo maior para evitar falsos positivos
-            flags=cv2.CASCADE_SCALE_IMAGE
-        )
+        # Detectar faces com o cascade já carregado (clone da thread atual)
+        faces = registry.detect(gray, endpoint)
         
         return len(faces) > 0, len(faces), faces
     except Exception as e:
-        print(f"Erro na detecção de faces: {e}")
+        log.error("Erro na detecção de faces: %s", e)
         return False, 0, []
 
-def calculate_face_features(face_coords, image_shape):
-    """Calcula características simples da face para comparação básica"""
-    x, y, w, h = face_coords
-    center_x = x + w/2
-    center_y = y + h/2
-    aspect_ratio = w/h
-    
-    # Normalizar pelas dimensões da imagem
-    normalized_x = center_x / image_shape[1]
-    normalized_y = center_y / image_shape[0]
-    normalized_size = (w * h) / (image_shape[0] * image_shape[1])
-    
-    return [normalized_x, normalized_y, normalized_size, aspect_ratio]
+def extract_face_descriptor(gray, face_coords):
+    """Descritor LBP do rosto recortado e redimensionado"""
+    return descriptor_extractor.compute_one(crop_face(gray, face_coords))
+
+def backfill_descriptors(batch_size=32):
+    """Calcula, em lote, o descritor de usuários antigos que só têm a imagem salva em faces/"""
+    pending = [
+        (user_id, os.path.join(FACES_DIR, user_data["face_image"]), user_data.get("face_crop", False))
+        for user_id, user_data in users_store.items()
+        if user_id not in descriptor_store and user_data.get("face_image")
+    ]
+    pending = [(user_id, path, is_crop) for user_id, path, is_crop in pending if os.path.exists(path)]
+    for start in range(0, len(pending), batch_size):
+        ids, crops = [], []
+        for user_id, path, is_crop in pending[start:start + batch_size]:
+            gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+            if gray is None:
+                continue
+            if is_crop:
+                # cadastros novos já guardam o recorte alinhado
+                ids.append(user_id)
+                crops.append(cv2.resize(gray, FACE_SIZE, interpolation=cv2.INTER_AREA))
+                continue
+            has_faces, num_faces, faces = detect_faces_opencv(gray, 'register_face')
+            if num_faces != 1:
+                continue
+            ids.append(user_id)
+            crops.append(crop_face(gray, faces[0]))
+        if crops:
+            for user_id, descriptor in zip(ids, descriptor_extractor.compute(crops)):
+                descriptor_store.put(user_id, descriptor)
+    if pending:
+        log.info("🧬 Descritores calculados para usuários antigos: %d imagem(ns) processada(s)", len(pending))
+
+backfill_descriptors()
+
+# Matriz de descritores para comparação vetorizada (com índice aproximado opcional)
+gallery = Gallery(dim=DESCRIPTOR_DIM, index_kind=GALLERY_INDEX).load(
+    descriptor_store.items(), index_path=GALLERY_INDEX_PATH)
+atexit.register(gallery.save_index, GALLERY_INDEX_PATH)
+# Cadastro, remoção ou troca de snapshot: resultados guardados do ao vivo deixam de valer
+gallery.listeners.append(live_sessions.invalidate)
+
+# Modelo LBPH treinado pelos scripts de src/ (opcional): o .lbph abre em milissegundos
+# e os histogramas são paginados do disco sob demanda
+lbph_model = open_lbph_model(LBPH_MODEL) if LBPH_MODEL else None
+if lbph_model is not None:
+    log.info("🧠 Modelo LBPH carregado: %s (%d histogramas)", LBPH_MODEL, len(lbph_model))
+
+# Métricas expostas em GET /metrics (por processo; no server.py cada worker tem as suas)
+FACES_DETECTED = REGISTRY.counter('face_api_faces_detected_total', 'Rostos detectados nas imagens recebidas', ['endpoint'])
+MATCHES = REGISTRY.counter('face_api_matches_total', 'Resultado das verificações (match, no_match, no_face, multiple_faces)',
+                           ['endpoint', 'result'])
+REGISTRY.gauge('face_api_gallery_size', 'Usuários na galeria de descritores', fn=lambda: len(gallery))
+REGISTRY.gauge('face_api_users', 'Usuários cadastrados', fn=lambda: len(users_store))
+REGISTRY.counter('face_api_descriptor_cache_hits_total', 'Descritores servidos do cache', fn=lambda: descriptor_extractor.hits)
+REGISTRY.counter('face_api_descriptor_cache_misses_total', 'Descritores calculados', fn=lambda: descriptor_extractor.misses)
+REGISTRY.gauge('face_api_face_writes_pending', 'Imagens de cadastro aguardando gravação', fn=face_writer.pending)
+REGISTRY.counter('face_api_face_write_errors_total', 'Falhas ao gravar imagens de cadastro', fn=lambda: face_writer.failed)
+CASCADE_RUNS = REGISTRY.counter('face_api_cascade_runs_total', 'Frames ao vivo com o filtro de movimento (result: run, skipped)',
+                                ['endpoint', 'result'])
+REGISTRY.gauge('face_api_cascade_clones', 'Clones do cascade montados (o pool cresce até o pico de detecções simultâneas)',
+               fn=lambda: registry.built)
+REGISTRY.gauge('face_api_live_sessions', 'Sessões do /verify-live-face em memória', fn=lambda: len(live_sessions))
+REGISTRY.counter('face_api_live_result_cache_hits_total', 'Rostos do /verify-live-face com descritor reaproveitado do cache',
+                 fn=lambda: live_sessions.hits)
+REGISTRY.counter('face_api_live_result_cache_misses_total', 'Rostos do /verify-live-face com descritor extraído',
+                 fn=lambda: live_sessions.misses)
+REGISTRY.gauge('face_api_live_result_cache_hit_ratio', 'Fração de acertos do cache do ao vivo', fn=live_sessions.hit_rate)
+
+profiler = SamplingProfiler() if PROFILER_ENABLED else None
+
+@app.before_request
+def start_timings():
+    g.timings = RequestTimings(request.endpoint or 'unknown')
+
+@app.after_request
+def finish_timings(response):
+    timings = g.get('timings')
+    if timings is not None:
+        total = timings.finish(str(response.status_code))
+        if timings.stages:
+            response.headers['Server-Timing'] = timings.server_timing()
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%s %d %.1fms %s", timings.endpoint, response.status_code, total * 1000,
+                      {name: round(seconds * 1000, 2) for name, seconds in timings.stages.items()})
+    return response
+
+def motion_check(gate, gray, endpoint):
+    """True = rodar o cascade; False = cena parada, reaproveitar a detecção anterior"""
+    if gate is None:
+        return True
+    run = gate.check(gray)
+    CASCADE_RUNS.inc(endpoint=endpoint, result='run' if run else 'skipped')
+    return run
+
+def count_match(endpoint, best_match, best_similarity):
+    MATCHES.inc(endpoint=endpoint, result='match' if best_match and best_similarity > MATCH_THRESHOLD else 'no_match')
+
+def lbph_prediction(gray, face_coords):
+    """Predição do modelo LBPH para o rosto (mesmo recorte 200x200 do treino)"""
+    x, y, w, h = [int(v) for v in face_coords]
+    ranked = lbph_model.predict_batch([cv2.resize(gray[y:y + h, x:x + w], (200, 200))])[0]
+    if not ranked:
+        return {"label": -1, "name": None, "distance": None}
+    label, distance = ranked[0]
+    names = {v: k for k, v in lbph_model.names.items()}
+    return {"label": label, "name": names.get(label), "distance": distance}
+
+# Chamados após cada cadastro (o server.py usa para avisar o processo mestre)
+enrollment_listeners = []
+
+def notify_enrollment(user_id):
+    for listener in enrollment_listeners:
+        try:
+            listener(user_id)
+        except Exception as e:
+            log.warning("⚠️ Aviso de cadastro falhou: %s", e)
+
+def reload_enrollments():
+    """Aplica cadastros feitos por outros processos: só os registros novos do descriptors.bin e do store"""
+    changed = descriptor_store.refresh()
+    for user_id in changed:
+        vector = descriptor_store.get(user_id)
+        if vector is None:
+            gallery.remove(user_id)
+        else:
+            gallery.upsert(user_id, vector)
+    users_store.reload()
+    return changed
+
+def warm_up():
+    """Primeira execução de cada etapa (cascade da thread, LBP, busca) fora do caminho da requisição"""
+    registry.warm_up()
+    probe = descriptor_extractor.compute_one(np.zeros(FACE_SIZE[::-1], dtype=np.uint8))
+    gallery.search(probe)
+
+def find_best_match(current_features, top_k=1):
+    """Compara a face atual com toda a galeria de uma vez e devolve (melhor, similaridade, top-k)"""
+    matches = gallery.search(current_features, k=max(1, top_k))
+    if not matches or matches[0][1] <= 0:
+        return None, 0, matches
+    return matches[0][0], matches[0][1], matches
+
+def parse_top_k(data):
+    """top_k da requisição (padrão 1), limitado ao tamanho da galeria; None se não for um inteiro >= 1"""
+    raw = data.get('top_k', 1)
+    if isinstance(raw, float) and raw.is_integer():
+        raw = int(raw)
+    if isinstance(raw, bool) or isinstance(raw, float):
+        return None
+    try:
+        top_k = int(str(raw).strip())
+    except ValueError:
+        return None
+    if top_k < 1:
+        return None
+    return min(top_k, max(1, len(gallery)))
+
+TOP_K_ERROR = "top_k deve ser um número inteiro maior ou igual a 1"
+
+def match_response(payload, matches, top_k):
+    """Resposta JSON do verify; inclui os top-k candidatos quando solicitado"""
+    if top_k > 1:
+        payload["candidates"] = [
+            {"user_id": user_id, "similarity": similarity} for user_id, similarity in matches
+        ]
+    return jsonify(payload)
 
 @app.route('/health', methods=['GET'])
 def health():
@@ -86,28 +292,59 @@ def health():
         "status": "✅ API de Reconhecimento Facial funcionando", 
         "version": "3.0",
         "mode": "OPENCV_HAAR",
-        "features": "Detecção facial real + comparação básica + modo ao vivo"
+        "features": "Detecção facial real + descritores LBP + modo ao vivo"
     })
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Latência por etapa, contadores e tamanho da galeria no formato texto do Prometheus"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/debug/profile', methods=['GET'])
+def debug_profile():
+    """Amostra as pilhas de todas as threads por ?seconds=N (máx. 60); resposta no formato collapsed (flamegraph)"""
+    if profiler is None:
+        return jsonify({"success": False, "error": "Profiler desativado (PROFILER_ENABLED=1)"}), 404
+    try:
+        seconds = float(request.args.get('seconds', 10))
+    except ValueError:
+        seconds = float('nan')
+    if not seconds > 0:  # também recusa nan
+        return jsonify({"success": False, "error": "seconds deve ser um número positivo"}), 400
+    seconds = min(seconds, 60.0)
+    try:
+        samples, stacks = profiler.sample(seconds)
+    except RuntimeError as e:
+        return jsonify({"success": False, "error": str(e)}), 409
+    log.info("🔬 Profiler: %d amostra(s) em %.1fs", samples, seconds)
+    return Response(profiler.collapsed(stacks), mimetype='text/plain')
+
 @app.route('/register-face', methods=['POST'])
 def register_face():
     try:
-        data = request.json
+        timings = g.timings
+        with timings.stage('decode'):
+            data, image_data = read_image_request(request)
         user_id = data.get('user_id')
-        image_data = data.get('image')
         
-        print(f"📸 Tentando cadastrar face REAL para: {user_id}")
+        log.debug("📸 Tentando cadastrar face REAL para: %s", user_id)
         
-        if not user_id or not image_data:
+        if not user_id or image_data is None:
             return jsonify({"success": False, "error": "user_id e image são obrigatórios"})
         
-        # Converter base64 para imagem
-        image_array = base64_to_image(image_data)
-        if image_array is None:
+        # Decodificar direto em cinza, como nos endpoints de verificação: o cvtColor de uma
+        # decodificação colorida dá outros níveis de cinza (e outras caixas) e o descritor
+        # do cadastro não bateria com o da mesma imagem no verify. A imagem só é decodificada
+        # uma vez: o recorte salvo também é o cinza (é o que o backfill dos descritores lê)
+        with timings.stage('decode'):
+            gray = decode_image(image_data, grayscale=True)
+        if gray is None:
             return jsonify({"success": False, "error": "Imagem inválida"})
         
         # Verificar se há rostos na imagem (DETECÇÃO REAL)
-        has_faces, num_faces, faces = detect_faces_opencv(image_array)
+        with timings.stage('detect'):
+            has_faces, num_faces, faces = detect_faces_opencv(gray, 'register_face')
+        FACES_DETECTED.inc(num_faces, endpoint='register_face')
         
         if not has_faces:
             return jsonify({
@@ -121,37 +358,31 @@ def register_face():
                 "error": f"❌ Múltiplos rostos detectados ({num_faces}). Envie uma foto com apenas uma pessoa."
             })
         
-        # Calcar características da face detectada
-        face_features = calculate_face_features(faces[0], image_array.shape)
-        
-        # Salvar imagem da face
-        face_filename = f"{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-        face_path = os.path.join(FACES_DIR, face_filename)
-        
-        # Desenhar retângulo na face detectada (para debug)
-        debug_image = image_array.copy()
-        x, y, w, h = faces[0]
-        cv2.rectangle(debug_image, (x, y), (x+w, y+h), (0, 255, 0), 3)
-        cv2.putText(debug_image, "ROSTO DETECTADO", (x, y-10), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
-        
-        Image.fromarray(debug_image).save(face_path, 'JPEG')
-        
-        # Salvar dados do usuário
-        users = load_users()
-        users[user_id] = {
-            "registered_at": datetime.now().isoformat(),
-            "face_image": face_filename,
-            "face_features": face_features,
-            "face_detected": True,
-            "num_faces": num_faces,
-            "image_shape": image_array.shape,
-            "last_login": None,
-            "login_count": 0
-        }
-        save_users(users)
+        # Calcular o descritor LBP da face detectada (uma única vez, no cadastro)
+        with timings.stage('extract'):
+            face_descriptor = extract_face_descriptor(gray, faces[0])
+        
+        with timings.stage('persist'):
+            # Recorte alinhado e miniatura (nomes pelo hash do recorte) vão para a fila de gravação
+            images = face_writer.submit(crop_face(gray, faces[0]), frame=gray, box=faces[0])
+        
+            # Salvar dados do usuário
+            users_store.put(user_id, {
+                "registered_at": datetime.now().isoformat(),
+                **images,
+                "face_crop": True,
+                "descriptor": "lbp_u2_8x8",
+                "face_detected": True,
+                "num_faces": num_faces,
+                "image_shape": list(gray.shape),
+                "last_login": None,
+                "login_count": 0
+            })
+            descriptor_store.put(user_id, face_descriptor)
+            gallery.upsert(user_id, face_descriptor)
+            notify_enrollment(user_id)
         
-        print(f"✅ Usuário {user_id} cadastrado com DETECÇÃO REAL! Rostos: {num_faces}")
+        log.info("✅ Usuário %s cadastrado com DETECÇÃO REAL! Rostos: %d", user_id, num_faces)
         
         return jsonify({
             "success": True, 
@@ -162,29 +393,37 @@ def register_face():
         })
         
     except Exception as e:
-        print(f"❌ Erro no cadastro: {e}")
+        log.exception("❌ Erro no cadastro: %s", e)
         return jsonify({"success": False, "error": str(e)})
 
 @app.route('/verify-face', methods=['POST'])
 def verify_face():
     try:
-        data = request.json
-        image_data = data.get('image')
+        timings = g.timings
+        with timings.stage('decode'):
+            data, image_data = read_image_request(request)
         
-        print("🔍 Verificando face com DETECÇÃO REAL...")
+        log.debug("🔍 Verificando face com DETECÇÃO REAL...")
         
-        if not image_data:
+        if image_data is None:
             return jsonify({"success": False, "error": "image é obrigatório"})
-        
-        # Converter base64 para imagem
-        image_array = base64_to_image(image_data)
-        if image_array is None:
+        top_k = parse_top_k(data)
+        if top_k is None:
+            return jsonify({"success": False, "error": TOP_K_ERROR}), 400
+        
+        # Decodificar direto para escala de cinza (sem imagem colorida intermediária)
+        with timings.stage('decode'):
+            gray = decode_image(image_data, grayscale=True)
+        if gray is None:
             return jsonify({"success": False, "error": "Imagem inválida"})
         
         # Verificar se há rostos na imagem (DETECÇÃO REAL)
-        has_faces, num_faces, faces = detect_faces_opencv(image_array)
+        with timings.stage('detect'):
+            has_faces, num_faces, faces = detect_faces_opencv(gray, 'verify_face')
+        FACES_DETECTED.inc(num_faces, endpoint='verify_face')
         
         if not has_faces:
+            MATCHES.inc(endpoint='verify_face', result='no_face')
             return jsonify({
                 "success": True,
                 "authenticated": False,
@@ -193,6 +432,7 @@ def verify_face():
             })
         
         if num_faces > 1:
+            MATCHES.inc(endpoint='verify_face', result='multiple_faces')
             return jsonify({
                 "success": True,
                 "authenticated": False,
@@ -200,9 +440,7 @@ def verify_face():
                 "mode": "REAL_DETECTION"
             })
         
-        users = load_users()
-        
-        if not users:
+        if len(users_store) == 0:
             return jsonify({
                 "success": True,
                 "authenticated": False,
@@ -210,102 +448,115 @@ def verify_face():
                 "mode": "REAL_DETECTION"
             })
         
-        # Calcular características da face atual
-        current_features = calculate_face_features(faces[0], image_array.shape)
-        
-        # Comparar com usuários cadastrados (VERIFICAÇÃO BÁSICA)
-        best_match = None
-        best_similarity = 0
-        
-        for user_id, user_data in users.items():
-            if "face_features" in user_data:
-                saved_features = user_data["face_features"]
-                
-                # Calcular similaridade simples baseada na posição/tamanho
-                similarity = 1.0 - np.sqrt(
-                    sum((a - b) ** 2 for a, b in zip(current_features, saved_features))
-                )
-                
-                print(f"🔍 Comparando com {user_id}: Similaridade = {similarity:.2f}")
-                
-                if similarity > best_similarity:
-                    best_similarity = similarity
-                    best_match = user_id
-        
-        # Se similaridade > 40% (threshold baixo para demonstração)
-        if best_match and best_similarity > 0.4:
-            # Atualizar dados do usuário
-            users[best_match]["last_login"] = datetime.now().isoformat()
-            users[best_match]["login_count"] = users[best_match].get("login_count", 0) + 1
-            save_users(users)
+        # Calcular o descritor da face atual (só a probe é calculada no verify)
+        with timings.stage('extract'):
+            current_features = extract_face_descriptor(gray, faces[0])
+        
+        # Comparar com todos os usuários cadastrados de uma vez (descritores LBP)
+        with timings.stage('match'):
+            best_match, best_similarity, matches = find_best_match(current_features, top_k)
+            extra = {"lbph": lbph_prediction(gray, faces[0])} if lbph_model is not None else {}
+        log.debug("🔍 Comparação com %d usuário(s): melhor = %s (%.2f)", len(gallery), best_match, best_similarity)
+        count_match('verify_face', best_match, best_similarity)
+        
+        # Se similaridade acima do threshold configurado
+        if best_match and best_similarity > MATCH_THRESHOLD:
+            # Atualizar dados do usuário (gravação em lote)
+            with timings.stage('persist'):
+                login_count = users_store.record_login(best_match)
             
-            print(f"✅ Login facial REAL realizado para: {best_match} (similaridade: {best_similarity:.2f})")
+            log.info("✅ Login facial REAL realizado para: %s (similaridade: %.2f)", best_match, best_similarity)
             
-            return jsonify({
+            return match_response({
                 "success": True,
                 "authenticated": True,
                 "user_id": best_match,
                 "confidence": float(best_similarity),
                 "message": "✅ Login facial realizado com sucesso!",
-                "login_count": users[best_match]["login_count"],
+                "login_count": login_count,
                 "mode": "REAL_DETECTION",
-                "faces_detected": num_faces
-            })
+                "faces_detected": num_faces,
+                **extra
+            }, matches, top_k)
         else:
-            return jsonify({
+            return match_response({
                 "success": True,
                 "authenticated": False,
                 "message": "❌ Rosto não reconhecido. Cadastre-se primeiro.",
                 "similarity": float(best_similarity) if best_match else 0,
-                "mode": "REAL_DETECTION"
-            })
+                "mode": "REAL_DETECTION",
+                **extra
+            }, matches, top_k)
             
     except Exception as e:
-        print(f"❌ Erro na verificação: {e}")
+        log.exception("❌ Erro na verificação: %s", e)
         return jsonify({"success": False, "error": str(e)})
 
 @app.route('/verify-live-face', methods=['POST'])
 def verify_live_face():
     """Endpoint específico para verificação ao vivo"""
     try:
-        data = request.json
-        image_data = data.get('image')
+        timings = g.timings
+        with timings.stage('decode'):
+            data, image_data = read_image_request(request)
         
-        print("🎥 Verificação FACIAL AO VIVO...")
+        log.debug("🎥 Verificação FACIAL AO VIVO...")
         
-        if not image_data:
+        if image_data is None:
             return jsonify({"success": False, "error": "image é obrigatório"})
-        
-        # Converter base64 para imagem
-        image_array = base64_to_image(image_data)
-        if image_array is None:
+        top_k = parse_top_k(data)
+        if top_k is None:
+            return jsonify({"success": False, "error": TOP_K_ERROR}), 400
+        
+        # Decodificar direto para escala de cinza (sem imagem colorida intermediária)
+        with timings.stage('decode'):
+            gray = decode_image(image_data, grayscale=True)
+        if gray is None:
             return jsonify({"success": False, "error": "Imagem inválida"})
         
-        # Verificar se há rostos na imagem
-        has_faces, num_faces, faces = detect_faces_opencv(image_array)
+        # Com `session_id`, frames sem movimento reaproveitam a detecção e o match anteriores
+        session_id = data.get('session_id')
+        state = live_sessions.get(str(session_id)) if session_id and (MOTION_GATE or LIVE_RESULT_CACHE) else None
+        cached = False
+        if state is not None:
+            with state.lock:
+                cached = not motion_check(state.gate, gray, 'verify_live_face')
+                faces, features, last_match = state.faces, state.features, state.match
+        if not cached:
+            with timings.stage('detect'):
+                has_faces, num_faces, faces = detect_faces_opencv(gray, 'verify_live_face')
+            FACES_DETECTED.inc(num_faces, endpoint='verify_live_face')
+            features = last_match = None
+            if state is not None:
+                with state.lock:
+                    state.faces, state.features, state.match = faces, None, None
+        num_faces = len(faces)
+        has_faces = num_faces > 0
         
         if not has_faces:
+            MATCHES.inc(endpoint='verify_live_face', result='no_face')
             return jsonify({
                 "success": True,
                 "authenticated": False,
                 "message": "Nenhum rosto detectado. Posicione-se melhor.",
                 "face_detected": False,
+                "cached_detection": cached,
                 "mode": "LIVE_RECOGNITION"
             })
         
         if num_faces > 1:
+            MATCHES.inc(endpoint='verify_live_face', result='multiple_faces')
             return jsonify({
                 "success": True,
                 "authenticated": False,
                 "message": f"Múltiplos rostos detectados ({num_faces}).",
                 "face_detected": True,
                 "multiple_faces": True,
+                "cached_detection": cached,
                 "mode": "LIVE_RECOGNITION"
             })
         
-        users = load_users()
-        
-        if not users:
+        if len(users_store) == 0:
             return jsonify({
                 "success": True,
                 "authenticated": False,
@@ -314,65 +565,283 @@ def verify_live_face():
                 "mode": "LIVE_RECOGNITION"
             })
         
-        # Calcular características da face atual
-        current_features = calculate_face_features(faces[0], image_array.shape)
-        
-        # Buscar melhor match
-        best_match = None
-        best_similarity = 0
-        
-        for user_id, user_data in users.items():
-            if "face_features" in user_data:
-                saved_features = user_data["face_features"]
-                
-                similarity = 1.0 - np.sqrt(
-                    sum((a - b) ** 2 for a, b in zip(current_features, saved_features))
-                )
-                
-                print(f"🔍 Live: {user_id} - Similaridade: {similarity:.2f}")
-                
-                if similarity > best_similarity:
-                    best_similarity = similarity
-                    best_match = user_id
-        
-        # Threshold para reconhecimento
-        recognition_threshold = 0.4
-        
-        if best_match and best_similarity > recognition_threshold:
-            users[best_match]["last_login"] = datetime.now().isoformat()
-            users[best_match]["login_count"] = users[best_match].get("login_count", 0) + 1
-            save_users(users)
+        # Calcular o descritor da face atual (só a probe é calculada no verify); rosto praticamente
+        # igual a um já visto nesta sessão reaproveita o descritor, mas a busca e o login rodam sempre
+        cached_descriptor = False
+        if features is None:
+            face_key = face_hash(gray, faces[0]) if state is not None and state.descriptors is not None else None
+            if face_key is not None:
+                features = live_sessions.lookup(state, face_key)
+                cached_descriptor = features is not None
+            if features is None:
+                with timings.stage('extract'):
+                    features = extract_face_descriptor(gray, faces[0])
+                if face_key is not None:
+                    live_sessions.remember(state, face_key, features)
+        
+        # Buscar melhor match na galeria inteira (cena parada: vale o match anterior)
+        if last_match is not None and last_match[0] == top_k:
+            _, best_match, best_similarity, matches = last_match
+        else:
+            with timings.stage('match'):
+                best_match, best_similarity, matches = find_best_match(features, top_k)
+            last_match = (top_k, best_match, best_similarity, matches)
+        if state is not None:
+            with state.lock:
+                if state.faces is faces:  # outra requisição da sessão pode ter detectado de novo
+                    state.features, state.match = features, last_match
+        log.debug("🔍 Live: %d usuário(s) - melhor = %s (%.2f)", len(gallery), best_match, best_similarity)
+        count_match('verify_live_face', best_match, best_similarity)
+        
+        if best_match and best_similarity > MATCH_THRESHOLD:
+            with timings.stage('persist'):
+                login_count = users_store.record_login(best_match)
             
-            print(f"✅ LOGIN AO VIVO: {best_match} (confiança: {best_similarity:.2f})")
+            log.info("✅ LOGIN AO VIVO: %s (confiança: %.2f)", best_match, best_similarity)
             
-            return jsonify({
+            payload = {
                 "success": True,
                 "authenticated": True,
                 "user_id": best_match,
                 "confidence": float(best_similarity),
                 "message": "Reconhecimento facial confirmado!",
-                "login_count": users[best_match]["login_count"],
+                "login_count": login_count,
                 "face_detected": True,
+                "cached_detection": cached,
+                "cached_descriptor": cached_descriptor,
                 "mode": "LIVE_RECOGNITION"
-            })
+            }
         else:
-            return jsonify({
+            payload = {
                 "success": True,
                 "authenticated": False,
                 "message": "Rosto não reconhecido",
                 "face_detected": True,
                 "similarity": float(best_similarity) if best_match else 0,
+                "cached_detection": cached,
+                "cached_descriptor": cached_descriptor,
                 "mode": "LIVE_RECOGNITION"
-            })
+            }
+        return match_response(payload, matches, top_k)
             
     except Exception as e:
-        print(f"❌ Erro na verificação ao vivo: {e}")
+        log.exception("❌ Erro na verificação ao vivo: %s", e)
         return jsonify({"success": False, "error": str(e)})
 
+# Pool para decodificar e detectar os frames do /verify-batch em paralelo
+# (cv2.imdecode e detectMultiScale liberam o GIL)
+batch_pool = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='verify-batch')
+
+def prepare_probe(image_data):
+    """Decodifica e detecta um frame; devolve o recorte do rosto ou o motivo da falha"""
+    gray = decode_image(image_data, grayscale=True)
+    if gray is None:
+        return {"error": "Imagem inválida"}
+    has_faces, num_faces, faces = detect_faces_opencv(gray, 'verify_batch')
+    if num_faces != 1:
+        return {"faces_detected": num_faces}
+    return {"faces_detected": 1, "crop": crop_face(gray, faces[0])}
+
+def read_batch_request():
+    """Frames do /verify-batch: JSON {"frames": [{"image", "camera_id"}]} ou multipart com vários `image`"""
+    if request.mimetype == 'multipart/form-data':
+        uploads = request.files.getlist('image')
+        cameras = request.form.getlist('camera_id')
+        frames = [
+            {"image": upload.read(), "camera_id": cameras[i] if i < len(cameras) else None}
+            for i, upload in enumerate(uploads)
+        ]
+        return request.form.to_dict(), frames
+    data = request.get_json(silent=True) or {}
+    frames = [
+        {"image": base64_payload(frame.get('image') or ''), "camera_id": frame.get('camera_id')}
+        for frame in data.get('frames') or []
+    ]
+    return data, frames
+
+def fuse_results(results):
+    """Decisão única a partir dos frames: usuário com maior similaridade média entre os frames com rosto"""
+    votes = defaultdict(list)
+    for result in results:
+        if result.get("best_match"):
+            votes[result["best_match"]].append(result["similarity"])
+    frames_with_face = sum(1 for r in results if r.get("faces_detected") == 1)
+    if not votes:
+        return {"authenticated": False, "frames_with_face": frames_with_face}
+    user_id, scores = max(votes.items(), key=lambda item: (len(item[1]), sum(item[1]) / len(item[1])))
+    mean_similarity = sum(scores) / len(scores)
+    # maioria simples dos frames com rosto e média acima do threshold
+    authenticated = mean_similarity > MATCH_THRESHOLD and 2 * len(scores) > frames_with_face
+    return {
+        "authenticated": authenticated,
+        "user_id": user_id if authenticated else None,
+        "candidate": user_id,
+        "confidence": float(mean_similarity),
+        "votes": len(scores),
+        "frames_with_face": frames_with_face,
+    }
+
+@app.route('/verify-batch', methods=['POST'])
+def verify_batch():
+    """Verifica vários frames (de uma ou mais câmeras) em uma única requisição"""
+    try:
+        timings = g.timings
+        with timings.stage('decode'):
+            data, frames = read_batch_request()
+        
+        log.debug("🎞️ Verificação em lote: %d frame(s)", len(frames))
+        
+        if not frames:
+            return jsonify({"success": False, "error": "frames é obrigatório"})
+        if len(frames) > BATCH_MAX_FRAMES:
+            return jsonify({"success": False, "error": f"Máximo de {BATCH_MAX_FRAMES} frames por lote"})
+        top_k = parse_top_k(data)
+        if top_k is None:
+            return jsonify({"success": False, "error": TOP_K_ERROR}), 400
+        
+        # Decodificação e detecção em paralelo
+        with timings.stage('detect'):
+            probes = list(batch_pool.map(prepare_probe, [frame["image"] for frame in frames]))
+        FACES_DETECTED.inc(sum(probe.get("faces_detected", 0) for probe in probes), endpoint='verify_batch')
+        
+        # Descritores de todos os rostos em lote e comparação em uma única operação de matriz
+        with_face = [i for i, probe in enumerate(probes) if "crop" in probe]
+        matches = []
+        if with_face and len(gallery) > 0:
+            with timings.stage('extract'):
+                descriptors = descriptor_extractor.compute([probes[i]["crop"] for i in with_face])
+            with timings.stage('match'):
+                matches = gallery.search_batch(descriptors, k=top_k)
+        
+        results = []
+        for i, (frame, probe) in enumerate(zip(frames, probes)):
+            results.append({
+                "frame": i,
+                "camera_id": frame["camera_id"],
+                "faces_detected": probe.get("faces_detected", 0),
+                "authenticated": False,
+            })
+            if "error" in probe:
+                results[-1]["error"] = probe["error"]
+        for i, frame_matches in zip(with_face, matches):
+            if frame_matches and frame_matches[0][1] > 0:
+                user_id, similarity = frame_matches[0]
+                results[i].update({
+                    "best_match": user_id,
+                    "similarity": similarity,
+                    "authenticated": similarity > MATCH_THRESHOLD,
+                })
+                if top_k > 1:
+                    results[i]["candidates"] = [
+                        {"user_id": candidate, "similarity": score} for candidate, score in frame_matches
+                    ]
+        
+        response = {"success": True, "results": results, "mode": "BATCH_RECOGNITION"}
+        
+        fuse = str(data.get('fuse', 'true')).lower() not in ('false', '0', 'no')
+        if fuse:
+            decision = fuse_results(results)
+            response["fused"] = decision
+            logged_in = [decision["user_id"]] if decision["authenticated"] else []
+        else:
+            logged_in = sorted({r["best_match"] for r in results if r["authenticated"]})
+        
+        # Um login por usuário reconhecido no lote (e não um por frame)
+        with timings.stage('persist'):
+            response["login_counts"] = {user_id: users_store.record_login(user_id) for user_id in logged_in}
+        for result in results:
+            MATCHES.inc(endpoint='verify_batch', result=('match' if result["authenticated"] else
+                                                         'no_match' if "best_match" in result else
+                                                         'multiple_faces' if result["faces_detected"] > 1 else 'no_face'))
+        
+        log.debug("✅ Lote processado: %d/%d frame(s) reconhecido(s)", sum(r['authenticated'] for r in results), len(results))
+        
+        return jsonify(response)
+        
+    except Exception as e:
+        log.exception("❌ Erro na verificação em lote: %s", e)
+        return jsonify({"success": False, "error": str(e)})
+
+def analyze_stream_frame(message, session):
+    """Processa um frame do streaming ao vivo (stream_server.py) usando o estado da sessão"""
+    timings = RequestTimings('stream')
+    result = _analyze_stream_frame(message, session, timings)
+    timings.finish('error' if 'error' in result else 'ok')
+    return result
+
+def _analyze_stream_frame(message, session, timings):
+    with timings.stage('decode'):
+        if isinstance(message, str):
+            try:
+                image_data = base64_payload(json.loads(message).get('image') or '')
+            except (ValueError, AttributeError):
+                image_data = None
+        else:
+            image_data = message
+        gray = decode_image(image_data, grayscale=True)
+    if gray is None:
+        return {"error": "Imagem inválida", "authenticated": False}
+    
+    if MOTION_GATE and session.gate is None:
+        session.gate = make_motion_gate()
+    cached = not motion_check(session.gate, gray, 'stream')
+    
+    # Rastreamento: procura primeiro perto da última caixa, depois no frame inteiro
+    faces, tracked = session.faces, False
+    if not cached:
+        with timings.stage('detect'):
+            if session.last_box is not None:
+                faces = registry.detect(gray, 'stream', rois=[session.last_box], roi_fallback=False)
+                tracked = len(faces) == 1
+            if not tracked:
+                has_faces, num_faces, faces = detect_faces_opencv(gray, 'stream')
+        FACES_DETECTED.inc(len(faces), endpoint='stream')
+        session.faces, session.last_match = faces, None
+    
+    if len(faces) != 1:
+        MATCHES.inc(endpoint='stream', result='multiple_faces' if faces else 'no_face')
+        session.reset_track()
+        session.update(None, 0.0)
+        return {
+            "authenticated": False,
+            "face_detected": len(faces) > 0,
+            "multiple_faces": len(faces) > 1,
+            "cached_detection": cached,
+            "confidence": session.confidence,
+        }
+    
+    box = [int(v) for v in faces[0]]
+    session.last_box = box
+    if session.last_match is None:
+        with timings.stage('extract'):
+            features = extract_face_descriptor(gray, box)
+        with timings.stage('match'):
+            best_match, best_similarity, _ = find_best_match(features)
+        session.last_match = (best_match, best_similarity)
+    best_match, best_similarity = session.last_match
+    count_match('stream', best_match, best_similarity)
+    authenticated = session.update(best_match, best_similarity)
+    result = {
+        "authenticated": authenticated,
+        "face_detected": True,
+        "face_box": box,
+        "tracked": tracked,
+        "cached_detection": cached,
+        "user_id": session.candidate if authenticated else None,
+        "similarity": float(best_similarity),
+        "confidence": float(session.confidence),
+    }
+    # Um login por sessão, na primeira confirmação
+    if authenticated and session.authenticated_user != best_match:
+        session.authenticated_user = best_match
+        with timings.stage('persist'):
+            result["login_count"] = users_store.record_login(best_match)
+    return result
+
 @app.route('/users', methods=['GET'])
 def list_users():
     """Endpoint para listar usuários cadastrados"""
-    users = load_users()
+    users = users_store.snapshot()
     return jsonify({
         "total_users": len(users),
         "users": users,
@@ -384,16 +853,24 @@ if __name__ == '__main__':
     print("🚀 INICIANDO API DE RECONHECIMENTO FACIAL - MODO REAL")
     print("="*60)
     print("🔧 Tecnologia: OpenCV Haar Cascades")
-    print("✅ Funcionalidades: Detecção facial real + verificação básica + modo ao vivo")
+    print("✅ Funcionalidades: Detecção facial real + descritores LBP + modo ao vivo")
     print("📝 Endpoints disponíveis:")
     print("   GET  http://localhost:5000/health")
     print("   GET  http://localhost:5000/users")
     print("   POST http://localhost:5000/register-face")
     print("   POST http://localhost:5000/verify-face")
     print("   POST http://localhost:5000/verify-live-face")
+    print("   POST http://localhost:5000/verify-batch")
+    print("   GET  http://localhost:5000/metrics")
+    if STREAM_PORT:
+        print(f"   WS   ws://localhost:{STREAM_PORT} (reconhecimento ao vivo)")
     print("="*60)
     print("⚡ Servidor rodando em: http://localhost:5000")
     print("⏹️  Pressione CTRL+C para parar")
     print("="*60 + "\n")
     
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    if STREAM_PORT:
+        from stream_server import StreamServer
+        StreamServer(analyze_stream_frame, MATCH_THRESHOLD, port=STREAM_PORT).start_in_thread()
+    
+    app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=not STREAM_PORT)
\ No newline at end of file
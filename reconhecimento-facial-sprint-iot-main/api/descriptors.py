@@ -0,0 +1,251 @@
+import hashlib
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# Rosto recortado e redimensionado como no treino LBPH (src/train_lbph.py)
+FACE_SIZE = (200, 200)
+GRID = (8, 8)
+
+# Vizinhos do LBP(8,1) em sentido horário a partir do canto superior esquerdo
+_OFFSETS = [(-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1)]
+
+
+def _uniform_table():
+    """Mapeia os 256 códigos LBP para 58 padrões uniformes + 1 bin para os não uniformes"""
+    table = np.full(256, 58, dtype=np.int64)
+    label = 0
+    for code in range(256):
+        bits = [(code >> i) & 1 for i in range(8)]
+        transitions = sum(bits[i] != bits[(i + 1) % 8] for i in range(8))
+        if transitions <= 2:
+            table[code] = label
+            label += 1
+    return table
+
+
+UNIFORM_TABLE = _uniform_table()
+BINS = 59
+DIM = BINS * GRID[0] * GRID[1]
+
+
+def crop_face(gray, face, size=FACE_SIZE):
+    """Recorta a caixa detectada e redimensiona para o tamanho padrão"""
+    x, y, w, h = [int(v) for v in face]
+    return cv2.resize(gray[y:y + h, x:x + w], size, interpolation=cv2.INTER_AREA)
+
+
+def lbp_histograms(faces, grid=GRID):
+    """Descritores LBP uniformes de um lote de rostos (N x H x W, uint8).
+
+    Cada célula da grade gera um histograma de 59 bins; os histogramas são
+    normalizados, passam por raiz quadrada (Hellinger) e o vetor final tem
+    norma 1, de modo que a distância euclidiana da galeria funciona direto.
+    """
+    faces = np.asarray(faces)
+    if faces.ndim == 2:
+        faces = faces[None]
+    n, h, w = faces.shape
+    center = faces[:, 1:-1, 1:-1]
+    codes = np.zeros(center.shape, dtype=np.uint8)
+    for bit, (dy, dx) in enumerate(_OFFSETS):
+        neighbor = faces[:, 1 + dy:h - 1 + dy, 1 + dx:w - 1 + dx]
+        codes |= (neighbor >= center).astype(np.uint8) << bit
+    mapped = UNIFORM_TABLE[codes]
+
+    gy, gx = grid
+    ch, cw = mapped.shape[1] // gy, mapped.shape[2] // gx
+    cells = mapped[:, :gy * ch, :gx * cw].reshape(n, gy, ch, gx, cw).transpose(0, 1, 3, 2, 4)
+    cells = cells.reshape(n, gy * gx, ch * cw)
+    offsets = (np.arange(n * gy * gx) * BINS).reshape(n, gy * gx, 1)
+    hist = np.bincount((cells + offsets).ravel(), minlength=n * gy * gx * BINS)
+    hist = hist.reshape(n, gy * gx * BINS).astype(np.float32) / float(ch * cw)
+    hist = np.sqrt(hist)
+    hist /= np.maximum(np.linalg.norm(hist, axis=1, keepdims=True), 1e-12)
+    return hist
+
+
+class DescriptorExtractor:
+    """Calcula descritores em lote e guarda os últimos em cache (chave = hash do recorte)"""
+
+    def __init__(self, cache_size=1024):
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def compute(self, crops):
+        """Descritores (N x DIM) para uma lista de recortes já redimensionados"""
+        keys = [hashlib.blake2b(np.ascontiguousarray(c).data, digest_size=16).digest() for c in crops]
+        result = np.empty((len(crops), DIM), dtype=np.float32)
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                cached = self._cache.get(key)
+                if cached is None:
+                    missing.append(i)
+                else:
+                    self._cache.move_to_end(key)
+                    result[i] = cached
+            self.hits += len(crops) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            computed = lbp_histograms(np.stack([crops[i] for i in missing]))
+            result[missing] = computed
+            with self._lock:
+                for i, vector in zip(missing, computed):
+                    self._cache[keys[i]] = vector
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return result
+
+    def compute_one(self, crop):
+        return self.compute([crop])[0]
+
+
+class DescriptorStore:
+    """Arquivo binário (sidecar) com os descritores cadastrados.
+
+    Formato: cabeçalho b'FDSC' + versão (u8) + dimensão (u32), seguido de
+    registros [tamanho do id (u16), id utf-8, op (u8), float32 * dim se op=put].
+    O último registro de cada usuário vale; o arquivo é compactado na
+    carga quando há muitos registros antigos.
+    """
+
+    MAGIC = b'FDSC'
+    VERSION = 1
+    PUT, DELETE = 1, 0
+
+    def __init__(self, path, dim=DIM):
+        self.path = path
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._records = 0
+        self._vectors = {}
+        self._load()
+
+    def _header(self):
+        return self.MAGIC + struct.pack('<BI', self.VERSION, self.dim)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            with open(self.path, 'wb') as f:
+                f.write(self._header())
+            self._offset = len(self._header())
+            return
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        if data[:4] != self.MAGIC:
+            raise ValueError(f"{self.path} não é um arquivo de descritores")
+        version, dim = struct.unpack_from('<BI', data, 4)
+        if dim != self.dim:
+            raise ValueError(f"Descritores com dimensão {dim}, esperado {self.dim}")
+        self._parse(data, 9)
+        self._offset = self._consumed
+        if self._records > 2 * max(len(self._vectors), 1):
+            self.compact()
+
+    def _parse(self, data, pos):
+        """Aplica os registros de data[pos:]; devolve os ids alterados"""
+        changed = set()
+        size = 4 * self.dim
+        while pos + 3 <= len(data):
+            (id_len,) = struct.unpack_from('<H', data, pos)
+            if pos + 3 + id_len > len(data) or \
+                    pos + 3 + id_len + (size if data[pos + 2 + id_len] == self.PUT else 0) > len(data):
+                # registro ainda sendo gravado por outro processo
+                break
+            user_id = data[pos + 2:pos + 2 + id_len].decode('utf-8')
+            op = data[pos + 2 + id_len]
+            pos += 3 + id_len
+            if op == self.PUT:
+                self._vectors[user_id] = np.frombuffer(data, dtype='<f4', count=self.dim, offset=pos).copy()
+                pos += size
+            else:
+                self._vectors.pop(user_id, None)
+            self._records += 1
+            changed.add(user_id)
+        self._consumed = pos
+        return changed
+
+    def refresh(self):
+        """Lê só os registros acrescentados por outros processos desde a última leitura; devolve os ids alterados"""
+        with self._lock:
+            with open(self.path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+                if size < self._offset:
+                    # arquivo compactado por outro processo: releitura completa
+                    f.seek(0)
+                    data = f.read()
+                    previous = set(self._vectors)
+                    self._vectors, self._records = {}, 0
+                    changed = self._parse(data, 9) | previous
+                    self._offset = self._consumed
+                    return changed
+                f.seek(self._offset)
+                data = f.read()
+            changed = self._parse(data, 0)
+            self._offset += self._consumed
+            return changed
+
+    def _record(self, user_id, op, vector=None):
+        encoded = user_id.encode('utf-8')
+        record = struct.pack('<H', len(encoded)) + encoded + bytes([op])
+        if op == self.PUT:
+            record += np.asarray(vector, dtype='<f4').tobytes()
+        return record
+
+    def _append(self, record):
+        with open(self.path, 'ab') as f:
+            f.write(record)
+            f.flush()
+            os.fsync(f.fileno())
+            # só avança se ninguém mais escreveu no meio (senão o refresh relê o trecho)
+            if f.tell() == self._offset + len(record):
+                self._offset = f.tell()
+        self._records += 1
+
+    def __len__(self):
+        return len(self._vectors)
+
+    def __contains__(self, user_id):
+        return user_id in self._vectors
+
+    def get(self, user_id):
+        return self._vectors.get(user_id)
+
+    def items(self):
+        with self._lock:
+            return list(self._vectors.items())
+
+    def put(self, user_id, vector):
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        if vector.shape[0] != self.dim:
+            raise ValueError(f"Descritor com dimensão {vector.shape[0]}, esperado {self.dim}")
+        with self._lock:
+            self._append(self._record(user_id, self.PUT, vector))
+            self._vectors[user_id] = vector
+
+    def delete(self, user_id):
+        with self._lock:
+            if self._vectors.pop(user_id, None) is not None:
+                self._append(self._record(user_id, self.DELETE))
+
+    def compact(self):
+        tmp_path = self.path + '.tmp'
+        with self._lock:
+            with open(tmp_path, 'wb') as f:
+                f.write(self._header())
+                for user_id, vector in self._vectors.items():
+                    f.write(self._record(user_id, self.PUT, vector))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self._records = len(self._vectors)
+            self._offset = os.path.getsize(self.path)
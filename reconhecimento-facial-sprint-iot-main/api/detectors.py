@@ -0,0 +1,117 @@
+import queue
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+# Front end de detecção compartilhado com os scripts de src/ (_paths coloca src/ no sys.path)
+import _paths
+from detection import detect_pyramid, DEFAULT_WORK_MIN_SIZE
+
+# Parâmetros do detectMultiScale (podem ser diferentes por endpoint).
+# work_min_size: o frame é reduzido para que min_size fique com esse tamanho (0 = resolução original)
+DetectionParams = namedtuple('DetectionParams',
+                             ['scale_factor', 'min_neighbors', 'min_size', 'max_size', 'work_min_size'])
+
+DEFAULT_PARAMS = DetectionParams(scale_factor=1.1, min_neighbors=5, min_size=(100, 100),
+                                 max_size=None, work_min_size=DEFAULT_WORK_MIN_SIZE)
+
+DEFAULT_CASCADE = 'frontalface'
+DEFAULT_CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+
+
+class DetectorRegistry:
+    """Carrega cada cascade uma única vez e empresta clones prontos de um pool.
+
+    O XML é lido do disco apenas no registro. Os CascadeClassifier montados a
+    partir dele ficam em uma fila por cascade: cada detecção pega um clone,
+    usa com exclusividade (o detectMultiScale não é seguro para uso
+    concorrente na mesma instância) e o devolve. Um clone novo só é montado
+    quando todos estão emprestados, então o pool cresce até o número máximo
+    de detecções simultâneas e para aí — mesmo no servidor de desenvolvimento
+    do Flask, que cria uma thread por requisição.
+    """
+
+    def __init__(self):
+        self._sources = {}
+        self._params = {}
+        self._pools = {}
+        self._lock = threading.Lock()
+        self.built = 0
+
+    def register(self, name, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            xml = f.read()
+        with self._lock:
+            self._sources[name] = xml
+            self._pools[name] = queue.LifoQueue()
+        # valida o XML já no registro em vez de falhar na primeira requisição
+        with self.lease(name):
+            pass
+
+    @contextmanager
+    def lease(self, name=DEFAULT_CASCADE):
+        """Empresta um clone do cascade (montando um novo se o pool estiver vazio)"""
+        pool = self._pools.get(name)
+        if pool is None:
+            raise KeyError(f"Cascade '{name}' não registrado")
+        try:
+            cascade = pool.get_nowait()
+        except queue.Empty:
+            cascade = self._build(name)
+        try:
+            yield cascade
+        finally:
+            pool.put(cascade)
+
+    def pool_size(self, name=DEFAULT_CASCADE):
+        pool = self._pools.get(name)
+        return pool.qsize() if pool is not None else 0
+
+    def _build(self, name):
+        with self._lock:
+            xml = self._sources.get(name)
+        if xml is None:
+            raise KeyError(f"Cascade '{name}' não registrado")
+        storage = cv2.FileStorage(xml, cv2.FILE_STORAGE_READ | cv2.FILE_STORAGE_MEMORY)
+        cascade = cv2.CascadeClassifier()
+        if not cascade.read(storage.getFirstTopLevelNode()):
+            raise ValueError(f"Cascade '{name}' inválido")
+        storage.release()
+        self.built += 1
+        return cascade
+
+    def set_params(self, endpoint, **overrides):
+        """Define scaleFactor/minNeighbors/minSize de um endpoint sem recriar o detector"""
+        current = self._params.get(endpoint, DEFAULT_PARAMS)
+        self._params[endpoint] = current._replace(**overrides)
+
+    def params_for(self, endpoint):
+        return self._params.get(endpoint, DEFAULT_PARAMS)
+
+    def warm_up(self, shape=(480, 640)):
+        """Roda cada endpoint uma vez num frame vazio (monta um clone no pool e aquece o cascade)"""
+        blank = np.zeros(shape, dtype=np.uint8)
+        for endpoint in list(self._params) or [None]:
+            self.detect(blank, endpoint)
+
+    def detect(self, gray, endpoint=None, name=DEFAULT_CASCADE, rois=None, roi_fallback=True):
+        """Detecta em uma cópia reduzida do frame (e só nas ROIs, se dadas); caixas em resolução original"""
+        params = self.params_for(endpoint)
+        max_face = max(params.max_size) if params.max_size else None
+        with self.lease(name) as cascade:
+            return detect_pyramid(
+                cascade, gray,
+                scale_factor=params.scale_factor,
+                min_neighbors=params.min_neighbors,
+                min_face=min(params.min_size),
+                max_face=max_face,
+                work_min_size=params.work_min_size,
+                rois=rois,
+                roi_fallback=roi_fallback
+            )
+
+
+registry = DetectorRegistry()
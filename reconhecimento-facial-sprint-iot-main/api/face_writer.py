@@ -0,0 +1,107 @@
+import hashlib
+import logging
+import os
+import queue
+import threading
+
+import cv2
+
+log = logging.getLogger(__name__)
+
+
+class FaceImageWriter:
+    """Grava as imagens do cadastro em segundo plano.
+
+    Para cada rosto são gravados o recorte alinhado (o mesmo usado no
+    descritor), uma miniatura e, opcionalmente, o frame com a caixa
+    desenhada. Os nomes vêm do hash do recorte, então dois cadastros no
+    mesmo segundo não colidem e um recorte repetido não é regravado. O nome
+    é devolvido na hora; a escrita em disco fica para a thread de gravação.
+    """
+
+    def __init__(self, directory, thumb_size=(64, 64), debug_overlay=False, quality=90, max_pending=256):
+        self.directory = directory
+        self.thumb_size = thumb_size
+        self.debug_overlay = debug_overlay
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        self.max_pending = max_pending
+        self.written = 0
+        self.failed = 0
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def content_name(crop):
+        return hashlib.blake2b(crop.tobytes(), digest_size=12).hexdigest()
+
+    def _start(self):
+        # a thread é criada no primeiro uso (e de novo num processo filho do fork, onde ela não existe)
+        with self._lock:
+            if self._pid != os.getpid() or self._thread is None:
+                self._queue = queue.Queue(self.max_pending)
+                self._thread = threading.Thread(target=self._run, name='face-writer', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def submit(self, crop, frame=None, box=None):
+        """Agenda a gravação e devolve os nomes dos arquivos {'face_image', 'face_thumbnail'[, 'face_debug']}"""
+        if self._pid != os.getpid():
+            self._start()
+        name = self.content_name(crop)
+        names = {"face_image": f"{name}.jpg", "face_thumbnail": f"{name}_thumb.jpg"}
+        if self.debug_overlay and frame is not None:
+            names["face_debug"] = f"{name}_debug.jpg"
+        # fila cheia: espera (contrapressão) em vez de perder a imagem do cadastro
+        self._queue.put((names, crop, frame if "face_debug" in names else None, box))
+        return names
+
+    def pending(self):
+        return self._queue.qsize() if self._queue is not None and self._pid == os.getpid() else 0
+
+    def _write(self, filename, image):
+        path = os.path.join(self.directory, filename)
+        if os.path.exists(path):
+            return
+        tmp = path + '.tmp.jpg'
+        if not cv2.imwrite(tmp, image, self.params):
+            raise IOError(f"cv2.imwrite falhou para {path}")
+        os.replace(tmp, path)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            names, crop, frame, box = item
+            try:
+                self._write(names["face_image"], crop)
+                self._write(names["face_thumbnail"], cv2.resize(crop, self.thumb_size, interpolation=cv2.INTER_AREA))
+                if frame is not None:
+                    x, y, w, h = [int(v) for v in box]
+                    # cópia colorida (o frame do cadastro vem em cinza) para a caixa sair verde
+                    frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR) if frame.ndim == 2 else frame.copy()
+                    cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 3)
+                    cv2.putText(frame, "ROSTO DETECTADO", (x, y - 10),
+                                cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
+                    self._write(names["face_debug"], frame)
+                self.written += 1
+            except Exception as e:
+                self.failed += 1
+                log.error("❌ Erro ao gravar imagens de %s: %s", names["face_image"], e)
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """Espera a fila esvaziar"""
+        if self._queue is not None and self._pid == os.getpid():
+            self._queue.join()
+
+    def close(self):
+        if self._thread is not None and self._pid == os.getpid():
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,232 @@
+import json
+import logging
+import os
+import struct
+import threading
+
+import numpy as np
+
+from ann_index import create_index, load_index
+
+log = logging.getLogger(__name__)
+
+
+class Gallery:
+    """Vetores de características dos usuários cadastrados em uma matriz contígua.
+
+    Cada linha da matriz corresponde a um user_id (índice em `ids`). Uma face
+    de consulta é comparada com a galeria inteira em uma única operação
+    vetorizada; cadastros e remoções atualizam a matriz incrementalmente.
+    Com `index_kind` 'ivf' a busca passa por um índice aproximado
+    (ver ann_index.py), mantido em sincronia com a matriz. Funções em
+    `listeners` são chamadas (com a galeria) depois de cada alteração, para
+    quem guarda resultados de busca (ex.: cache do ao vivo) se invalidar.
+    """
+
+    def __init__(self, dim=None, capacity=64, index_kind='flat', index_params=None):
+        self.dim = dim
+        self.index_kind = index_kind
+        self.index_params = index_params or {}
+        self.index = None
+        self._capacity = capacity
+        self._matrix = None
+        self._size = 0
+        self.ids = []
+        self._rows = {}
+        self._lock = threading.RLock()
+        self.listeners = []
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, user_id):
+        return user_id in self._rows
+
+    def _changed(self):
+        for listener in self.listeners:
+            try:
+                listener(self)
+            except Exception as e:
+                log.warning("⚠️ Listener da galeria falhou: %s", e)
+
+    def _detach(self):
+        # snapshot em memmap somente leitura: a primeira alteração local faz uma cópia privada
+        if self._matrix is not None and not self._matrix.flags.writeable:
+            self._matrix = np.array(self._matrix[:self._size], dtype=np.float32)
+
+    def _ensure_capacity(self, needed):
+        self._detach()
+        if self._matrix is None:
+            self._matrix = np.empty((max(self._capacity, needed), self.dim), dtype=np.float32)
+        elif needed > self._matrix.shape[0]:
+            grown = np.empty((max(needed, 2 * self._matrix.shape[0]), self.dim), dtype=np.float32)
+            grown[:self._size] = self._matrix[:self._size]
+            self._matrix = grown
+
+    def upsert(self, user_id, features):
+        """Adiciona ou substitui o vetor de um usuário"""
+        vector = np.asarray(features, dtype=np.float32).ravel()
+        with self._lock:
+            if self.dim is None:
+                self.dim = vector.shape[0]
+            elif vector.shape[0] != self.dim:
+                raise ValueError(f"Dimensão {vector.shape[0]} diferente da galeria ({self.dim})")
+            row = self._rows.get(user_id)
+            if row is None:
+                self._ensure_capacity(self._size + 1)
+                row = self._size
+                self._rows[user_id] = row
+                self.ids.append(user_id)
+                self._size += 1
+            self._matrix[row] = vector
+            if self.index_kind != 'flat':
+                if self.index is None:
+                    self.index = create_index(self.index_kind, self.dim, **self.index_params)
+                self.index.add(user_id, vector)
+        self._changed()
+
+    def remove(self, user_id):
+        """Remove um usuário movendo a última linha para a posição liberada"""
+        with self._lock:
+            row = self._rows.pop(user_id, None)
+            if row is None:
+                return False
+            self._detach()
+            last = self._size - 1
+            if row != last:
+                moved_id = self.ids[last]
+                self._matrix[row] = self._matrix[last]
+                self.ids[row] = moved_id
+                self._rows[moved_id] = row
+            self.ids.pop()
+            self._size -= 1
+            if self.index is not None:
+                self.index.remove(user_id)
+        self._changed()
+        return True
+
+    def load(self, vectors, index_path=None):
+        """Monta a galeria a partir de pares (user_id, vetor).
+
+        Se `index_path` tiver um índice salvo do mesmo tipo, com os mesmos
+        usuários e os mesmos vetores, ele é reaproveitado em vez de ser
+        reconstruído (um recadastro que não chegou ao índice salvo, por
+        exemplo se o processo morreu antes do save_index, força a reconstrução).
+        """
+        with self._lock:
+            saved = self._load_saved_index(index_path)
+            kind = self.index_kind
+            if saved is not None:
+                self.index_kind = 'flat'
+            for user_id, vector in vectors:
+                self.upsert(user_id, vector)
+            self.index_kind = kind
+            if saved is not None:
+                if saved.has_vectors(self.ids, self.vectors()):
+                    self.index = saved
+                else:
+                    log.info("🔁 Índice salvo desatualizado (%s); reconstruindo", index_path)
+                    self.rebuild_index()
+        return self
+
+    def _load_saved_index(self, index_path):
+        if self.index_kind == 'flat' or not index_path or not os.path.exists(index_path):
+            return None
+        try:
+            saved = load_index(index_path)
+        except Exception as e:
+            log.warning("⚠️ Índice salvo ignorado (%s): %s", index_path, e)
+            return None
+        if saved.kind != self.index_kind or (self.dim is not None and saved.dim != self.dim):
+            return None
+        return saved
+
+    def rebuild_index(self):
+        with self._lock:
+            self.index = None
+            if self.index_kind == 'flat' or self._size == 0:
+                return
+            self.index = create_index(self.index_kind, self.dim, **self.index_params)
+            for row, user_id in enumerate(self.ids):
+                self.index.add(user_id, self._matrix[row])
+
+    def save_index(self, index_path):
+        """Grava o índice aproximado em disco (.npz) para a próxima inicialização"""
+        with self._lock:
+            if self.index is not None:
+                self.index.save(index_path)
+
+    SNAPSHOT_MAGIC = b'FGAL'
+    SNAPSHOT_VERSION = 1
+    _SNAPSHOT_HEADER = struct.Struct('<4sB3xIQIQ')
+
+    def save_snapshot(self, path):
+        """Grava ids + matriz num arquivo binário (cabeçalho, ids em JSON, float32 alinhado em 64 bytes)"""
+        with self._lock:
+            ids_blob = json.dumps(self.ids).encode('utf-8')
+            offset = (self._SNAPSHOT_HEADER.size + len(ids_blob) + 63) // 64 * 64
+            tmp = path + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(self._SNAPSHOT_HEADER.pack(self.SNAPSHOT_MAGIC, self.SNAPSHOT_VERSION, self.dim or 0,
+                                                   self._size, len(ids_blob), offset))
+                f.write(ids_blob)
+                f.write(b'\0' * (offset - self._SNAPSHOT_HEADER.size - len(ids_blob)))
+                f.write(self.vectors().astype('<f4').tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+
+    def open_snapshot(self, path):
+        """Troca a matriz por um memmap somente leitura do snapshot (páginas compartilhadas entre processos)"""
+        with open(path, 'rb') as f:
+            magic, version, dim, size, ids_len, offset = self._SNAPSHOT_HEADER.unpack(f.read(self._SNAPSHOT_HEADER.size))
+            if magic != self.SNAPSHOT_MAGIC or version != self.SNAPSHOT_VERSION:
+                raise ValueError(f"{path} não é um snapshot de galeria")
+            ids = json.loads(f.read(ids_len).decode('utf-8'))
+        with self._lock:
+            self.dim = dim or self.dim
+            self._matrix = np.memmap(path, dtype='<f4', mode='r', offset=offset, shape=(size, dim)) if size else None
+            self._size = size
+            self.ids = ids
+            self._rows = {user_id: row for row, user_id in enumerate(ids)}
+        self._changed()
+        return self
+
+    def vectors(self):
+        """Visão somente das linhas ocupadas da matriz"""
+        with self._lock:
+            if self._matrix is None:
+                return np.empty((0, self.dim or 0), dtype=np.float32)
+            return self._matrix[:self._size]
+
+    def search(self, probe, k=1):
+        """Retorna os k usuários mais próximos como [(user_id, similaridade)], do melhor para o pior"""
+        return self.search_batch([probe], k)[0]
+
+    def search_batch(self, probes, k=1):
+        """Compara várias faces de consulta com a galeria em uma única multiplicação de matrizes"""
+        probes = np.asarray(probes, dtype=np.float32)
+        probes = probes.reshape(probes.shape[0], -1)
+        with self._lock:
+            if self._size == 0:
+                return [[] for _ in range(probes.shape[0])]
+            if self.index is not None:
+                return [[(user_id, 1.0 - distance) for user_id, distance in self.index.search(probe, k)]
+                        for probe in probes]
+            gallery = self._matrix[:self._size]
+            squared = (np.einsum('ij,ij->i', probes, probes)[:, None]
+                       - 2.0 * probes @ gallery.T
+                       + np.einsum('ij,ij->i', gallery, gallery)[None, :])
+            ids = list(self.ids)
+        similarities = 1.0 - np.sqrt(np.maximum(squared, 0.0))
+        k = min(k, similarities.shape[1])
+        if k < similarities.shape[1]:
+            top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(similarities.shape[1]), similarities.shape)
+        top_scores = np.take_along_axis(similarities, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        return [[(ids[j], float(score)) for j, score in zip(row, scores)]
+                for row, scores in zip(top.tolist(), top_scores.tolist())]
@@ -0,0 +1,61 @@
+import base64
+import binascii
+
+import cv2
+import numpy as np
+
+# Corpos binários aceitos diretamente (sem base64)
+RAW_IMAGE_TYPES = ('image/jpeg', 'image/jpg', 'image/png', 'image/webp', 'application/octet-stream')
+
+# Decodificação JPEG em resolução reduzida (1/2, 1/4, 1/8) direto no decoder
+_REDUCED_GRAY = {1: cv2.IMREAD_GRAYSCALE, 2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+                 4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 8: cv2.IMREAD_REDUCED_GRAYSCALE_8}
+_REDUCED_COLOR = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+                  4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+def decode_image(buffer, grayscale=True, reduce=1):
+    """Decodifica bytes de imagem (JPEG/PNG/...) direto para um array do OpenCV.
+
+    O buffer é envolvido por np.frombuffer (sem cópia) e entregue ao
+    cv2.imdecode; com grayscale=True o resultado já sai em escala de cinza,
+    sem passar por uma imagem colorida intermediária. Cores saem em BGR.
+    """
+    if not buffer:
+        return None
+    flags = (_REDUCED_GRAY if grayscale else _REDUCED_COLOR)[reduce]
+    return cv2.imdecode(np.frombuffer(buffer, dtype=np.uint8), flags)
+
+
+def base64_payload(base64_string):
+    """Bytes da imagem de uma string base64, com ou sem prefixo data URL (b'' se inválida)"""
+    comma = base64_string.find(',', 0, 64)
+    if comma != -1:
+        base64_string = base64_string[comma + 1:]
+    try:
+        return base64.b64decode(base64_string)
+    except (binascii.Error, ValueError):
+        return b''
+
+
+def read_image_request(request, field='image'):
+    """Lê os campos e os bytes da imagem de uma requisição.
+
+    Formatos aceitos:
+      - application/json com a imagem em base64 (contrato do app mobile);
+      - multipart/form-data com o arquivo no campo `field`;
+      - corpo binário image/jpeg (ou png/webp), com os demais campos na query string.
+    Retorna (campos, bytes da imagem); os bytes são None se a imagem não foi enviada.
+    """
+    mimetype = request.mimetype
+    if mimetype in RAW_IMAGE_TYPES:
+        return request.args.to_dict(), request.get_data(cache=False) or None
+    if mimetype == 'multipart/form-data':
+        fields = request.form.to_dict()
+        upload = request.files.get(field)
+        return fields, upload.read() if upload else None
+    data = request.get_json(silent=True) or {}
+    image_data = data.get(field)
+    if not image_data:
+        return data, None
+    return data, base64_payload(image_data)
@@ -0,0 +1,154 @@
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+def face_hash(gray, box, size=32):
+    """Hash perceptual (DCT, 64 bits) do rosto reduzido para `size`x`size` em cinza.
+
+    Frames quase iguais (ruído do sensor, deslocamento de poucos pixels na
+    caixa) dão hashes a poucos bits de distância.
+    """
+    x, y, w, h = [int(v) for v in box]
+    small = cv2.resize(gray[y:y + h, x:x + w], (size, size), interpolation=cv2.INTER_AREA)
+    low = cv2.dct(np.float32(small))[:8, :8].ravel()
+    bits = low > np.median(low[1:])
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+class DescriptorCache:
+    """Descritores dos últimos rostos de uma sessão, pelo hash do rosto (LRU + TTL).
+
+    Só guarda o que não depende da galeria nem do usuário (o descritor LBP):
+    a busca e o registro do login rodam de novo a cada frame.
+    """
+
+    def __init__(self, max_entries=8, ttl=10.0, max_distance=2):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self._entries = OrderedDict()  # hash -> (momento, descritor)
+
+    def get(self, key, now):
+        """Descritor guardado para um hash a até `max_distance` bits de `key` (o mais próximo)"""
+        best, best_distance = None, self.max_distance + 1
+        for stored, (at, descriptor) in list(self._entries.items()):
+            if now - at > self.ttl:
+                del self._entries[stored]
+                continue
+            distance = bin(stored ^ key).count('1')
+            if distance < best_distance:
+                best, best_distance = stored, distance
+        if best is None:
+            return None
+        self._entries.move_to_end(best)
+        return self._entries[best][1]
+
+    def put(self, key, descriptor, now):
+        self._entries[key] = (now, descriptor)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class LiveState:
+    """O que uma sessão do /verify-live-face lembra entre um frame e outro"""
+
+    def __init__(self, gate, descriptors, generation):
+        self.gate = gate
+        self.faces = []        # caixas da última execução do cascade
+        self.features = None   # descritor do rosto (quando havia exatamente um)
+        self.match = None      # (top_k, melhor, similaridade, candidatos) da última busca
+        self.descriptors = descriptors
+        self.generation = generation
+        self.lock = threading.Lock()
+        self.seen = time.monotonic()
+
+
+class LiveSessionStore:
+    """Sessões do /verify-live-face, identificadas pelo `session_id` enviado pelo cliente.
+
+    Guarda no máximo `max_sessions` (a menos usada recentemente sai primeiro)
+    e descarta as que ficaram `ttl` segundos sem frames. `gate_factory` cria
+    o filtro de movimento (MotionGate) de cada sessão nova e `cache_factory`
+    o cache de descritores (DescriptorCache); qualquer um pode devolver None.
+
+    `invalidate()` (ligado às alterações da galeria) descarta o último match
+    de todas as sessões; como é chamado a cada cadastro, só troca a geração
+    e cada sessão se limpa no próximo frame. Os descritores guardados
+    continuam valendo (não dependem da galeria).
+    """
+
+    def __init__(self, gate_factory, cache_factory=None, max_sessions=1024, ttl=300.0):
+        self.gate_factory = gate_factory
+        self.cache_factory = cache_factory or (lambda: None)
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is not None and now - state.seen > self.ttl:
+                state = None
+            if state is None:
+                state = LiveState(self.gate_factory(), self.cache_factory(), self.generation)
+            self._sessions[session_id] = state
+            self._sessions.move_to_end(session_id)
+            state.seen = now
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            # a mais antiga está no início: basta olhar a frente da fila
+            while self._sessions:
+                oldest = next(iter(self._sessions.values()))
+                if now - oldest.seen <= self.ttl:
+                    break
+                self._sessions.popitem(last=False)
+        with state.lock:
+            if state.generation != self.generation:
+                state.match = None
+                state.generation = self.generation
+        return state
+
+    def invalidate(self, *_):
+        with self._lock:
+            self.generation += 1
+
+    def lookup(self, state, key):
+        """Descritor em cache para o rosto `key` da sessão (None = extrair)"""
+        if state.descriptors is None:
+            return None
+        with state.lock:
+            descriptor = state.descriptors.get(key, time.monotonic())
+        if descriptor is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return descriptor
+
+    def remember(self, state, key, descriptor):
+        if state.descriptors is not None:
+            with state.lock:
+                state.descriptors.put(key, descriptor, time.monotonic())
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
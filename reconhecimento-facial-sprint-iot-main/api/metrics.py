@@ -0,0 +1,171 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Limites (s) dos histogramas de latência: de 0,5 ms a 5 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _labels_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = [(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs]
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Contador monotônico; o nome sempre termina em `_total` (nas amostras e no HELP/TYPE).
+
+    Com `fn` o valor é lido na hora da coleta, para contadores mantidos por
+    outro objeto (ex.: acertos de um cache).
+    """
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=(), fn=None):
+        self.name = name if name.endswith('_total') else name + '_total'
+        self.help, self.labelnames, self.fn = help, tuple(labelnames), fn
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, '') for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(n, '') for n in self.labelnames), 0)
+
+    def samples(self):
+        if self.fn is not None:
+            return [(self.name, '', self.fn())]
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, _labels_text(self.labelnames, key), value) for key, value in items]
+
+
+class Gauge:
+    """Valor instantâneo; com `fn` o valor é lido na hora da coleta (ex.: tamanho da galeria)"""
+    kind = 'gauge'
+
+    def __init__(self, name, help, fn=None):
+        self.name, self.help, self.fn = name, help, fn
+        self._value = 0
+
+    def set(self, value):
+        self._value = value
+
+    def samples(self):
+        return [(self.name, '', self.fn() if self.fn is not None else self._value)]
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [contagem por bucket..., soma, contagem]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, '') for n in self.labelnames)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 3)
+            series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        out = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                out.append((self.name + '_bucket', _labels_text(self.labelnames, key, [('le', _number(bound))]),
+                            cumulative))
+            out.append((self.name + '_sum', _labels_text(self.labelnames, key), series[-2]))
+            out.append((self.name + '_count', _labels_text(self.labelnames, key), series[-1]))
+        return out
+
+
+class Registry:
+    """Métricas do processo no formato texto do Prometheus (GET /metrics)"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=(), fn=None):
+        return self.register(Counter(name, help, labelnames, fn))
+
+    def gauge(self, name, help, fn=None):
+        return self.register(Gauge(name, help, fn))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram('face_api_stage_seconds', 'Duração de cada etapa da requisição',
+                                   ['endpoint', 'stage'])
+REQUEST_SECONDS = REGISTRY.histogram('face_api_request_seconds', 'Duração total da requisição', ['endpoint'])
+REQUESTS = REGISTRY.counter('face_api_requests_total', 'Requisições atendidas', ['endpoint', 'status'])
+
+
+class RequestTimings:
+    """Tempo de cada etapa (decode, detect, extract, match, persist) de uma requisição"""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.start = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0)
+
+    def add(self, name, seconds):
+        # uma etapa pode ser medida em vários trechos (ex.: ler o corpo e decodificar): soma aqui
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def finish(self, status):
+        """Registra a requisição; cada etapa entra uma vez no histograma, com o tempo total dela"""
+        total = time.perf_counter() - self.start
+        for name, seconds in self.stages.items():
+            STAGE_SECONDS.observe(seconds, endpoint=self.endpoint, stage=name)
+        REQUEST_SECONDS.observe(total, endpoint=self.endpoint)
+        REQUESTS.inc(endpoint=self.endpoint, status=status)
+        return total
+
+    def server_timing(self):
+        """Valor do cabeçalho Server-Timing (durações em ms, visíveis no DevTools do navegador)"""
+        return ', '.join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items())
@@ -0,0 +1,68 @@
+import sys
+import threading
+import time
+from collections import Counter
+
+# Folhas de pilha que só indicam uma thread parada esperando (lock, select, fila vazia do pool)
+IDLE_FILES = ('threading.py', 'selectors.py', 'queue.py', 'socketserver.py')
+IDLE_FRAMES = {('thread.py', '_worker')}
+
+
+class SamplingProfiler:
+    """Profiler por amostragem: uma thread lê a pilha das demais a cada `interval` segundos.
+
+    Não instrumenta o código (custo zero fora da janela de coleta). O
+    resultado sai no formato "collapsed" (função;função;... contagem), lido
+    por flamegraph.pl e speedscope.
+    """
+
+    def __init__(self, interval=0.005, thread_prefix=None, include_idle=False):
+        self.interval = interval
+        self.thread_prefix = thread_prefix
+        self.include_idle = include_idle
+        self._lock = threading.Lock()
+
+    def _idle(self, frame):
+        filename = frame.f_code.co_filename.rsplit('/', 1)[-1]
+        return filename in IDLE_FILES or (filename, frame.f_code.co_name) in IDLE_FRAMES
+
+    def _stack(self, frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def sample(self, seconds):
+        """Coleta por `seconds` segundos; só uma coleta por vez"""
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("Já existe uma coleta em andamento")
+        try:
+            me = threading.get_ident()
+            names = {t.ident: t.name for t in threading.enumerate()}
+            stacks = Counter()
+            samples = 0
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    name = names.get(ident)
+                    if name is None:
+                        names = {t.ident: t.name for t in threading.enumerate()}
+                        name = names.get(ident, '?')
+                    if self.thread_prefix and not name.startswith(self.thread_prefix):
+                        continue
+                    if not self.include_idle and self._idle(frame):
+                        continue
+                    stacks[self._stack(frame)] += 1
+                samples += 1
+                time.sleep(self.interval)
+            return samples, stacks
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def collapsed(stacks):
+        return '\n'.join(f"{stack} {count}" for stack, count in stacks.most_common()) + '\n'
@@ -0,0 +1,216 @@
+# api/server.py
+"""
+Modo de produção da API: um processo mestre carrega cascade, usuários e galeria uma vez
+e faz fork de N workers, cada um com um pool de threads atendendo o mesmo socket.
+
+- A matriz da galeria vai para um snapshot binário aberto em memmap antes do fork:
+  as páginas ficam compartilhadas entre os workers em vez de uma cópia por processo.
+- Cada thread do worker roda o cascade (clone do pool do DetectorRegistry) e o LBP/busca
+  uma vez antes da primeira requisição (app.warm_up).
+- Um cadastro feito em um worker avisa o mestre (SIGUSR1); o mestre relê só o que foi
+  acrescentado ao descriptors.bin, grava um novo snapshot e reinicia os workers um a um.
+  `kill -HUP <pid do mestre>` força o mesmo recarregamento.
+
+Uso (a partir da pasta api/):
+    python server.py --workers 4 --threads 8
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+parser = argparse.ArgumentParser(description='API de reconhecimento facial com múltiplos processos')
+parser.add_argument('--host', default=os.environ.get('API_HOST', '0.0.0.0'))
+parser.add_argument('--port', type=int, default=int(os.environ.get('API_PORT', '5000')))
+parser.add_argument('--workers', type=int, default=int(os.environ.get('API_WORKERS', str(os.cpu_count() or 2))),
+                    help='Processos worker (padrão: nº de CPUs)')
+parser.add_argument('--threads', type=int, default=int(os.environ.get('API_THREADS', '4')),
+                    help='Threads de requisição por worker')
+parser.add_argument('--cv-threads', type=int, default=int(os.environ.get('CV_THREADS', '1')),
+                    help='Threads internas do OpenCV por worker (1 evita disputa entre processos)')
+parser.add_argument('--snapshot', default=os.environ.get('GALLERY_SNAPSHOT', 'gallery.snapshot'),
+                    help='Snapshot da galeria compartilhado em memmap pelos workers')
+parser.add_argument('--reload-delay', type=float, default=float(os.environ.get('RELOAD_DELAY', '2.0')),
+                    help='Segundos agrupando cadastros antes de recarregar os workers')
+
+
+def make_server_class():
+    from werkzeug.serving import BaseWSGIServer
+
+    class PooledWSGIServer(BaseWSGIServer):
+        """Servidor WSGI do werkzeug com pool fixo de threads (já aquecidas) em vez de uma thread por conexão"""
+        multithread = True
+
+        def __init__(self, host, port, app, threads, initializer=None, fd=None):
+            super().__init__(host, port, app, fd=fd)
+            self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='http',
+                                           initializer=initializer)
+            # uma tarefa por thread segurando a barreira: obriga o pool a criar (e aquecer) todas agora
+            barrier = threading.Barrier(threads)
+            for future in [self.pool.submit(barrier.wait, 60) for _ in range(threads)]:
+                future.result()
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self._handle, request, client_address)
+
+        def _handle(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    return PooledWSGIServer
+
+
+def run_worker(api, sock, args, master_pid):
+    """Corpo do processo filho; nunca retorna"""
+    import cv2
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # CTRL+C chega ao grupo todo; quem encerra é o mestre
+    for sig in (signal.SIGHUP, signal.SIGUSR1, signal.SIGCHLD):
+        signal.signal(sig, signal.SIG_DFL)
+    cv2.setNumThreads(args.cv_threads)
+    api.users_store.after_fork()
+    api.enrollment_listeners.append(lambda user_id: os.kill(master_pid, signal.SIGUSR1))
+
+    server = make_server_class()(args.host, args.port, api.app, args.threads,
+                                 initializer=api.warm_up, fd=sock.fileno())
+    # shutdown() espera o serve_forever terminar: precisa rodar fora do handler do sinal
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown, daemon=True).start())
+    log.info("✅ Worker %d pronto (%d threads)", os.getpid(), args.threads)
+    status = 0
+    try:
+        server.serve_forever()
+        server.pool.shutdown(wait=True)  # termina as requisições em andamento
+        api.face_writer.close()
+        api.users_store.close()
+    except Exception as e:
+        log.exception("❌ Worker %d falhou: %s", os.getpid(), e)
+        status = 1
+    finally:
+        sys.stdout.flush()
+        os._exit(status)
+
+
+class Master:
+    def __init__(self, api, args):
+        self.api = api
+        self.args = args
+        self.workers = set()
+        self.retiring = set()
+        self.running = True
+        self.reload_at = None
+        self.sock = socket.create_server((args.host, args.port), backlog=128, reuse_port=False)
+        self.sock.set_inheritable(True)
+
+    def publish_gallery(self):
+        # grava a galeria atual e passa o mestre a usar o memmap: o fork herda só o mapeamento
+        self.api.gallery.save_snapshot(self.args.snapshot)
+        self.api.gallery.open_snapshot(self.args.snapshot)
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(self.api, self.sock, self.args, os.getppid())
+            finally:
+                os._exit(1)  # erro antes do serve_forever: não deixa o filho voltar ao loop do mestre
+        self.workers.add(pid)
+        return pid
+
+    def request_reload(self, *_):
+        if self.reload_at is None:
+            self.reload_at = time.monotonic() + self.args.reload_delay
+
+    def stop(self, *_):
+        self.running = False
+
+    def reload(self):
+        self.reload_at = None
+        changed = self.api.reload_enrollments()
+        self.publish_gallery()
+        log.info("🔄 Recarregando workers (%d descritor(es) novo(s), %d na galeria)", len(changed), len(self.api.gallery))
+        # um por vez: sempre há workers atendendo durante a troca
+        for pid in list(self.workers):
+            self.spawn()
+            self.retire(pid)
+
+    def retire(self, pid):
+        self.workers.discard(pid)
+        self.retiring.add(pid)
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            self.retiring.discard(pid)
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+            elif pid in self.workers:
+                self.workers.discard(pid)
+                if self.running:
+                    log.warning("⚠️ Worker %d terminou inesperadamente (status %d); iniciando outro", pid, status)
+                    self.spawn()
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGHUP, self.request_reload)
+        signal.signal(signal.SIGUSR1, self.request_reload)
+
+        self.publish_gallery()
+        for _ in range(self.args.workers):
+            self.spawn()
+        log.info("⚡ Mestre %d com %d worker(s) em http://%s:%d", os.getpid(), self.args.workers, self.args.host, self.args.port)
+
+        while self.running:
+            self.reap()
+            if self.reload_at is not None and time.monotonic() >= self.reload_at:
+                self.reload()
+            time.sleep(0.2)
+
+        log.info("⏹️  Encerrando workers...")
+        for pid in list(self.workers):
+            self.retire(pid)
+        deadline = time.monotonic() + 30
+        while self.retiring and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in self.retiring:
+            os.kill(pid, signal.SIGKILL)
+        self.sock.close()
+        self.api.users_store.close()
+
+
+def main():
+    args = parser.parse_args()
+    if not hasattr(os, 'fork'):
+        raise SystemExit("O modo com múltiplos processos precisa de fork (Linux/macOS); no Windows use python app.py")
+    if os.environ.get('USER_STORE', 'sqlite') != 'sqlite':
+        raise SystemExit("Com vários processos use USER_STORE=sqlite (o log de texto não aceita escritas concorrentes)")
+
+    import cv2
+    cv2.setNumThreads(args.cv_threads)
+    import app as api  # carrega cascade, usuários, descritores e galeria uma vez, antes do fork
+
+    Master(api, args).run()
+
+
+if __name__ == '__main__':
+    main()
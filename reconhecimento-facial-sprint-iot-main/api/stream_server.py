@@ -0,0 +1,142 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import websockets
+
+log = logging.getLogger(__name__)
+
+
+class LiveSession:
+    """Estado de uma conexão de reconhecimento ao vivo.
+
+    Guarda a última caixa do rosto (usada como região de busca no próximo
+    frame), a última detecção e match (reaproveitados quando o filtro de
+    movimento diz que a cena não mudou), o candidato atual e a confiança acumulada (média móvel
+    exponencial da similaridade), além dos contadores de frames.
+    """
+
+    def __init__(self, threshold, alpha=0.5, min_frames=2):
+        self.id = uuid.uuid4().hex
+        self.threshold = threshold
+        self.alpha = alpha
+        self.min_frames = min_frames
+        self.last_box = None
+        self.gate = None         # filtro de movimento (criado pelo analisador)
+        self.faces = []          # última detecção, reaproveitada enquanto a cena não muda
+        self.last_match = None   # (usuário, similaridade) da última busca
+        self.candidate = None
+        self.confidence = 0.0
+        self.streak = 0
+        self.authenticated_user = None
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+
+    def update(self, user_id, similarity):
+        """Atualiza a confiança acumulada; troca de candidato reinicia a média"""
+        if user_id is None:
+            self.confidence *= (1 - self.alpha)
+            self.streak = 0
+        elif user_id != self.candidate:
+            self.candidate = user_id
+            self.confidence = similarity
+            self.streak = 1
+        else:
+            self.confidence = self.alpha * similarity + (1 - self.alpha) * self.confidence
+            self.streak += 1
+        return self.candidate is not None and self.streak >= self.min_frames and self.confidence > self.threshold
+
+    def reset_track(self):
+        self.last_box = None
+
+
+class StreamServer:
+    """Servidor WebSocket (asyncio) para reconhecimento contínuo.
+
+    O cliente envia frames como mensagens binárias (JPEG) ou texto JSON
+    {"image": base64}. Cada conexão tem um receptor que guarda só o frame
+    mais recente: se o cliente enviar mais rápido do que o processamento,
+    os frames antigos são descartados e a latência não cresce. O
+    processamento roda em um pool de threads para não bloquear o loop.
+    """
+
+    def __init__(self, analyze, threshold, host='0.0.0.0', port=5001, workers=4):
+        self.analyze = analyze
+        self.threshold = threshold
+        self.host = host
+        self.port = port
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='stream')
+
+    async def _receive(self, websocket, session, slot, ready):
+        try:
+            async for message in websocket:
+                session.received += 1
+                if slot[0] is not None:
+                    session.dropped += 1
+                slot[0] = (session.received, message)
+                ready.set()
+        except websockets.ConnectionClosedError:
+            pass  # queda sem close (rede, app morto): encerra como um fechamento normal
+        finally:
+            # sempre acorda o _handler, senão ele fica esperando em ready.wait() para sempre
+            slot[0] = None
+            ready.set()
+
+    async def _handler(self, websocket):
+        session = LiveSession(self.threshold)
+        slot = [None]
+        ready = asyncio.Event()
+        receiver = asyncio.ensure_future(self._receive(websocket, session, slot, ready))
+        loop = asyncio.get_running_loop()
+        log.info("🔌 Sessão ao vivo iniciada: %s", session.id)
+        try:
+            await websocket.send(json.dumps({"type": "session", "session_id": session.id}))
+            while True:
+                await ready.wait()
+                ready.clear()
+                if slot[0] is None:
+                    if receiver.done():
+                        break
+                    continue
+                frame_number, message = slot[0]
+                slot[0] = None
+                started = time.perf_counter()
+                result = await loop.run_in_executor(self._executor, self.analyze, message, session)
+                session.processed += 1
+                result.update({
+                    "type": "result",
+                    "frame": frame_number,
+                    "dropped": session.dropped,
+                    "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+                })
+                await websocket.send(json.dumps(result))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            receiver.cancel()
+            log.info("🔌 Sessão %s encerrada: %d processado(s), %d descartado(s)",
+                     session.id, session.processed, session.dropped)
+
+    async def _serve(self):
+        async with websockets.serve(self._handler, self.host, self.port, max_size=8 * 1024 * 1024):
+            await asyncio.Future()
+
+    def run(self):
+        asyncio.run(self._serve())
+
+    def start_in_thread(self):
+        thread = threading.Thread(target=self.run, name='stream-server', daemon=True)
+        thread.start()
+        return thread
+
+
+if __name__ == '__main__':
+    import app
+
+    print(f"⚡ Streaming ao vivo em: ws://localhost:{app.STREAM_PORT}")
+    StreamServer(app.analyze_stream_frame, app.MATCH_THRESHOLD, port=app.STREAM_PORT).run()
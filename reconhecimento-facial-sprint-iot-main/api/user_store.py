@@ -0,0 +1,372 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+log = logging.getLogger(__name__)
+
+
+def import_json(path):
+    """Lê o users.json no formato original ({user_id: {...}})"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+class SQLiteBackend:
+    """Persistência em SQLite local: uma linha por usuário com o JSON do registro"""
+
+    def __init__(self, path):
+        self.path = path
+        self._inherited = []
+        self._connect()
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS users (user_id TEXT PRIMARY KEY, data TEXT NOT NULL)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def reopen(self):
+        """Conexão nova no processo filho; a herdada do fork não pode ser usada (nem fechada)"""
+        # mantém a referência: se o objeto fosse coletado, o sqlite3 fecharia o handle do pai aqui
+        self._inherited.append(self._conn)
+        self._connect()
+
+    def load(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT user_id, data FROM users").fetchall()
+        return {user_id: json.loads(data) for user_id, data in rows}
+
+    def write(self, records):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO users (user_id, data) VALUES (?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data",
+                [(user_id, json.dumps(data)) for user_id, data in records.items()]
+            )
+            self._conn.commit()
+
+    def record_logins(self, logins):
+        """Soma os logins {user_id: (quantidade, last_login)} direto no registro gravado.
+
+        Só login_count e last_login mudam (atualização atômica no SQLite), então
+        workers diferentes não perdem incrementos uns dos outros nem desfazem um
+        recadastro feito em outro processo. Devolve {user_id: login_count gravado}.
+        """
+        totals = {}
+        with self._lock:
+            for user_id, (count, last_login) in logins.items():
+                row = self._conn.execute(
+                    "UPDATE users SET data = json_set(data, "
+                    "'$.login_count', COALESCE(json_extract(data, '$.login_count'), 0) + ?, "
+                    "'$.last_login', ?) WHERE user_id = ? "
+                    "RETURNING json_extract(data, '$.login_count')",
+                    (count, last_login, user_id)
+                ).fetchone()
+                if row is not None:
+                    totals[user_id] = row[0]
+            self._conn.commit()
+        return totals
+
+    def delete(self, user_ids):
+        with self._lock:
+            self._conn.executemany("DELETE FROM users WHERE user_id = ?", [(u,) for u in user_ids])
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class AppendLogBackend:
+    """Persistência em log append-only (JSON Lines); o último registro de cada usuário vale.
+
+    Logins entram como entradas 'login' com o incremento, somadas ao registro na leitura.
+    """
+
+    def __init__(self, path, compact_ratio=4):
+        self.path = path
+        self.compact_ratio = compact_ratio
+        self._lock = threading.Lock()
+        self._entries = 0
+
+    def load(self):
+        users = {}
+        self._entries = 0
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    entry = json.loads(line)
+                    self._entries += 1
+                    if entry.get('op') == 'delete':
+                        users.pop(entry['user_id'], None)
+                    elif entry.get('op') == 'login':
+                        user = users.get(entry['user_id'])
+                        if user is not None:
+                            user['login_count'] = user.get('login_count', 0) + entry['count']
+                            user['last_login'] = entry['last_login']
+                    else:
+                        users[entry['user_id']] = entry['data']
+        return users
+
+    def needs_compaction(self, users):
+        """Log muito maior que o estado atual (a compactação é feita pelo UserStore, sob o write lock)"""
+        return bool(users) and self._entries > self.compact_ratio * len(users)
+
+    def write(self, records):
+        lines = [json.dumps({'op': 'put', 'user_id': u, 'data': d}) for u, d in records.items()]
+        self._append(lines)
+
+    def record_logins(self, logins):
+        # o total só é conhecido relendo o log; o store (um processo só) usa o da memória
+        self._append([json.dumps({'op': 'login', 'user_id': u, 'count': count, 'last_login': last_login})
+                      for u, (count, last_login) in logins.items()])
+        return {}
+
+    def delete(self, user_ids):
+        self._append([json.dumps({'op': 'delete', 'user_id': u}) for u in user_ids])
+
+    def _append(self, lines):
+        if not lines:
+            return
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write('\n'.join(lines) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self._entries += len(lines)
+
+    def compact(self, users):
+        tmp_path = self.path + '.tmp'
+        with self._lock:
+            with open(tmp_path, 'w') as f:
+                for user_id, data in users.items():
+                    f.write(json.dumps({'op': 'put', 'user_id': user_id, 'data': data}) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self._entries = len(users)
+
+    def reopen(self):
+        self._lock = threading.Lock()
+
+    def close(self):
+        pass
+
+
+class UserStore:
+    """Usuários em memória protegidos por lock, com persistência write-behind.
+
+    Cadastros são gravados na hora. Logins ficam acumulados como incrementos
+    (quantidade + último horário) e o timer (flush_interval) grava em lote só
+    login_count/last_login, somando ao que está no backend — com vários
+    processos (server.py) nenhum incremento se perde e o registro inteiro de
+    um usuário nunca é regravado a partir de uma cópia velha. Toda gravação
+    no backend (cadastro, remoção, flush, compactação) acontece sob
+    `_write_lock`, junto com a leitura do estado em memória que ela grava:
+    assim um flush nunca grava por cima de um cadastro mais novo.
+
+    Com `write_through` (ligado no after_fork, isto é, nos workers do
+    server.py) cada login é gravado na hora e o login_count devolvido é o
+    total gravado no backend, somando os logins de todos os processos; a
+    cópia em memória de um worker sozinho não é a contagem real.
+    """
+
+    def __init__(self, backend, flush_interval=2.0):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._users = backend.load()
+        self._logins = {}  # user_id -> [logins ainda não gravados, último last_login]
+        self._stop = threading.Event()
+        self._flusher = None
+        self.write_through = False
+
+    def start(self):
+        if self._flusher is None and self.flush_interval:
+            self._start_flusher()
+            atexit.register(self.close)
+        return self
+
+    def _start_flusher(self):
+        self._flusher = threading.Thread(target=self._flush_loop, name='user-store-flush', daemon=True)
+        self._flusher.start()
+
+    def after_fork(self):
+        """Chamado no processo filho: locks, conexão e thread de flush não sobrevivem ao fork"""
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._logins = {}
+        self.backend.reopen()
+        self.write_through = True
+        self._flusher = None
+        if self.flush_interval:
+            self._start_flusher()
+        return self
+
+    def reload(self):
+        """Relê todos os usuários do backend (ex.: cadastros feitos por outros processos)"""
+        users = self.backend.load()
+        with self._lock:
+            # logins deste processo ainda não gravados somam ao que veio do backend
+            for user_id, (count, last_login) in self._logins.items():
+                user = users.get(user_id)
+                if user is not None:
+                    user['login_count'] = user.get('login_count', 0) + count
+                    user['last_login'] = last_login
+            self._users = users
+        return len(users)
+
+    def import_users(self, users):
+        """Importa usuários no formato do users.json (sobrescreve ids repetidos)"""
+        with self._write_lock:
+            with self._lock:
+                self._users.update(copy.deepcopy(users))
+                for user_id in users:
+                    self._logins.pop(user_id, None)
+            self.backend.write(users)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._users)
+
+    def __contains__(self, user_id):
+        with self._lock:
+            return user_id in self._users
+
+    def get(self, user_id):
+        with self._lock:
+            user = self._users.get(user_id)
+            return copy.deepcopy(user) if user is not None else None
+
+    def items(self):
+        """Lista (user_id, dados) sem cópia profunda; os dados devem ser tratados como somente leitura"""
+        with self._lock:
+            return list(self._users.items())
+
+    def snapshot(self):
+        """Cópia de todos os usuários, no mesmo formato do users.json"""
+        with self._lock:
+            return copy.deepcopy(self._users)
+
+    def put(self, user_id, data):
+        with self._write_lock:
+            with self._lock:
+                self._users[user_id] = copy.deepcopy(data)
+                self._logins.pop(user_id, None)  # recadastro zera os contadores
+            self.backend.write({user_id: data})
+
+    def delete(self, user_id):
+        with self._write_lock:
+            with self._lock:
+                removed = self._users.pop(user_id, None)
+                self._logins.pop(user_id, None)
+            if removed is not None:
+                self.backend.delete([user_id])
+        return removed is not None
+
+    def record_login(self, user_id, when=None):
+        """Registra um login e devolve o login_count.
+
+        Em um processo só, atualiza a memória e o incremento é gravado no
+        próximo flush. Com `write_through`, grava já e devolve o total do backend.
+        """
+        if self.write_through:
+            last_login = (when or datetime.now()).isoformat()
+            with self._write_lock:
+                if user_id not in self:
+                    raise KeyError(user_id)
+                total = self.backend.record_logins({user_id: (1, last_login)}).get(user_id)
+            with self._lock:
+                user = self._users.get(user_id)
+                if user is not None and total is not None:
+                    user['login_count'] = total
+                    user['last_login'] = last_login
+            return total
+        with self._lock:
+            user = self._users[user_id]
+            user['last_login'] = (when or datetime.now()).isoformat()
+            user['login_count'] = user.get('login_count', 0) + 1
+            pending = self._logins.setdefault(user_id, [0, None])
+            pending[0] += 1
+            pending[1] = user['last_login']
+            return user['login_count']
+
+    def flush(self):
+        # o write lock cobre a cópia e a gravação: um put() concorrente espera e grava por último
+        with self._write_lock:
+            with self._lock:
+                if not self._logins:
+                    return 0
+                logins, self._logins = self._logins, {}
+            try:
+                self.backend.record_logins(logins)
+            except Exception:
+                # devolve os incrementos para a fila e tenta de novo no próximo ciclo
+                with self._lock:
+                    for user_id, (count, last_login) in logins.items():
+                        if user_id in self._users:
+                            pending = self._logins.setdefault(user_id, [0, last_login])
+                            pending[0] += count
+                raise
+        return len(logins)
+
+    def compact(self):
+        """Reescreve o log sem entradas antigas, se o backend precisar; nada é gravado no meio"""
+        needs = getattr(self.backend, 'needs_compaction', None)
+        with self._write_lock:
+            with self._lock:
+                if needs is None or not needs(self._users):
+                    return False
+                users = copy.deepcopy(self._users)
+            self.backend.compact(users)
+        return True
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                log.error("❌ Erro ao persistir usuários: %s", e)
+
+    def close(self):
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=self.flush_interval + 1)
+            self._flusher = None
+        self.flush()
+        self.backend.close()
+
+
+def open_store(kind, path, legacy_json=None, flush_interval=2.0):
+    """Abre o store ('sqlite' ou 'log') e importa o users.json legado se o store estiver vazio"""
+    if kind == 'sqlite':
+        backend = SQLiteBackend(path)
+    elif kind == 'log':
+        backend = AppendLogBackend(path)
+    else:
+        raise ValueError(f"Tipo de store desconhecido: {kind}")
+    store = UserStore(backend, flush_interval=flush_interval)
+    if legacy_json and len(store) == 0:
+        legacy = import_json(legacy_json)
+        if legacy:
+            store.import_users(legacy)
+            log.info("📥 %d usuário(s) importado(s) de %s", len(legacy), legacy_json)
+    # na abertura, antes de servir requisições (o log de texto é de um processo só; ver server.py)
+    store.compact()
+    return store.start()
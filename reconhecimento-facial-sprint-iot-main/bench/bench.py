@@ -0,0 +1,324 @@
+# bench/bench.py
+"""
+Benchmark das etapas da API e dos scripts de src/: latência p50/p99, vazão e pico de RSS por etapa.
+
+Etapas (--stages):
+  decode      base64 -> bytes -> imagem em cinza (image_io, caminho do /verify-face)
+  detect      detect_faces_opencv em imagens gravadas e frames sintéticos
+  descriptor  descritor LBP de um rosto 200x200
+  match       busca na galeria com N usuários gerados (--gallerySizes)
+  lbph        recognizer.predict do OpenCV e LBPHEngine (NumPy) num modelo sintético
+  train       decodificação do dataset (train_lbph.py) e recognizer.train, em imagens/s
+  api         POST /verify-face pelo test client do Flask, com N requisições simultâneas
+
+Uso (a partir da pasta do projeto):
+    python bench/bench.py --output bench/results.json
+    python bench/bench.py --stages match api --baseline bench/results.json
+"""
+import argparse
+import atexit
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from fixtures import (ROOT, recorded_images, to_base64, face_crops, synthetic_frames, synthetic_faces,
+                      write_dataset, gallery_vectors)
+
+sys.path.insert(0, str(ROOT / 'src'))
+sys.path.insert(0, str(ROOT / 'api'))
+
+STAGES = ('decode', 'detect', 'descriptor', 'match', 'lbph', 'train', 'api')
+
+parser = argparse.ArgumentParser(description='Benchmark de detecção, comparação, API e treino')
+parser.add_argument('--stages', nargs='+', default=list(STAGES), choices=STAGES)
+parser.add_argument('--images', nargs='*', default=[], help='Pastas extras com imagens gravadas (ex.: data/raw)')
+parser.add_argument('--frames', type=int, default=50, help='Frames sintéticos na etapa de detecção')
+parser.add_argument('--repeat', type=int, default=200, help='Medições por etapa (decode, descriptor, match, lbph)')
+parser.add_argument('--gallerySizes', type=int, nargs='+', default=[10, 1000, 10000, 100000],
+                    help='Usuários nas galerias geradas (1000000 x 3776 float32 ocupa ~15 GB; use --galleryDim menor)')
+parser.add_argument('--galleryDim', type=int, default=None, help='Dimensão dos vetores da galeria (padrão: a do descritor LBP)')
+parser.add_argument('--people', type=int, default=20, help='Pessoas no modelo LBPH/dataset sintético')
+parser.add_argument('--perPerson', type=int, default=30, help='Imagens por pessoa no modelo LBPH/dataset sintético')
+parser.add_argument('--workers', type=int, default=None, help='Processos da decodificação do dataset (como no train_lbph.py)')
+parser.add_argument('--apiUsers', type=int, default=1000, help='Usuários gerados na galeria da API')
+parser.add_argument('--requests', type=int, default=200, help='Requisições por nível de concorrência')
+parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--output', default='bench/results.json', help="Resultados em JSON ('' não grava)")
+parser.add_argument('--baseline', default=None, help='Resultados anteriores para comparação')
+parser.add_argument('--tolerance', type=float, default=0.2,
+                    help='Piora relativa tolerada no p50/vazão antes de acusar regressão (0.2 = 20%%)')
+
+
+# --- medição ---
+
+def reset_peak_rss():
+    """Zera o pico de RSS do processo (Linux: VmHWM via /proc/self/clear_refs)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # fora do Linux não dá para zerar: é o pico do processo inteiro
+        return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+    except ImportError:
+        return None
+
+
+def summarize(times, wall, units):
+    ms = np.array(times) * 1000.0
+    return {
+        'count': len(times),
+        'p50_ms': round(float(np.percentile(ms, 50)), 4),
+        'p99_ms': round(float(np.percentile(ms, 99)), 4),
+        'mean_ms': round(float(ms.mean()), 4),
+        'max_ms': round(float(ms.max()), 4),
+        'throughput_per_s': round(units / max(wall, 1e-9), 2),
+    }
+
+
+def measure(fn, inputs, units_per_call=1, warmup=3):
+    """Chama fn(x) para cada entrada (em ordem, repetindo se preciso) e mede cada chamada"""
+    for x in inputs[:warmup]:
+        fn(x)
+    reset_peak_rss()
+    times = []
+    start = time.perf_counter()
+    for x in inputs:
+        t0 = time.perf_counter()
+        fn(x)
+        times.append(time.perf_counter() - t0)
+    result = summarize(times, time.perf_counter() - start, units_per_call * len(inputs))
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+
+def measure_concurrent(fn, inputs, concurrency, warmup=3):
+    """Mesmas medições com `concurrency` threads consumindo as entradas"""
+    for x in inputs[:warmup]:
+        fn(x)
+    reset_peak_rss()
+    lock, times = threading.Lock(), []
+
+    def timed(x):
+        t0 = time.perf_counter()
+        fn(x)
+        elapsed = time.perf_counter() - t0
+        with lock:
+            times.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, inputs))
+    result = summarize(times, time.perf_counter() - start, len(inputs))
+    result['peak_rss_mb'] = peak_rss_mb()
+    result['concurrency'] = concurrency
+    return result
+
+
+def cycle(items, n):
+    return [items[i % len(items)] for i in range(n)]
+
+
+# --- etapas ---
+
+class Bench:
+    def __init__(self, args):
+        self.args = args
+        self.results = {}
+        self.images = recorded_images(args.images)
+        if not self.images:
+            raise SystemExit("Nenhuma imagem gravada encontrada (api/faces ou --images)")
+        # a API usa caminhos relativos (users.db, descriptors.bin, faces/): roda tudo num diretório temporário
+        self.workdir = tempfile.mkdtemp(prefix='facebench_')
+        os.chdir(self.workdir)
+        # registrado antes de importar a API: roda depois dos atexit dela (ordem inversa)
+        atexit.register(shutil.rmtree, self.workdir, ignore_errors=True)
+        self._app = None
+
+    @property
+    def app(self):
+        if self._app is None:
+            os.environ.setdefault('STREAM_PORT', '0')
+            os.environ['LBPH_MODEL'] = ''
+            import app
+            self._app = app
+        return self._app
+
+    def record(self, name, result):
+        self.results[name] = result
+        print(f"[BENCH] {name:28s} p50={result['p50_ms']:.3f}ms p99={result['p99_ms']:.3f}ms "
+              f"vazão={result['throughput_per_s']}/s rss={result['peak_rss_mb'] or 0:.0f}MB")
+
+    def decode(self):
+        from image_io import decode_image, base64_payload
+        payloads = cycle([to_base64(data) for data in self.images], self.args.repeat)
+        self.record('decode_base64_jpeg', measure(lambda s: decode_image(base64_payload(s)), payloads))
+
+    def detect(self):
+        from image_io import decode_image
+        recorded = [decode_image(data) for data in self.images]
+        frames = synthetic_frames(self.args.frames, face_crops(self.images), seed=self.args.seed)
+        self.record('detect_recorded', measure(
+            lambda gray: self.app.detect_faces_opencv(gray, 'verify_face'), cycle(recorded, self.args.frames)))
+        self.record('detect_synthetic', measure(
+            lambda gray: self.app.detect_faces_opencv(gray, 'verify_face'), frames))
+
+    def descriptor(self):
+        from descriptors import lbp_histograms
+        faces, _ = synthetic_faces(4, 8, seed=self.args.seed)
+        self.record('lbp_descriptor', measure(lbp_histograms, cycle(faces, self.args.repeat)))
+
+    def match(self):
+        from gallery import Gallery
+        from descriptors import DIM
+        dim = self.args.galleryDim or DIM
+        probes = [v for _, v in gallery_vectors(min(self.args.repeat, 256), dim, seed=self.args.seed + 1)]
+        for size in self.args.gallerySizes:
+            reset_peak_rss()
+            start = time.perf_counter()
+            gallery = Gallery(dim=dim, capacity=size).load(gallery_vectors(size, dim, seed=self.args.seed))
+            build_s = time.perf_counter() - start
+            result = measure(gallery.search, cycle(probes, self.args.repeat))
+            result['build_s'] = round(build_s, 3)
+            result['peak_rss_mb'] = peak_rss_mb()  # inclui a matriz da galeria
+            self.record(f'gallery_search_{size}', result)
+            del gallery
+
+    def lbph(self):
+        from lbph_model import create_recognizer
+        from lbph_engine import LBPHEngine
+        faces, labels = synthetic_faces(self.args.people, self.args.perPerson, seed=self.args.seed)
+        params = {'radius': 1, 'neighbors': 8, 'grid_x': 8, 'grid_y': 8}
+        recognizer = create_recognizer(params)
+        recognizer.train(faces, labels)
+        probes, _ = synthetic_faces(self.args.people, 2, seed=self.args.seed + 1)
+        probes = cycle(probes, self.args.repeat)
+        self.record('lbph_predict_opencv', measure(recognizer.predict, probes))
+        histograms = np.vstack([h.reshape(1, -1) for h in recognizer.getHistograms()])
+        engine = LBPHEngine(histograms, recognizer.getLabels(), **params)
+        self.record('lbph_predict_numpy', measure(engine.predict, probes))
+
+    def train(self):
+        from dataset import decode_faces
+        from lbph_model import create_recognizer
+        faces, labels = synthetic_faces(self.args.people, self.args.perPerson, seed=self.args.seed)
+        paths = write_dataset('raw', faces, labels)
+        self.record('train_load', measure(
+            lambda _: list(decode_faces(paths, workers=self.args.workers)), [None] * 3, len(paths), warmup=1))
+        params = {'radius': 1, 'neighbors': 8, 'grid_x': 8, 'grid_y': 8}
+        self.record('train_fit', measure(
+            lambda _: create_recognizer(params).train(faces, labels), [None] * 3, len(faces), warmup=1))
+
+    def api(self):
+        app = self.app
+        client = app.app.test_client()
+        # rostos gravados cadastrados pelo próprio endpoint + usuários gerados na galeria
+        for i, data in enumerate(self.images):
+            client.post('/register-face', json={'user_id': f'gravado_{i}', 'image': to_base64(data)})
+        app.gallery.load(gallery_vectors(self.args.apiUsers, app.gallery.dim or app.DESCRIPTOR_DIM, seed=self.args.seed))
+        payloads = cycle([to_base64(data) for data in self.images], self.args.requests)
+        local = threading.local()
+
+        def verify(payload):
+            # um test client por thread
+            if not hasattr(local, 'client'):
+                local.client = app.app.test_client()
+            response = local.client.post('/verify-face', json={'image': payload})
+            if response.status_code != 200:
+                raise RuntimeError(f"/verify-face respondeu {response.status_code}")
+
+        for concurrency in self.args.concurrency:
+            self.record(f'api_verify_face_c{concurrency}', measure_concurrent(verify, payloads, concurrency))
+
+    def run(self):
+        for stage in self.args.stages:
+            getattr(self, stage)()
+        return self.results
+
+
+# --- resultados ---
+
+def metadata(args):
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'cpu_count': os.cpu_count(),
+        'args': vars(args),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Imprime a variação de cada etapa em relação ao baseline e retorna as que pioraram além da tolerância"""
+    regressions = []
+    print(f"\n{'etapa':28s} {'p50 base':>10s} {'p50 atual':>10s} {'Δp50':>8s} {'p99 base':>10s} {'p99 atual':>10s} {'Δvazão':>8s}")
+    for name, now in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:28s} (sem baseline)")
+            continue
+        d_p50 = now['p50_ms'] / max(base['p50_ms'], 1e-9) - 1.0
+        d_tp = now['throughput_per_s'] / max(base['throughput_per_s'], 1e-9) - 1.0
+        flag = ''
+        if d_p50 > tolerance or d_tp < -tolerance:
+            regressions.append(name)
+            flag = '  ⚠️ regressão'
+        print(f"{name:28s} {base['p50_ms']:10.3f} {now['p50_ms']:10.3f} {d_p50:+8.1%} "
+              f"{base['p99_ms']:10.3f} {now['p99_ms']:10.3f} {d_tp:+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    args = parser.parse_args()
+    args.images = [os.path.abspath(d) for d in args.images]
+    args.output = os.path.abspath(args.output) if args.output else ''
+    baseline = None
+    if args.baseline:
+        # lido antes de gravar: --output pode ser o próprio arquivo do baseline
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+    results = Bench(args).run()
+    report = {'meta': metadata(args), 'results': results}
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"[OK] Resultados salvos em {args.output}")
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"[ERRO] {len(regressions)} etapa(s) acima da tolerância: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    # guarda necessária: a decodificação do dataset usa um pool de processos (spawn)
+    main()
@@ -0,0 +1,100 @@
+# bench/fixtures.py
+"""Fixtures do benchmark: imagens gravadas (api/faces e pastas extras), frames e rostos sintéticos e galerias geradas"""
+import base64
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+RECORDED_DIRS = [ROOT / 'api' / 'faces']
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+FACE_SIZE = (200, 200)
+
+
+def recorded_images(extra_dirs=(), limit=None):
+    """Bytes das imagens gravadas: api/faces e as pastas passadas (busca recursiva)"""
+    images = []
+    for directory in list(RECORDED_DIRS) + [Path(d) for d in extra_dirs]:
+        if not directory.exists():
+            continue
+        for path in sorted(directory.rglob('*')):
+            if path.suffix.lower() in IMAGE_EXTENSIONS:
+                images.append(path.read_bytes())
+                if limit is not None and len(images) >= limit:
+                    return images
+    return images
+
+
+def to_base64(image_bytes):
+    """Mesmo formato enviado pelo app (data URL)"""
+    return 'data:image/jpeg;base64,' + base64.b64encode(image_bytes).decode('ascii')
+
+
+def face_crops(images, cascade_path=None):
+    """Rostos recortados das imagens gravadas (cascade em resolução original), para colar nos frames sintéticos"""
+    cascade = cv2.CascadeClassifier(cascade_path or cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    crops = []
+    for data in images:
+        gray = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            continue
+        for (x, y, w, h) in cascade.detectMultiScale(gray, 1.1, 5, minSize=(80, 80)):
+            # margem para o cascade reconhecer o rosto colado no frame
+            m = w // 4
+            crops.append(gray[max(0, y - m):y + h + m, max(0, x - m):x + w + m].copy())
+    return crops
+
+
+def synthetic_frames(count, crops, size=(480, 640), faces_per_frame=1, face_px=(120, 220), seed=0):
+    """Frames em cinza: fundo de ruído suavizado com rostos gravados colados em posições e escalas aleatórias"""
+    rng = np.random.default_rng(seed)
+    h, w = size
+    frames = []
+    for _ in range(count):
+        frame = cv2.GaussianBlur(rng.integers(0, 256, size=size, dtype=np.uint8), (0, 0), 4)
+        for _ in range(faces_per_frame if crops else 0):
+            crop = crops[rng.integers(len(crops))]
+            side = int(rng.integers(face_px[0], face_px[1] + 1))
+            face = cv2.resize(crop, (side, side))
+            y, x = rng.integers(0, h - side), rng.integers(0, w - side)
+            frame[y:y + side, x:x + side] = face
+        frames.append(frame)
+    return frames
+
+
+def synthetic_faces(people, per_person, seed=0):
+    """Rostos 200x200 para treino/predict do LBPH: uma textura base por pessoa + deslocamento, brilho e ruído por amostra"""
+    rng = np.random.default_rng(seed)
+    faces, labels = [], []
+    for label in range(people):
+        base = cv2.GaussianBlur(rng.integers(0, 256, size=(220, 220), dtype=np.uint8), (0, 0), 3)
+        for _ in range(per_person):
+            dy, dx = rng.integers(0, 21, size=2)
+            face = base[dy:dy + FACE_SIZE[1], dx:dx + FACE_SIZE[0]].astype(np.int16)
+            face += rng.integers(-20, 21) + rng.integers(-6, 7, size=face.shape, dtype=np.int16)
+            faces.append(np.clip(face, 0, 255).astype(np.uint8))
+            labels.append(label)
+    return faces, np.array(labels, dtype=np.int32)
+
+
+def write_dataset(directory, faces, labels):
+    """Grava as faces como data/raw/<pessoa>/<n>.jpg, o layout lido pelo train_lbph.py"""
+    paths = []
+    for i, (face, label) in enumerate(zip(faces, labels)):
+        person = Path(directory) / f"pessoa_{label:04d}"
+        person.mkdir(parents=True, exist_ok=True)
+        path = person / f"{i:06d}.jpg"
+        cv2.imwrite(str(path), face)
+        paths.append(str(path))
+    return paths
+
+
+def gallery_vectors(size, dim, seed=0, chunk=65536):
+    """Gera (user_id, vetor) de `size` usuários em blocos: vetores não negativos de norma 1, como os descritores LBP"""
+    rng = np.random.default_rng(seed)
+    for start in range(0, size, chunk):
+        block = rng.random((min(chunk, size - start), dim), dtype=np.float32)
+        block /= np.linalg.norm(block, axis=1, keepdims=True)
+        for i, vector in enumerate(block):
+            yield f"bench_user_{start + i}", vector
@@ -0,0 +1,54 @@
+# src/capture_quality.py
+from collections import Counter
+
+import cv2
+import numpy as np
+
+
+def sharpness(face):
+    """Variância do Laplaciano: cai muito em rostos borrados (movimento, foco)"""
+    return float(cv2.Laplacian(face, cv2.CV_64F).var())
+
+
+class CaptureFilter:
+    """Escolhe quais rostos da coleta valem ser gravados.
+
+    Um rosto (recorte em cinza, já no tamanho do treino) é aceito se for
+    nítido (`min_sharpness`) e diferente o bastante de todos os já
+    guardados: a novidade é a menor diferença média, em fração de 255, entre
+    a miniatura `thumb`x`thumb` dele e as miniaturas dos aceitos
+    (`min_novelty`). Rejeições ficam contadas em `rejected` por motivo.
+    """
+
+    def __init__(self, min_sharpness=60.0, min_novelty=0.04, thumb=32):
+        self.min_sharpness = min_sharpness
+        self.min_novelty = min_novelty
+        self.thumb = thumb
+        self.rejected = Counter()
+        self._thumbs = np.zeros((0, thumb * thumb), dtype=np.float32)
+
+    def _thumbnail(self, face):
+        small = cv2.resize(face, (self.thumb, self.thumb), interpolation=cv2.INTER_AREA)
+        return small.astype(np.float32).ravel() / 255.0
+
+    def remember(self, face):
+        """Registra um rosto já gravado (ex.: de uma coleta anterior) para o cálculo de novidade"""
+        self._thumbs = np.vstack([self._thumbs, self._thumbnail(face)[None]])
+
+    def novelty(self, face):
+        if len(self._thumbs) == 0:
+            return 1.0
+        return float(np.abs(self._thumbs - self._thumbnail(face)).mean(axis=1).min())
+
+    def check(self, face):
+        """(aceito, motivo, nitidez, novidade); um rosto aceito passa a contar para a novidade dos próximos"""
+        sharp = sharpness(face)
+        if sharp < self.min_sharpness:
+            self.rejected['borrado'] += 1
+            return False, 'borrado', sharp, None
+        novel = self.novelty(face)
+        if novel < self.min_novelty:
+            self.rejected['repetido'] += 1
+            return False, 'repetido', sharp, novel
+        self.remember(face)
+        return True, None, sharp, novel
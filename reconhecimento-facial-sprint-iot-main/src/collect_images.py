@@ -4,12 +4,24 @@ import os
 import argparse
 from pathlib import Path
 
+from capture_quality import CaptureFilter
+from dataset import FACE_SIZE, load_face, save_face
+from detection import detect_pyramid
+from pipeline import Pipeline, Closed
+
 parser = argparse.ArgumentParser()
 parser.add_argument('--name', required=True, help='Nome da pessoa (pasta será criada em data/raw/<name>)')
 parser.add_argument('--count', type=int, default=50, help='Número de imagens a capturar')
 parser.add_argument('--skip', type=int, default=5, help='Capturar 1 a cada <skip> frames')
 parser.add_argument('--width', type=int, default=640)
 parser.add_argument('--height', type=int, default=480)
+parser.add_argument('--queueSize', type=int, default=2, help='Tamanho da fila captura->tela (descarta o frame mais antigo quando cheia)')
+# coleta só de rostos úteis
+parser.add_argument('--faces', action='store_true', help='Grava só o rosto (200x200 em cinza, .npy pronto para o treino) quando ele for nítido e novo')
+parser.add_argument('--cascade', default='haarcascade_frontalface_default.xml')
+parser.add_argument('--minSize', type=int, default=60, help='Com --faces: menor rosto aceito (px)')
+parser.add_argument('--minSharpness', type=float, default=60.0, help='Com --faces: variância mínima do Laplaciano do rosto (descarta borrados)')
+parser.add_argument('--minNovelty', type=float, default=0.04, help='Com --faces: diferença média mínima (0-1) para os rostos já salvos (descarta repetidos)')
 args = parser.parse_args()
 
 save_dir = Path('data/raw') / args.name
@@ -19,13 +31,98 @@ cap = cv2.VideoCapture(0)
 cap.set(cv2.CAP_PROP_FRAME_WIDTH, args.width)
 cap.set(cv2.CAP_PROP_FRAME_HEIGHT, args.height)
 
-print(f"[INFO] Pressione 'q' para sair. Salvando em: {save_dir}")
+def capture():
+    ret, frame = cap.read()
+    return frame if ret else None
+
+def write(job):
+    img_path, image = job
+    if img_path.suffix == '.npy':
+        save_face(img_path, image)
+    else:
+        cv2.imwrite(str(img_path), image)
+
+quality = None
+first_index = 0
+if args.faces:
+    cascade = cv2.CascadeClassifier(args.cascade)
+    if cascade.empty():
+        raise SystemExit(f"Cascade não encontrado: {args.cascade}")
+    quality = CaptureFilter(args.minSharpness, args.minNovelty)
+    # rostos de coletas anteriores contam para a novidade e não são sobrescritos:
+    # a numeração continua depois do maior índice existente (pode haver buracos)
+    existing = sorted(save_dir.glob(f"{args.name}_*.npy"))
+    for path in existing:
+        face = load_face(str(path))
+        if face is not None:
+            quality.remember(face)
+        suffix = path.stem[len(args.name) + 1:]
+        if suffix.isdigit():
+            first_index = max(first_index, int(suffix) + 1)
+    print(f"[INFO] Modo --faces: {len(existing)} rosto(s) já salvos em {save_dir}")
+
+def select_face(frame):
+    """Rosto 200x200 do frame se ele passar no filtro de qualidade; senão (None, motivo)"""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    boxes = detect_pyramid(cascade, gray, min_face=args.minSize)
+    if len(boxes) != 1:
+        reason = 'sem rosto' if not boxes else 'vários rostos'
+        quality.rejected[reason] += 1
+        return None, reason
+    x, y, w, h = boxes[0]
+    face = cv2.resize(gray[y:y + h, x:x + w], FACE_SIZE, interpolation=cv2.INTER_AREA)
+    ok, reason, sharp, novel = quality.check(face)
+    return (face, f"nitidez={sharp:.0f} novidade={novel:.3f}") if ok else (None, reason)
+
 count = 0
 frame_idx = 0
 
+def select(job):
+    """Estágio de seleção (--faces): detecção e filtro de qualidade fora da thread da tela"""
+    global count
+    frame, label = job
+    if count >= args.count:
+        return None
+    face, detail = select_face(frame)
+    if face is None:
+        if label != "Salvo":
+            print(f"Descartado ({detail})")
+        return None
+    img_path = save_dir / f"{args.name}_{first_index + count:03d}.npy"
+    print(f"{label}: {img_path} ({detail})")
+    count += 1
+    return img_path, face
+
+# captura, seleção (--faces) e gravação em threads próprias: nem o cascade nem um imwrite
+# lento seguram a câmera ou a tela. A fila de gravação comporta todas as imagens pedidas,
+# então nenhuma é descartada; a de seleção fica com os candidatos mais recentes.
+pipe = Pipeline(queue_size=args.queueSize)
+capture_q = pipe.queue("captura")
+write_q = pipe.queue("gravacao", maxsize=args.count)
+pipe.source("captura", capture, capture_q)
+if quality is not None:
+    select_q = pipe.queue("selecao")
+    pipe.stage("selecao", select, select_q, write_q)
+pipe.stage("gravacao", write, write_q)
+pipe.start()
+
+print(f"[INFO] Pressione 'q' para sair. Salvando em: {save_dir}")
+
+def save(frame, label="Salvo"):
+    global count
+    if quality is not None:
+        # a contagem sobe no estágio de seleção, se o rosto for aceito
+        select_q.put((frame, label))
+        return
+    img_path = save_dir / f"{args.name}_{count:03d}.jpg"
+    write_q.put((img_path, frame))
+    print(f"{label}: {img_path}")
+    count += 1
+
 while True:
-    ret, frame = cap.read()
-    if not ret:
+    try:
+        frame = capture_q.get()
+    except Closed:
         break
     frame_idx += 1
     display = frame.copy()
@@ -37,19 +134,19 @@ while True:
         break
     # auto save every `skip` frames (if count not reached)
     if frame_idx % args.skip == 0 and count < args.count:
-        img_path = save_dir / f"{args.name}_{count:03d}.jpg"
-        cv2.imwrite(str(img_path), frame)
-        print(f"Salvo: {img_path}")
-        count += 1
+        save(frame)
     # manual save
     if key == ord('s') and count < args.count:
-        img_path = save_dir / f"{args.name}_{count:03d}.jpg"
-        cv2.imwrite(str(img_path), frame)
-        print(f"Salvo manual: {img_path}")
-        count += 1
+        save(frame, "Salvo manual")
     if count >= args.count:
         print("[INFO] Captura concluída.")
         break
 
+# espera as filas esvaziarem antes de sair (no --faces a seleção fecha a gravação ao terminar)
+(select_q if quality is not None else write_q).close()
+pipe.stop(timeout=30.0)
 cap.release()
 cv2.destroyAllWindows()
+pipe.report()
+if quality is not None:
+    print("[INFO] Descartados: " + (" ".join(f"{k}={v}" for k, v in sorted(quality.rejected.items())) or "nenhum"))
@@ -0,0 +1,138 @@
+# src/dataset.py
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+FACE_SIZE = (200, 200)
+# .jpg = frame/foto (decodificado e redimensionado no treino); .npy = rosto 200x200 em cinza já recortado
+DATASET_PATTERNS = ("*.jpg", "*.npy")
+
+
+def scan_dataset(data_dir, patterns=DATASET_PATTERNS):
+    """Lista (pessoa, caminho, mtime_ns, tamanho) das imagens em data_dir/<pessoa>/"""
+    entries = []
+    for person_dir in sorted(Path(data_dir).iterdir()):
+        if not person_dir.is_dir(): continue
+        for img_path in sorted(p for pattern in patterns for p in person_dir.glob(pattern)):
+            st = img_path.stat()
+            entries.append((person_dir.name, str(img_path), st.st_mtime_ns, st.st_size))
+    return entries
+
+
+def _init_worker():
+    # o paralelismo vem dos processos; um thread do OpenCV por processo
+    cv2.setNumThreads(1)
+
+
+def load_face(path, face_size=FACE_SIZE):
+    if str(path).endswith('.npy'):
+        # recorte salvo pelo collect_images.py --faces: sem decode e, no tamanho certo, sem resize
+        try:
+            face = np.load(path)
+        except (OSError, ValueError):
+            return None
+        if face.dtype != np.uint8 or face.ndim != 2:
+            return None
+        return face if face.shape == face_size[::-1] else cv2.resize(face, face_size)
+    img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        return None
+    return cv2.resize(img, face_size)
+
+
+def save_face(path, face):
+    """Grava um rosto pré-processado (uint8, cinza) em .npy; o arquivo só aparece completo"""
+    path = str(path)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.save(f, np.ascontiguousarray(face, dtype=np.uint8))
+    os.replace(tmp, path)
+
+
+def decode_faces(paths, workers=None, chunksize=32):
+    """Decodifica e redimensiona em um pool de processos; gera as faces na ordem de `paths` (None se falhar)"""
+    if workers == 1 or len(paths) < 2 * chunksize:
+        for path in paths:
+            yield load_face(path)
+        return
+    with ProcessPoolExecutor(workers, initializer=_init_worker) as pool:
+        yield from pool.map(load_face, paths, chunksize=chunksize)
+
+
+class FaceCache:
+    """Faces pré-processadas em um memmap uint8 (N×200×200) + índice JSON caminho -> (mtime, tamanho, linha).
+
+    Só imagens novas ou alteradas são decodificadas; linhas de imagens
+    removidas/alteradas são reaproveitadas pelas próximas.
+    """
+
+    def __init__(self, cache_dir, face_size=FACE_SIZE):
+        self.dir = Path(cache_dir)
+        self.data_path = self.dir / 'faces.u8'
+        self.index_path = self.dir / 'index.json'
+        self.face_size = tuple(face_size)
+        self.files = {}
+        self.rows = 0
+        self.faces = None
+        if self.index_path.exists() and self.data_path.exists():
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            # cache de outro tamanho de face é descartado
+            if tuple(meta.get('face_size', ())) == self.face_size:
+                self.files = meta['files']
+                self.rows = meta['rows']
+        self._map(self.rows)
+
+    def _map(self, rows):
+        h, w = self.face_size[1], self.face_size[0]
+        if rows == 0:
+            self.faces = np.zeros((0, h, w), dtype=np.uint8)
+            return
+        self.dir.mkdir(parents=True, exist_ok=True)
+        with open(self.data_path, 'a+b') as f:
+            f.truncate(rows * h * w)
+        self.faces = np.memmap(self.data_path, dtype=np.uint8, mode='r+', shape=(rows, h, w))
+        self.rows = rows
+
+    def sync(self, entries, workers=None):
+        """Atualiza o cache para `entries` (de scan_dataset); devolve [(pessoa, caminho, linha)] das imagens válidas"""
+        kept, stale = {}, []
+        for name, path, mtime, size in entries:
+            cached = self.files.get(path)
+            if cached and cached['mtime'] == mtime and cached['size'] == size:
+                kept[path] = dict(cached, name=name)
+            else:
+                stale.append((name, path, mtime, size))
+
+        used = {c['row'] for c in kept.values() if c['row'] >= 0}
+        needed = max(self.rows, len(used) + len(stale))
+        free = [r for r in range(needed) if r not in used]
+        free.reverse()
+        if needed != self.rows:
+            self._map(needed)
+
+        for (name, path, mtime, size), face in zip(stale, decode_faces([p for _, p, _, _ in stale], workers)):
+            row = -1
+            if face is not None:
+                row = free.pop()
+                self.faces[row] = face
+            kept[path] = {'name': name, 'mtime': mtime, 'size': size, 'row': row}
+
+        self.files = kept
+        self.save()
+        return [(self.files[path]['name'], path, self.files[path]['row'])
+                for _, path, _, _ in entries if self.files[path]['row'] >= 0]
+
+    def save(self):
+        if isinstance(self.faces, np.memmap):
+            self.faces.flush()
+        self.dir.mkdir(parents=True, exist_ok=True)
+        # índice só é trocado depois que os pixels estão no disco
+        tmp = self.index_path.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'face_size': list(self.face_size), 'rows': self.rows, 'files': self.files}, f)
+        os.replace(tmp, self.index_path)
@@ -0,0 +1,60 @@
+# src/detection.py
+import cv2
+
+# Janela de treino do haarcascade_frontalface_default (24x24). Trabalhar com
+# o menor rosto esperado em ~2x a janela mantém a precisão e reduz a imagem.
+CASCADE_WINDOW = 24
+DEFAULT_WORK_MIN_SIZE = 2 * CASCADE_WINDOW
+
+
+def working_scale(min_face, work_min_size=DEFAULT_WORK_MIN_SIZE):
+    """Fator de redução para que o menor rosto esperado fique com `work_min_size` px"""
+    if not min_face or not work_min_size:
+        return 1.0
+    return min(1.0, float(work_min_size) / float(min_face))
+
+
+def expand_box(box, margin, width, height):
+    x, y, w, h = box
+    x0, y0 = max(0, int(x - margin * w)), max(0, int(y - margin * h))
+    x1, y1 = min(width, int(x + (1 + margin) * w)), min(height, int(y + (1 + margin) * h))
+    return x0, y0, x1, y1
+
+
+def detect_pyramid(cascade, gray, scale_factor=1.1, min_neighbors=5, min_face=60, max_face=None,
+                   work_min_size=DEFAULT_WORK_MIN_SIZE, rois=None, roi_margin=0.5, roi_fallback=True):
+    """Detecção com o cascade em uma cópia reduzida do frame.
+
+    - O frame é reduzido para que `min_face` caia em `work_min_size` px e as
+      caixas são devolvidas nas coordenadas do frame original.
+    - A pirâmide fica limitada à faixa de tamanhos esperada (minSize/maxSize).
+    - Com `rois` (caixas anteriores), a busca é feita só ao redor delas, com
+      a faixa de tamanhos restrita a 0.5x–2x da caixa anterior; se nada for
+      encontrado e `roi_fallback` estiver ativo, o frame inteiro é varrido.
+    """
+    height, width = gray.shape[:2]
+    scale = working_scale(min_face, work_min_size)
+    small = gray if scale >= 1.0 else cv2.resize(gray, (int(width * scale), int(height * scale)),
+                                                 interpolation=cv2.INTER_AREA)
+    max_face = max_face or min(width, height)
+
+    def run(image, low, high, offset=(0, 0)):
+        low = max(CASCADE_WINDOW, int(low * scale))
+        high = max(low, int(high * scale))
+        if image.shape[0] < low or image.shape[1] < low:
+            return []
+        found = cascade.detectMultiScale(image, scaleFactor=scale_factor, minNeighbors=min_neighbors,
+                                         minSize=(low, low), maxSize=(high, high))
+        ox, oy = offset
+        return [(int(round((fx + ox) / scale)), int(round((fy + oy) / scale)),
+                 int(round(fw / scale)), int(round(fh / scale))) for fx, fy, fw, fh in found]
+
+    if rois:
+        boxes = []
+        for roi in rois:
+            x0, y0, x1, y1 = expand_box([v * scale for v in roi], roi_margin, small.shape[1], small.shape[0])
+            size = max(roi[2], roi[3])
+            boxes.extend(run(small[y0:y1, x0:x1], max(min_face, size / 2), min(max_face, size * 2), (x0, y0)))
+        if boxes or not roi_fallback:
+            return boxes
+    return run(small, min_face, max_face)
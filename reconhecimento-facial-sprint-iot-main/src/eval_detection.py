@@ -0,0 +1,79 @@
+# src/eval_detection.py
+import argparse
+import csv
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from detection import detect_pyramid
+from tracking import iou
+from utils import iter_frames
+
+parser = argparse.ArgumentParser(description='Curva precisão x velocidade da detecção reduzida/ROI contra a detecção em resolução original')
+parser.add_argument('--source', required=True, help='Vídeo gravado ou pasta de imagens')
+parser.add_argument('--cascade', default='haarcascade_frontalface_default.xml')
+parser.add_argument('--scaleFactor', type=float, default=1.1)
+parser.add_argument('--minNeighbors', type=int, default=5)
+parser.add_argument('--minSize', type=int, default=60)
+parser.add_argument('--maxSize', type=int, default=0)
+parser.add_argument('--workMinSizes', type=int, nargs='+', default=[96, 72, 48, 36, 24],
+                    help='Tamanhos de trabalho avaliados (o menor rosto é reduzido para esse tamanho)')
+parser.add_argument('--maxFrames', type=int, default=500)
+parser.add_argument('--iou', type=float, default=0.5, help='IoU mínimo para considerar a mesma detecção')
+parser.add_argument('--output', default=None, help='CSV de saída (padrão: stdout)')
+args = parser.parse_args()
+
+cascade = cv2.CascadeClassifier(args.cascade)
+if cascade.empty():
+    raise SystemExit(f"Cascade não encontrado em '{args.cascade}'.")
+
+frames = [cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for _, frame in iter_frames(args.source, args.maxFrames)]
+if not frames:
+    raise SystemExit(f"Nenhum frame lido de '{args.source}'.")
+
+def run(work_min_size, use_roi=False):
+    boxes, times, previous = [], [], []
+    for gray in frames:
+        start = time.perf_counter()
+        found = detect_pyramid(cascade, gray, scale_factor=args.scaleFactor, min_neighbors=args.minNeighbors,
+                               min_face=args.minSize, max_face=args.maxSize or None,
+                               work_min_size=work_min_size, rois=previous if use_roi else None)
+        times.append(time.perf_counter() - start)
+        boxes.append(list(found))
+        previous = list(found)
+    return boxes, np.array(times) * 1000
+
+def compare(reference, candidate):
+    matched, total_ref, total_found = 0, 0, 0
+    for ref_boxes, boxes in zip(reference, candidate):
+        total_ref += len(ref_boxes)
+        total_found += len(boxes)
+        free = list(boxes)
+        for ref in ref_boxes:
+            best = max(free, key=lambda b: iou(ref, b), default=None)
+            if best is not None and iou(ref, best) >= args.iou:
+                free.remove(best)
+                matched += 1
+    recall = matched / total_ref if total_ref else 1.0
+    precision = matched / total_found if total_found else 1.0
+    return recall, precision
+
+# referência: cascade na resolução original, sem ROI
+reference, ref_ms = run(0)
+rows = [("original", 0, False, reference, ref_ms)]
+for size in args.workMinSizes:
+    rows.append((f"reduzido_{size}", size, False) + run(size))
+    rows.append((f"reduzido_{size}_roi", size, True) + run(size, use_roi=True))
+
+out = open(args.output, 'w', newline='') if args.output else sys.stdout
+writer = csv.writer(out)
+writer.writerow(["modo", "work_min_size", "roi", "recall", "precision", "ms_medio", "ms_p95", "speedup"])
+for name, size, use_roi, boxes, ms in rows:
+    recall, precision = compare(reference, boxes)
+    writer.writerow([name, size, int(use_roi), f"{recall:.3f}", f"{precision:.3f}",
+                     f"{ms.mean():.2f}", f"{np.percentile(ms, 95):.2f}", f"{ref_ms.mean() / ms.mean():.2f}"])
+if args.output:
+    out.close()
+    print(f"[OK] Curva salva em {args.output} ({len(frames)} frames)")
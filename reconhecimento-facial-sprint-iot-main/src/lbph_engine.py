@@ -0,0 +1,253 @@
+# src/lbph_engine.py
+import argparse
+import math
+import time
+
+import cv2
+import numpy as np
+
+from lbph_model import read_lbph, read_lbph_binary, is_binary_model
+
+DBL_MAX = np.finfo(np.float64).max
+FLT_EPSILON = np.finfo(np.float32).eps
+# Pré-filtro só vale a partir desse número de pessoas: abaixo disso a varredura completa já é
+# barata e descartar pessoas pelo centróide só troca labels
+PREFILTER_MIN_PEOPLE = 200
+
+
+def elbp(faces, radius=1, neighbors=8):
+    """Códigos LBP estendidos (interpolados) de um lote B×H×W, como o elbp do OpenCV (B×(H-2r)×(W-2r))"""
+    src = np.asarray(faces, dtype=np.float32)
+    if src.ndim == 2:
+        src = src[None]
+    _, rows, cols = src.shape
+    r = radius
+    center = src[:, r:rows - r, r:cols - r]
+    codes = np.zeros(center.shape, dtype=np.int32)
+
+    def at(dy, dx):
+        return src[:, r + dy:rows - r + dy, r + dx:cols - r + dx]
+
+    for n in range(neighbors):
+        # mesmas contas em float32 e na mesma ordem do OpenCV, para os empates baterem
+        x = np.float32(radius * math.cos(2.0 * math.pi * n / float(neighbors)))
+        y = np.float32(-radius * math.sin(2.0 * math.pi * n / float(neighbors)))
+        fx, fy = int(math.floor(x)), int(math.floor(y))
+        cx, cy = int(math.ceil(x)), int(math.ceil(y))
+        ty, tx = np.float32(y - fy), np.float32(x - fx)
+        one = np.float32(1)
+        w1, w2 = (one - tx) * (one - ty), tx * (one - ty)
+        w3, w4 = (one - tx) * ty, tx * ty
+        t = w1 * at(fy, fx) + w2 * at(fy, cx) + w3 * at(cy, fx) + w4 * at(cy, cx)
+        codes |= ((t > center) | (np.abs(t - center) < FLT_EPSILON)).astype(np.int32) << n
+    return codes
+
+
+def spatial_histograms(codes, num_patterns, grid_x=8, grid_y=8):
+    """Histograma por célula normalizado pelo nº de pixels da célula, concatenado (B × grid_x*grid_y*num_patterns)"""
+    batch, rows, cols = codes.shape
+    height, width = rows // grid_y, cols // grid_x
+    # como no OpenCV, as sobras à direita/abaixo da grade são ignoradas
+    cells = codes[:, :grid_y * height, :grid_x * width].reshape(batch, grid_y, height, grid_x, width)
+    cell_index = (np.arange(grid_y)[:, None] * grid_x + np.arange(grid_x)[None, :])[None, :, None, :, None]
+    flat = (cell_index * num_patterns + cells).reshape(batch, -1)
+    size = grid_x * grid_y * num_patterns
+    hists = np.empty((batch, size), dtype=np.float32)
+    for i in range(batch):
+        hists[i] = np.bincount(flat[i], minlength=size)
+    return hists / np.float32(height * width)
+
+
+class LBPHEngine:
+    """Predict do LBPH em NumPy sobre uma matriz float32 contígua com todos os histogramas do modelo.
+
+    A distância é a HISTCMP_CHISQR_ALT do OpenCV, 2·Σ (h-q)²/(h+q). Como o
+    histograma da sonda é esparso e s = h+q, ela vira
+    2·(Σh + 4·Σ_{q>0} q²/s - 3·Σq): só as linhas em que a sonda é não nula
+    são lidas (a matriz fica transposta, D×N) e a soma é um produto
+    matriz-vetor (BLAS) em float32. Os candidatos a top-k (até `margin`
+    acima do k-ésimo) são recalculados com soma em float64, então labels e
+    distâncias batem com o OpenCV.
+    Com `prefilter`, a sonda é comparada antes com um centróide por pessoa e
+    só as amostras das `prefilter` pessoas mais próximas são pontuadas. É uma
+    aproximação (pode trocar labels em relação ao OpenCV) e só é ligada em
+    modelos com pelo menos PREFILTER_MIN_PEOPLE pessoas; nos menores
+    `prefilter` fica 0 e a busca é completa.
+    """
+
+    def __init__(self, histograms, labels, radius=1, neighbors=8, grid_x=8, grid_y=8,
+                 threshold=DBL_MAX, prefilter=0, margin=1e-2, block_elems=1 << 23):
+        labels = np.asarray(labels, dtype=np.int32).ravel()
+        # amostras agrupadas por pessoa (ordem estável) para o min por pessoa e o pré-filtro
+        order = np.argsort(labels, kind='stable')
+        histograms_t = np.ascontiguousarray(np.asarray(histograms, dtype=np.float32)[order].T)
+        self._setup(histograms_t, labels[order], order, histograms_t.sum(axis=0, dtype=np.float64),
+                    radius, neighbors, grid_x, grid_y, threshold, prefilter, margin, block_elems)
+
+    def _setup(self, histograms_t, labels, index, row_sums, radius, neighbors, grid_x, grid_y,
+               threshold, prefilter, margin, block_elems):
+        self.radius, self.neighbors = radius, neighbors
+        self.grid_x, self.grid_y = grid_x, grid_y
+        self.threshold = threshold
+        self.margin = margin
+        self.block_elems = block_elems
+        self.histograms_t = histograms_t
+        self.labels = labels
+        self.names = {}
+        self.index = np.asarray(index, dtype=np.int64)
+        self.row_sums = row_sums
+        self.people, self.starts = np.unique(self.labels, return_index=True)
+        self.ends = np.append(self.starts[1:], len(self.labels))
+        self.centroids_t = None
+        self.prefilter = prefilter if len(self.people) >= max(PREFILTER_MIN_PEOPLE, prefilter + 1) else 0
+        if self.prefilter:
+            self.centroids_t = np.ascontiguousarray(np.stack(
+                [self.histograms_t[:, s:e].mean(axis=1) for s, e in zip(self.starts, self.ends)], axis=1))
+            self.centroid_sums = self.centroids_t.sum(axis=0, dtype=np.float64)
+
+    @classmethod
+    def from_model(cls, path, **kwargs):
+        params, histograms, labels = read_lbph(path)
+        kwargs.setdefault('threshold', params['threshold'])
+        return cls(histograms, labels, radius=params['radius'], neighbors=params['neighbors'],
+                   grid_x=params['grid_x'], grid_y=params['grid_y'], **kwargs)
+
+    @classmethod
+    def from_binary(cls, path, threshold=None, prefilter=0, margin=1e-2, block_elems=1 << 23):
+        """Abre um .lbph sem copiar a matriz: o memmap já está no layout do engine"""
+        model = read_lbph_binary(path)
+        params = model['params']
+        engine = cls.__new__(cls)
+        engine._setup(model['histograms_t'], model['labels'], model['index'], model['row_sums'],
+                      params['radius'], params['neighbors'], params['grid_x'], params['grid_y'],
+                      params['threshold'] if threshold is None else threshold, prefilter, margin, block_elems)
+        engine.names = model['names']
+        return engine
+
+    def __len__(self):
+        return len(self.labels)
+
+    def histograms_for(self, faces):
+        codes = elbp(faces, self.radius, self.neighbors)
+        return spatial_histograms(codes, 2 ** self.neighbors, self.grid_x, self.grid_y)
+
+    def _chisqr_fast(self, probe, matrix_t, sums, start=0, stop=None):
+        """CHISQR_ALT aproximada (float32) contra as colunas start:stop de uma matriz D×N"""
+        stop = matrix_t.shape[1] if stop is None else stop
+        nz = np.flatnonzero(probe)
+        q = probe[nz]
+        q2 = q * q
+        out = np.empty(stop - start, dtype=np.float64)
+        step = max(1, self.block_elems // max(1, len(nz)))
+        for b0 in range(start, stop, step):
+            b1 = min(stop, b0 + step)
+            s = matrix_t[nz, b0:b1]
+            s += q[:, None]
+            np.reciprocal(s, out=s)
+            out[b0 - start:b1 - start] = q2 @ s
+        return 2.0 * (sums[start:stop] + 4.0 * out - 3.0 * q.sum(dtype=np.float64))
+
+    def _chisqr_exact(self, probe, cols):
+        """CHISQR_ALT com soma em float64 para as amostras `cols` (índices)"""
+        nz = np.flatnonzero(probe)
+        q = probe[nz][:, None]
+        h = self.histograms_t[np.ix_(nz, cols)]
+        return 2.0 * (self.row_sums[cols] + (q * (q - 3 * h) / (h + q)).sum(axis=0, dtype=np.float64))
+
+    def distances(self, probe):
+        """Distâncias aproximadas a todas as amostras (ordem agrupada por pessoa); inf fora do pré-filtro"""
+        if self.centroids_t is None:
+            return self._chisqr_fast(probe, self.histograms_t, self.row_sums)
+        close = np.argsort(self._chisqr_fast(probe, self.centroids_t, self.centroid_sums))[:self.prefilter]
+        dist = np.full(len(self.labels), np.inf)
+        for p in close:
+            s, e = int(self.starts[p]), int(self.ends[p])
+            dist[s:e] = self._chisqr_fast(probe, self.histograms_t, self.row_sums, s, e)
+        return dist
+
+    def _rank(self, probe, k):
+        """Top-k pessoas pela menor distância entre as suas amostras"""
+        dist = self.distances(probe)
+        best = np.minimum.reduceat(dist, self.starts)
+        kth = np.partition(best, min(k, len(best)) - 1)[min(k, len(best)) - 1]
+        # refino exato de tudo que pode mudar o top-k
+        refine = np.flatnonzero(np.isfinite(dist) & (dist <= kth + self.margin))
+        dist[refine] = self._chisqr_exact(probe, refine)
+        best = np.minimum.reduceat(dist, self.starts)
+        order = list(np.argsort(best, kind='stable')[:k])
+        if len(order) > 1 and best[order[0]] == best[order[1]]:
+            # empate no topo: o OpenCV fica com a amostra de menor índice original
+            tied = np.flatnonzero(dist == best[order[0]])
+            winner = np.searchsorted(self.starts, tied[np.argmin(self.index[tied])], side='right') - 1
+            order = [winner] + [p for p in order if p != winner]
+        return [(int(self.people[p]), float(best[p])) for p in order if best[p] < self.threshold]
+
+    def predict_batch(self, faces, k=1):
+        """Top-k (label, distância) por face; lista vazia se nenhuma amostra ficar abaixo do threshold"""
+        if len(faces) == 0 or len(self.labels) == 0:
+            return [[] for _ in faces]
+        probes = self.histograms_for(np.stack(faces))
+        return [self._rank(probe, k) for probe in probes]
+
+    def predict(self, face):
+        """Mesma saída do LBPHFaceRecognizer.predict: (label, distância) ou (-1, DBL_MAX)"""
+        ranked = self.predict_batch([face], k=1)[0]
+        return ranked[0] if ranked else (-1, DBL_MAX)
+
+
+def open_model(path, **kwargs):
+    """LBPHEngine a partir de um .lbph (memmap) ou de um .yml do OpenCV"""
+    if is_binary_model(path):
+        return LBPHEngine.from_binary(path, **kwargs)
+    return LBPHEngine.from_model(path, **kwargs)
+
+
+def regression_check(model_path, faces, prefilter=0, engine_path=None):
+    """Compara com o predict do OpenCV; devolve (divergências de label, maior erro absoluto da distância, tempos).
+
+    `engine_path` permite validar outro arquivo do mesmo modelo (ex.: o .lbph convertido).
+    Com `prefilter` as divergências contam também as trocas de label do pré-filtro.
+    """
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+    recognizer.read(str(model_path))
+    engine = open_model(engine_path or model_path, prefilter=prefilter)
+
+    start = time.perf_counter()
+    expected = [recognizer.predict(face) for face in faces]
+    opencv_s = time.perf_counter() - start
+    start = time.perf_counter()
+    got = [ranked[0] if ranked else (-1, DBL_MAX) for ranked in engine.predict_batch(faces)]
+    numpy_s = time.perf_counter() - start
+
+    mismatches, worst = 0, 0.0
+    for (el, ed), (gl, gd) in zip(expected, got):
+        if el != gl:
+            mismatches += 1
+        elif ed != DBL_MAX:
+            worst = max(worst, abs(gd - ed))
+    return mismatches, worst, opencv_s, numpy_s
+
+
+if __name__ == '__main__':
+    from dataset import scan_dataset, load_face
+
+    parser = argparse.ArgumentParser(description='Regressão do LBPHEngine contra o predict do OpenCV')
+    parser.add_argument('--model', default='models/lbph_model.yml')
+    parser.add_argument('--data', default='data/raw', help='Imagens usadas como sondas (subpastas por pessoa)')
+    parser.add_argument('--limit', type=int, default=200, help='Máximo de sondas')
+    parser.add_argument('--prefilter', type=int, default=0, help='Valida o pré-filtro aproximado mantendo N pessoas (0 = desligado)')
+    parser.add_argument('--binary', default=None, help='Valida também o modelo convertido para .lbph')
+    args = parser.parse_args()
+
+    entries = scan_dataset(args.data)
+    step = max(1, len(entries) // args.limit)
+    faces = [f for f in (load_face(path) for _, path, _, _ in entries[::step][:args.limit]) if f is not None]
+    mismatches, worst, opencv_s, numpy_s = regression_check(args.model, faces, args.prefilter, args.binary)
+    print(f"[REGRESSAO] sondas={len(faces)} labels_diferentes={mismatches} erro_abs_max={worst:.2e}")
+    print(f"[REGRESSAO] opencv={1000 * opencv_s / max(1, len(faces)):.2f} ms/face "
+          f"numpy={1000 * numpy_s / max(1, len(faces)):.2f} ms/face")
+    if mismatches:
+        if args.prefilter:
+            print(f"[ERRO] o pré-filtro (--prefilter {args.prefilter}) mudou {mismatches} label(s) em relação ao OpenCV; "
+                  f"aumente N ou não use o pré-filtro com esse modelo")
+        raise SystemExit(1)
@@ -0,0 +1,172 @@
+# src/lbph_model.py
+import json
+import os
+import struct
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+
+def create_recognizer(params):
+    return cv2.face.LBPHFaceRecognizer_create(
+        radius=params['radius'],
+        neighbors=params['neighbors'],
+        grid_x=params['grid_x'],
+        grid_y=params['grid_y']
+    )
+
+
+def recognizer_params(recognizer):
+    return {
+        'radius': recognizer.getRadius(),
+        'neighbors': recognizer.getNeighbors(),
+        'grid_x': recognizer.getGridX(),
+        'grid_y': recognizer.getGridY(),
+        'threshold': recognizer.getThreshold(),
+    }
+
+
+def read_lbph(path):
+    """Lê um lbph_model.yml: (parâmetros, histogramas N×D float32, labels N int32)"""
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+    recognizer.read(str(path))
+    hists = recognizer.getHistograms()
+    histograms = np.vstack([h.reshape(1, -1) for h in hists]).astype(np.float32) if hists else np.zeros((0, 0), np.float32)
+    labels = recognizer.getLabels().ravel().astype(np.int32)
+    return recognizer_params(recognizer), histograms, labels
+
+
+def write_lbph_yml(path, params, histograms, labels):
+    """Grava histogramas/labels no mesmo formato do LBPHFaceRecognizer.write (legível pelo read do OpenCV)"""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    fs = cv2.FileStorage(str(path), cv2.FILE_STORAGE_WRITE)
+    fs.startWriteStruct('opencv_lbphfaces', cv2.FileNode_MAP)
+    fs.write('threshold', float(params.get('threshold', np.finfo(np.float64).max)))
+    for key in ('radius', 'neighbors', 'grid_x', 'grid_y'):
+        fs.write(key, int(params[key]))
+    fs.startWriteStruct('histograms', cv2.FileNode_SEQ)
+    for row in histograms:
+        fs.write('', np.ascontiguousarray(row, dtype=np.float32).reshape(1, -1))
+    fs.endWriteStruct()
+    fs.write('labels', np.asarray(labels, dtype=np.int32).reshape(-1, 1))
+    fs.startWriteStruct('labelsInfo', cv2.FileNode_SEQ)
+    fs.endWriteStruct()
+    fs.endWriteStruct()
+    fs.release()
+
+
+def load_manifest(path):
+    """Manifesto do treino: uma linha por histograma do modelo (caminho, mtime, tamanho, label) e o próximo id livre"""
+    if not Path(path).exists():
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(path, rows, next_label):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(str(path) + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'next_label': next_label, 'rows': rows}, f)
+    os.replace(tmp, path)
+
+
+# --- formato binário (.lbph) ---
+#
+# cabeçalho fixo (little-endian):
+#   magic b'LBPH', versão u8, 3 bytes de padding, radius i32, neighbors i32,
+#   grid_x i32, grid_y i32, threshold f64, amostras u64, dimensão u32,
+#   tamanho da tabela de nomes u32, offset dos histogramas u64
+# seguido de: labels i32[n] (agrupados por pessoa), índice original i64[n],
+# soma de cada histograma f64[n], tabela de nomes (JSON utf-8, nome -> id) e,
+# alinhada em 64 bytes, a matriz de histogramas float32 transposta (dimensão × n)
+# — o layout que o LBPHEngine usa direto do memmap, sem cópia.
+
+BINARY_MAGIC = b'LBPH'
+BINARY_VERSION = 1
+_HEADER = struct.Struct('<4sB3xiiiidQIIQ')
+
+
+def write_lbph_binary(path, params, histograms, labels, names=None):
+    histograms = np.asarray(histograms, dtype=np.float32)
+    labels = np.asarray(labels, dtype=np.int32).ravel()
+    order = np.argsort(labels, kind='stable')
+    names_blob = json.dumps(names or {}, ensure_ascii=False).encode('utf-8')
+    count, dim = (histograms.shape if histograms.size else (0, 0))
+    tables = _HEADER.size + count * (4 + 8 + 8) + len(names_blob)
+    offset = (tables + 63) // 64 * 64
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(str(path) + '.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, params['radius'], params['neighbors'],
+                             params['grid_x'], params['grid_y'],
+                             float(params.get('threshold', np.finfo(np.float64).max)),
+                             count, dim, len(names_blob), offset))
+        f.write(labels[order].astype('<i4').tobytes())
+        f.write(order.astype('<i8').tobytes())
+        f.write(histograms.sum(axis=1, dtype=np.float64)[order].astype('<f8').tobytes())
+        f.write(names_blob)
+        f.write(b'\0' * (offset - tables))
+        # transposta em blocos de colunas para não duplicar a matriz em memória
+        for d0 in range(0, dim, 1024):
+            f.write(np.ascontiguousarray(histograms[order, d0:d0 + 1024].T).astype('<f4').tobytes())
+    os.replace(tmp, path)
+
+
+def read_lbph_binary(path):
+    """Abre um .lbph: só o cabeçalho e as tabelas são lidos; os histogramas ficam em memmap (paginados sob demanda)"""
+    with open(path, 'rb') as f:
+        header = f.read(_HEADER.size)
+        magic, version, radius, neighbors, grid_x, grid_y, threshold, count, dim, names_len, offset = \
+            _HEADER.unpack(header)
+        if magic != BINARY_MAGIC:
+            raise ValueError(f"{path} não é um modelo LBPH binário")
+        if version != BINARY_VERSION:
+            raise ValueError(f"Versão {version} do modelo binário não suportada")
+        labels = np.frombuffer(f.read(4 * count), dtype='<i4').astype(np.int32)
+        index = np.frombuffer(f.read(8 * count), dtype='<i8').astype(np.int64)
+        row_sums = np.frombuffer(f.read(8 * count), dtype='<f8').astype(np.float64)
+        names = json.loads(f.read(names_len).decode('utf-8'))
+    histograms_t = (np.memmap(path, dtype='<f4', mode='r', offset=offset, shape=(dim, count))
+                    if count else np.zeros((dim, 0), dtype=np.float32))
+    params = {'radius': radius, 'neighbors': neighbors, 'grid_x': grid_x, 'grid_y': grid_y,
+              'threshold': threshold}
+    return {'params': params, 'labels': labels, 'index': index, 'row_sums': row_sums,
+            'names': names, 'histograms_t': histograms_t}
+
+
+def is_binary_model(path):
+    return str(path).endswith('.lbph')
+
+
+def yml_to_binary(yml_path, binary_path, labels_path=None):
+    params, histograms, labels = read_lbph(yml_path)
+    names = None
+    if labels_path and Path(labels_path).exists():
+        with open(labels_path, 'r', encoding='utf-8') as f:
+            names = json.load(f)
+    write_lbph_binary(binary_path, params, histograms, labels, names)
+
+
+def binary_to_yml(binary_path, yml_path):
+    model = read_lbph_binary(binary_path)
+    # volta para a ordem original das amostras
+    inverse = np.argsort(model['index'])
+    histograms = np.asarray(model['histograms_t']).T[inverse]
+    write_lbph_yml(yml_path, model['params'], histograms, model['labels'][inverse])
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Converte o modelo LBPH entre o YAML do OpenCV e o formato binário (.lbph)')
+    parser.add_argument('source')
+    parser.add_argument('target')
+    parser.add_argument('--labels', default='models/labels.json', help='Tabela de nomes gravada no .lbph')
+    args = parser.parse_args()
+    if is_binary_model(args.target):
+        yml_to_binary(args.source, args.target, args.labels)
+    else:
+        binary_to_yml(args.source, args.target)
+    print(f"[OK] {args.source} -> {args.target}")
@@ -0,0 +1,68 @@
+# src/motion.py
+import time
+
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """Decide se o cascade precisa rodar no frame atual.
+
+    Cada frame é reduzido para uma miniatura (`width` px de largura, borrada
+    para tirar ruído do sensor) e comparado com a miniatura do último frame
+    em que o cascade rodou. Se a fração de pixels que mudaram mais que
+    `pixel_threshold` níveis de cinza ficar abaixo de `min_area`, a cena é
+    considerada parada e as detecções/identidades anteriores continuam
+    valendo. O cascade roda de novo ao haver movimento ou depois de
+    `refresh_frames` frames / `refresh_seconds` segundos sem rodar.
+    """
+
+    def __init__(self, width=64, pixel_threshold=12, min_area=0.005, refresh_frames=30, refresh_seconds=None):
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.min_area = min_area
+        self.refresh_frames = refresh_frames
+        self.refresh_seconds = refresh_seconds
+        self.runs = 0
+        self.skipped = 0
+        self.last_motion = 0.0
+        self.reset()
+
+    def reset(self):
+        """Esquece o quadro de referência: o próximo frame sempre roda o cascade"""
+        self._reference = None
+        self._since_run = 0
+        self._run_at = 0.0
+
+    def _thumbnail(self, gray):
+        h, w = gray.shape[:2]
+        size = (self.width, max(1, int(round(h * self.width / float(w)))))
+        return cv2.GaussianBlur(cv2.resize(gray, size, interpolation=cv2.INTER_AREA), (3, 3), 0)
+
+    def motion(self, thumb):
+        """Fração da miniatura que mudou em relação ao quadro de referência"""
+        diff = cv2.absdiff(thumb, self._reference)
+        return float(np.count_nonzero(diff > self.pixel_threshold)) / diff.size
+
+    def check(self, gray, now=None):
+        """True = rodar o cascade neste frame (e ele vira a nova referência); False = reaproveitar"""
+        now = time.monotonic() if now is None else now
+        thumb = self._thumbnail(gray)
+        run = self._reference is None or thumb.shape != self._reference.shape
+        if not run:
+            self.last_motion = self.motion(thumb)
+            run = (self.last_motion >= self.min_area
+                   or (self.refresh_frames and self._since_run + 1 >= self.refresh_frames)
+                   or (self.refresh_seconds and now - self._run_at >= self.refresh_seconds))
+        if run:
+            self._reference = thumb
+            self._since_run = 0
+            self._run_at = now
+            self.runs += 1
+        else:
+            self._since_run += 1
+            self.skipped += 1
+        return run
+
+    def stats(self):
+        return {"cascade_runs": self.runs, "cascade_skipped": self.skipped}
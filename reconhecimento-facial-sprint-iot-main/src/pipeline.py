@@ -0,0 +1,208 @@
+# src/pipeline.py
+import collections
+import threading
+import time
+
+import numpy as np
+
+
+class Closed(Exception):
+    """A fila foi fechada e não há mais itens"""
+
+
+class DropOldestQueue:
+    """Fila limitada: quando cheia, o item mais antigo é descartado para dar lugar ao novo.
+
+    Assim um estágio lento nunca faz a captura esperar, e o que chega ao
+    consumidor é sempre o frame mais recente.
+    """
+
+    def __init__(self, maxsize=2):
+        self.maxsize = maxsize
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+        self.max_depth = 0
+
+    def put(self, item):
+        with self._cond:
+            if self._closed:
+                return
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self.max_depth = max(self.max_depth, len(self._items))
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items or self._closed, timeout):
+                raise TimeoutError
+            if self._items:
+                return self._items.popleft()
+            raise Closed
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+
+class LatencyStats:
+    """Latências (ms) de um estágio; guarda só as últimas `window` amostras"""
+
+    def __init__(self, window=500):
+        self._samples = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds * 1000.0)
+            self.count += 1
+
+    def summary(self):
+        with self._lock:
+            samples = np.array(self._samples) if self._samples else np.zeros(1)
+            count = self.count
+        return {"count": count,
+                "p50_ms": round(float(np.percentile(samples, 50)), 2),
+                "p99_ms": round(float(np.percentile(samples, 99)), 2),
+                "max_ms": round(float(samples.max()), 2)}
+
+
+class Stage(threading.Thread):
+    """Estágio do pipeline em thread própria: lê da fila de entrada, aplica `fn`, escreve na de saída.
+
+    `fn` recebe e devolve um item; devolver None descarta o item. Com
+    `executor` (ex.: ProcessPoolExecutor), `fn` roda no pool e até
+    `in_flight` itens ficam em processamento ao mesmo tempo, mantendo a ordem.
+    `payload(item)` escolhe o que é passado a `fn` (só o necessário atravessa
+    o processo) e `merge(item, resultado)` junta o resultado de volta ao item.
+    """
+
+    def __init__(self, name, fn, inbox, outbox=None, executor=None, in_flight=1, payload=None, merge=None):
+        super().__init__(name=name, daemon=True)
+        self.fn = fn
+        self.inbox = inbox
+        self.outbox = outbox
+        self.executor = executor
+        self.in_flight = max(1, in_flight)
+        self.payload = payload or (lambda item: item)
+        self.merge = merge or (lambda item, result: result)
+        self.latency = LatencyStats()
+        self.errors = 0
+
+    def _emit(self, item, result, started):
+        self.latency.add(time.perf_counter() - started)
+        result = self.merge(item, result)
+        if result is not None and self.outbox is not None:
+            self.outbox.put(result)
+
+    def run(self):
+        pending = collections.deque()
+        try:
+            while True:
+                if self.executor is not None and len(pending) >= self.in_flight:
+                    self._collect(pending.popleft())
+                try:
+                    item = self.inbox.get(timeout=0.05 if pending else None)
+                except TimeoutError:
+                    if pending and pending[0][1].done():
+                        self._collect(pending.popleft())
+                    continue
+                except Closed:
+                    break
+                started = time.perf_counter()
+                if self.executor is None:
+                    try:
+                        self._emit(item, self.fn(self.payload(item)), started)
+                    except Exception as e:
+                        self.errors += 1
+                        print(f"[ERRO] estágio {self.name}: {e}")
+                else:
+                    pending.append((item, self.executor.submit(self.fn, self.payload(item)), started))
+            while pending:
+                self._collect(pending.popleft())
+        finally:
+            if self.outbox is not None:
+                self.outbox.close()
+
+    def _collect(self, entry):
+        item, future, started = entry
+        try:
+            self._emit(item, future.result(), started)
+        except Exception as e:
+            self.errors += 1
+            print(f"[ERRO] estágio {self.name}: {e}")
+
+
+class Pipeline:
+    """Fonte + estágios ligados por filas DropOldestQueue, com contadores por estágio"""
+
+    def __init__(self, queue_size=2):
+        self.queue_size = queue_size
+        self.stages = []
+        self.queues = {}
+        self._source = None
+        self._stop = threading.Event()
+
+    def queue(self, name, maxsize=None):
+        q = DropOldestQueue(maxsize or self.queue_size)
+        self.queues[name] = q
+        return q
+
+    def source(self, name, read, outbox):
+        """Thread que chama `read()` em loop e publica os itens (None encerra a fonte)"""
+        def loop():
+            try:
+                while not self._stop.is_set():
+                    started = time.perf_counter()
+                    item = read()
+                    if item is None:
+                        break
+                    source_stats.add(time.perf_counter() - started)
+                    outbox.put(item)
+            finally:
+                outbox.close()
+        source_stats = LatencyStats()
+        self._source = (name, threading.Thread(target=loop, name=name, daemon=True), source_stats)
+        return self
+
+    def stage(self, name, fn, inbox, outbox=None, executor=None, in_flight=1, payload=None, merge=None):
+        self.stages.append(Stage(name, fn, inbox, outbox, executor, in_flight, payload, merge))
+        return self
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+        if self._source is not None:
+            self._source[1].start()
+        return self
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        if self._source is not None:
+            self._source[1].join(timeout)
+        for stage in self.stages:
+            stage.join(timeout)
+
+    def stats(self):
+        result = {}
+        if self._source is not None:
+            result[self._source[0]] = self._source[2].summary()
+        for stage in self.stages:
+            result[stage.name] = dict(stage.latency.summary(), errors=stage.errors)
+        for name, q in self.queues.items():
+            result[f"fila_{name}"] = {"depth": len(q), "max_depth": q.max_depth, "dropped": q.dropped}
+        return result
+
+    def report(self, label="[PIPELINE]"):
+        for name, values in self.stats().items():
+            print(f"{label} {name}: " + " ".join(f"{k}={v}" for k, v in values.items()))
@@ -1,18 +1,59 @@
 # src/recognize.py
 import cv2
+import csv
 import json
+import os
+import sys
 from pathlib import Path
 import argparse
+import time
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from detection import detect_pyramid, DEFAULT_WORK_MIN_SIZE
+from lbph_engine import open_model, PREFILTER_MIN_PEOPLE
+from lbph_model import is_binary_model
+from motion import MotionGate
+from pipeline import Pipeline, LatencyStats, Closed
+from tracking import FaceTracker
+from utils import RunStats, iter_frames, frame_count
 
 parser = argparse.ArgumentParser()
-parser.add_argument('--model', default='models/lbph_model.yml')
+parser.add_argument('--model', default='models/lbph_model.yml', help='Modelo LBPH (.yml do OpenCV ou .lbph binário, que usa --engine numpy)')
 parser.add_argument('--labels', default='models/labels.json')
 parser.add_argument('--cascade', default='haarcascade_frontalface_default.xml')
 parser.add_argument('--scaleFactor', type=float, default=1.1, help='Haar cascade scaleFactor')
 parser.add_argument('--minNeighbors', type=int, default=5, help='Haar cascade minNeighbors')
 parser.add_argument('--minSize', type=int, default=60, help='Haar cascade minSize (px)')
+parser.add_argument('--maxSize', type=int, default=0, help='Haar cascade maxSize (px, 0 = tamanho do frame)')
+parser.add_argument('--workMinSize', type=int, default=DEFAULT_WORK_MIN_SIZE, help='Reduz o frame para que minSize fique com esse tamanho antes do cascade (0 = resolução original)')
+parser.add_argument('--roi', action='store_true', help='Procura rostos só ao redor das detecções anteriores (varredura completa a cada --fullScanEvery frames)')
+parser.add_argument('--fullScanEvery', type=int, default=15, help='Com --roi: varre o frame inteiro a cada N frames')
+parser.add_argument('--engine', choices=['opencv', 'numpy'], default='opencv', help='Predict do LBPH: OpenCV (uma face por vez) ou NumPy (todas as faces do frame em lote)')
+parser.add_argument('--prefilter', type=int, default=0, help='Com --engine numpy: APROXIMADO, compara só com as N pessoas de centróide mais próximo (pode trocar labels; só em modelos grandes, valide com src/lbph_engine.py --prefilter N)')
 parser.add_argument('--threshold', type=float, default=60.0, help='max distance (score) para aceitar identificação (LBPH)')
+# modo detecta-uma-vez / rastreia entre frames
+parser.add_argument('--track', action='store_true', help='Rastreia os rostos entre detecções (fluxo óptico)')
+parser.add_argument('--detectEvery', type=int, default=10, help='Com --track: roda o cascade a cada K frames')
+parser.add_argument('--minTrackQuality', type=float, default=0.5, help='Com --track: redetecta se a qualidade do rastreio cair abaixo disso')
+parser.add_argument('--recheckEvery', type=int, default=30, help='Com --track: refaz o predict de um track a cada N frames')
+# modo pipeline: captura / reconhecimento / render / gravação em threads separadas
+parser.add_argument('--pipeline', action='store_true', help='Captura, reconhecimento, render e gravação em threads ligadas por filas limitadas')
+parser.add_argument('--queueSize', type=int, default=2, help='Com --pipeline: tamanho de cada fila (descarta o frame mais antigo quando cheia)')
+parser.add_argument('--processes', type=int, default=0, help='Com --pipeline: detecção+reconhecimento em N processos (0 = thread)')
+parser.add_argument('--record', default=None, help='Com --pipeline: grava o vídeo anotado nesse arquivo (.mp4/.avi)')
+# detecção só com movimento
+parser.add_argument('--motion', action='store_true', help='Pula o cascade quando a cena não mudou desde a última detecção (reaproveita caixas e identidades)')
+parser.add_argument('--motionThreshold', type=int, default=12, help='Com --motion: diferença mínima de cinza para um pixel contar como movimento')
+parser.add_argument('--motionArea', type=float, default=0.005, help='Com --motion: fração mínima da imagem em movimento para rodar o cascade')
+parser.add_argument('--motionRefresh', type=int, default=30, help='Com --motion: roda o cascade pelo menos a cada N frames')
+# modo headless em lote
+parser.add_argument('--source', nargs='+', default=None, help='Vídeos e/ou pastas de imagens: processa sem câmera e sem janela')
+parser.add_argument('--output', default='-', help="Com --source: resultados por frame ('-' = saída padrão)")
+parser.add_argument('--format', choices=['jsonl', 'csv'], default=None, help='Com --source: JSON Lines ou CSV (padrão: pela extensão de --output)')
+parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Com --source: processos, cada um com seu cascade e LBPH')
+parser.add_argument('--chunkSize', type=int, default=256, help='Com --source: frames por tarefa enviada aos processos')
+parser.add_argument('--statsEvery', type=float, default=5.0, help='Intervalo (s) para imprimir FPS e uso de CPU (0 desativa)')
 args = parser.parse_args()
 
 # Load cascade - use local OpenCV cascade (download if necessário)
@@ -24,42 +65,343 @@ if not Path(cascade_path).exists():
     raise SystemExit(f"Cascade não encontrado em '{cascade_path}'. Baixe 'haarcascade_frontalface_default.xml' e coloque no projeto.")
 
 face_cascade = cv2.CascadeClassifier(cascade_path)
-recognizer = cv2.face.LBPHFaceRecognizer_create()
-recognizer.read(args.model)
-
-with open(args.labels, 'r', encoding='utf-8') as f:
-    label_map = json.load(f)
-    inv_label_map = {int(v):k for k,v in label_map.items()}
-
-cap = cv2.VideoCapture(0)
-
-while True:
-    ret, frame = cap.read()
-    if not ret: break
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    faces = face_cascade.detectMultiScale(gray,
-                                          scaleFactor=args.scaleFactor,
-                                          minNeighbors=args.minNeighbors,
-                                          minSize=(args.minSize, args.minSize))
-    for (x,y,w,h) in faces:
-        face_roi = gray[y:y+h, x:x+w]
-        face_resized = cv2.resize(face_roi, (200,200))
-        label, confidence = recognizer.predict(face_resized)  # lower confidence = better
-        # LBPH returns "distance" like metric; aqui tratamos confidence como distância
-        if confidence <= args.threshold:
-            name = inv_label_map.get(label, "Desconhecido")
-            text = f"{name} ({confidence:.1f})"
-            color = (0,255,0)
+if is_binary_model(args.model):
+    # o .lbph só é lido pelo engine NumPy (abre em memmap, sem parse do yml)
+    args.engine = 'numpy'
+if args.engine == 'numpy':
+    engine = open_model(args.model, prefilter=args.prefilter)
+    if args.prefilter and not engine.prefilter:
+        print(f"[AVISO] --prefilter ignorado: o modelo tem {len(engine.people)} pessoa(s) "
+              f"(mínimo {PREFILTER_MIN_PEOPLE} e mais que N); usando a busca completa")
+    elif engine.prefilter:
+        print(f"[AVISO] --prefilter {engine.prefilter}: predição aproximada, pode divergir do OpenCV")
+else:
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+    recognizer.read(args.model)
+
+if Path(args.labels).exists():
+    with open(args.labels, 'r', encoding='utf-8') as f:
+        label_map = json.load(f)
+else:
+    # o .lbph carrega a própria tabela de nomes
+    label_map = engine.names if args.engine == 'numpy' else {}
+inv_label_map = {int(v):k for k,v in label_map.items()}
+
+def detect(gray, rois=None):
+    stats.count("detections")
+    # cascade na cópia reduzida do frame; caixas voltam em resolução original
+    return detect_pyramid(face_cascade, gray,
+                          scale_factor=args.scaleFactor,
+                          min_neighbors=args.minNeighbors,
+                          min_face=args.minSize,
+                          max_face=args.maxSize or None,
+                          work_min_size=args.workMinSize,
+                          rois=rois)
+
+def crop(gray, box):
+    x, y, w, h = box
+    x, y = max(0, x), max(0, y)
+    face_roi = gray[y:y+h, x:x+w]
+    if face_roi.size == 0:
+        return None
+    return cv2.resize(face_roi, (200,200))
+
+def identify(gray, box):
+    return identify_all(gray, [box])[0]
+
+def identify_all(gray, boxes):
+    """(label, confidence) de cada caixa; com --engine numpy todas as faces vão num único lote"""
+    faces = [crop(gray, box) for box in boxes]
+    valid = [face for face in faces if face is not None]
+    stats.count("predictions", len(valid))
+    if args.engine == 'numpy':
+        results = [ranked[0] if ranked else (-1, float('inf')) for ranked in engine.predict_batch(valid, k=1)]
+    else:
+        results = [recognizer.predict(face) for face in valid]  # lower confidence = better
+    results = iter(results)
+    return [next(results) if face is not None else (None, float('inf')) for face in faces]
+
+def draw(frame, box, label, confidence):
+    x, y, w, h = box
+    # LBPH returns "distance" like metric; aqui tratamos confidence como distância
+    if confidence <= args.threshold:
+        name = inv_label_map.get(label, "Desconhecido")
+        text = f"{name} ({confidence:.1f})"
+        color = (0,255,0)
+    else:
+        name = "Desconhecido"
+        text = f"{name} ({confidence:.1f})"
+        color = (0,0,255)
+    cv2.rectangle(frame, (x,y), (x+w, y+h), color, 2)
+    cv2.putText(frame, text, (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+
+stats = RunStats()
+
+def make_gate():
+    if not args.motion:
+        return None
+    return MotionGate(pixel_threshold=args.motionThreshold, min_area=args.motionArea,
+                      refresh_frames=args.motionRefresh)
+
+def report(label, gate=None, file=None):
+    if gate is not None:
+        stats.counters.update(gate.stats())
+    stats.report(label, file=file)
+
+def run_loop():
+    tracker = FaceTracker() if args.track else None
+    gate = make_gate()
+    previous_faces, previous_results = [], []
+    frame_idx = 0
+    last_report = stats.start_wall
+    mode_label = "[STATS] tracking" if args.track else "[STATS] sem tracking"
+
+    cap = cv2.VideoCapture(0)
+
+    while True:
+        ret, frame = cap.read()
+        if not ret: break
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+        if tracker is None:
+            # cena parada (--motion): mantém as caixas e identidades da última detecção
+            if gate is None or gate.check(gray):
+                rois = previous_faces if args.roi and frame_idx % args.fullScanEvery != 0 else None
+                previous_faces = detect(gray, rois)
+                previous_results = identify_all(gray, previous_faces)
+            for box, (label, confidence) in zip(previous_faces, previous_results):
+                draw(frame, box, label, confidence)
         else:
-            name = "Desconhecido"
-            text = f"{name} ({confidence:.1f})"
-            color = (0,0,255)
-        cv2.rectangle(frame, (x,y), (x+w, y+h), color, 2)
-        cv2.putText(frame, text, (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
-
-    cv2.imshow("Reconhecimento Facial (Press q para sair)", frame)
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
-
-cap.release()
-cv2.destroyAllWindows()
\ No newline at end of file
+            # cascade só a cada K frames, sem tracks ou com o rastreio degradado
+            if frame_idx % args.detectEvery == 0 or not tracker.tracks:
+                tracker.reset(gray, detect(gray))
+            elif tracker.quality < args.minTrackQuality:
+                # redetecção local ao redor dos tracks atuais
+                tracker.reset(gray, detect(gray, [t.int_box() for t in tracker.tracks]))
+            else:
+                tracker.update(gray)
+            for track in tracker.tracks:
+                box = track.int_box()
+                # predict só para tracks novos ou na reverificação periódica
+                if track.label is None or frame_idx - track.recognized_at >= args.recheckEvery:
+                    track.label, track.confidence = identify(gray, box)
+                    track.recognized_at = frame_idx
+                draw(frame, box, track.label, track.confidence)
+
+        frame_idx += 1
+        stats.frame()
+        if args.statsEvery and time.perf_counter() - last_report >= args.statsEvery:
+            report(mode_label, gate)
+            last_report = time.perf_counter()
+        cv2.imshow("Reconhecimento Facial (Press q para sair)", frame)
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            break
+
+    cap.release()
+    cv2.destroyAllWindows()
+    report(mode_label, gate)
+
+# --- modo pipeline ---
+
+def init_worker():
+    # cada processo já tem o seu cascade/recognizer (criados no import); um thread do OpenCV por processo
+    cv2.setNumThreads(1)
+
+def recognize_gray(gray):
+    """Detecção + predict de um frame; roda no thread de reconhecimento ou em um processo do pool"""
+    boxes = [tuple(int(v) for v in box) for box in detect(gray)]
+    return [(box,) + tuple(result) for box, result in zip(boxes, identify_all(gray, boxes))]
+
+def run_pipeline():
+    cap = cv2.VideoCapture(0)
+    pool = ProcessPoolExecutor(args.processes, initializer=init_worker) if args.processes > 0 else None
+    writer = None
+    end_to_end = LatencyStats()
+    frame_idx = [0]
+
+    def capture():
+        ret, frame = cap.read()
+        if not ret:
+            return None
+        frame_idx[0] += 1
+        return {"idx": frame_idx[0], "t": time.perf_counter(), "frame": frame}
+
+    def to_gray(item):
+        # só o frame em cinza vai para o processo de reconhecimento
+        return cv2.cvtColor(item["frame"], cv2.COLOR_BGR2GRAY)
+
+    def with_faces(item, faces):
+        item["faces"] = faces
+        return item
+
+    def render(item):
+        for box, label, confidence in item["faces"]:
+            draw(item["frame"], box, label, confidence)
+        if record_q is not None:
+            record_q.put(item["frame"])
+        return item
+
+    def write(frame):
+        nonlocal writer
+        if writer is None:
+            h, w = frame.shape[:2]
+            fourcc = cv2.VideoWriter_fourcc(*('mp4v' if args.record.lower().endswith('.mp4') else 'XVID'))
+            writer = cv2.VideoWriter(args.record, fourcc, 20.0, (w, h))
+        writer.write(frame)
+
+    pipe = Pipeline(queue_size=args.queueSize)
+    capture_q, render_q, display_q = pipe.queue("captura"), pipe.queue("render"), pipe.queue("exibicao")
+    record_q = pipe.queue("gravacao") if args.record else None
+    pipe.source("captura", capture, capture_q)
+    pipe.stage("reconhecimento", recognize_gray, capture_q, render_q, executor=pool,
+               in_flight=max(1, args.processes), payload=to_gray, merge=with_faces)
+    pipe.stage("render", render, render_q, display_q)
+    if record_q is not None:
+        pipe.stage("gravacao", write, record_q)
+    pipe.start()
+
+    # imshow/waitKey ficam no thread principal (exigência do HighGUI em algumas plataformas)
+    last_report = stats.start_wall
+    try:
+        while True:
+            try:
+                item = display_q.get(timeout=0.5)
+            except TimeoutError:
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+                continue
+            except Closed:
+                break
+            end_to_end.add(time.perf_counter() - item["t"])
+            stats.frame()
+            cv2.imshow("Reconhecimento Facial (Press q para sair)", item["frame"])
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+            if args.statsEvery and time.perf_counter() - last_report >= args.statsEvery:
+                stats.report("[STATS] pipeline")
+                pipe.report()
+                print("[PIPELINE] captura->tela: " + " ".join(f"{k}={v}" for k, v in end_to_end.summary().items()))
+                last_report = time.perf_counter()
+    finally:
+        pipe.stop()
+        cap.release()
+        if pool is not None:
+            pool.shutdown()
+        if writer is not None:
+            writer.release()
+        cv2.destroyAllWindows()
+    stats.report("[STATS] pipeline")
+    pipe.report()
+    print("[PIPELINE] captura->tela: " + " ".join(f"{k}={v}" for k, v in end_to_end.summary().items()))
+
+# --- modo headless em lote ---
+
+CSV_FIELDS = ['source', 'frame', 'timestamp_ms', 'reused', 'face', 'x', 'y', 'w', 'h', 'label', 'name', 'distance', 'known']
+
+def make_chunks(sources, chunk_size):
+    """Divide cada vídeo/pasta em trechos (fonte, primeiro frame, nº de frames, fps) independentes"""
+    chunks = []
+    for source in sources:
+        total, fps = frame_count(source)
+        if total is None:
+            # sem contagem no container: o vídeo inteiro vira uma única tarefa
+            chunks.append((source, 0, None, fps))
+            continue
+        for start in range(0, total, chunk_size):
+            chunks.append((source, start, min(chunk_size, total - start), fps))
+    return chunks
+
+def recognize_chunk(chunk):
+    """Roda no processo worker: lê só o seu trecho da fonte e devolve uma linha por frame"""
+    source, start, count, fps = chunk
+    rows = []
+    previous_faces = []
+    gate = make_gate()  # um modelo de movimento por trecho (os trechos são independentes)
+    for idx, frame in iter_frames(source, count, start):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if gate is not None and not gate.check(gray):
+            # cena parada: repete as faces do frame anterior
+            rows.append({"source": source, "frame": idx,
+                         "timestamp_ms": round(1000.0 * idx / fps, 1) if fps else None,
+                         "reused": True, "faces": rows[-1]["faces"] if rows else []})
+            continue
+        rois = previous_faces if args.roi and (idx - start) % args.fullScanEvery != 0 else None
+        boxes = [tuple(int(v) for v in box) for box in detect(gray, rois)]
+        previous_faces = boxes
+        faces = []
+        for box, (label, distance) in zip(boxes, identify_all(gray, boxes)):
+            known = label is not None and distance <= args.threshold
+            faces.append({"box": list(box), "label": None if label is None else int(label),
+                          "name": inv_label_map.get(label) if known else None,
+                          "distance": None if not np.isfinite(distance) else round(float(distance), 3),
+                          "known": bool(known)})
+        rows.append({"source": source, "frame": idx,
+                     "timestamp_ms": round(1000.0 * idx / fps, 1) if fps else None, "reused": False, "faces": faces})
+    return rows
+
+def write_rows(out, fmt, rows):
+    if fmt == 'jsonl':
+        for row in rows:
+            out.write(json.dumps(row, ensure_ascii=False) + "\n")
+        return
+    writer = csv.DictWriter(out, CSV_FIELDS)
+    for row in rows:
+        base = {"source": row["source"], "frame": row["frame"], "timestamp_ms": row["timestamp_ms"],
+                "reused": row["reused"]}
+        if not row["faces"]:
+            writer.writerow(base)  # frame sem rosto: uma linha só com a posição
+        for i, face in enumerate(row["faces"]):
+            x, y, w, h = face["box"]
+            writer.writerow(dict(base, face=i, x=x, y=y, w=w, h=h, label=face["label"], name=face["name"],
+                                 distance=face["distance"], known=face["known"]))
+
+def run_batch():
+    fmt = args.format or ('csv' if args.output.lower().endswith('.csv') else 'jsonl')
+    chunks = make_chunks(args.source, args.chunkSize)
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8', newline='')
+    # com os resultados na saída padrão, as estatísticas vão para stderr
+    log = sys.stderr if out is sys.stdout else None
+    if fmt == 'csv':
+        csv.DictWriter(out, CSV_FIELDS).writeheader()
+    workers = max(1, min(args.workers, len(chunks)))
+    print(f"[INFO] {len(args.source)} fonte(s), {len(chunks)} trecho(s), {workers} processo(s)", file=log)
+    pool = ProcessPoolExecutor(workers, initializer=init_worker) if workers > 1 else None
+    last_report = stats.start_wall
+    faces_total = skipped = 0
+    try:
+        # map mantém a ordem dos trechos: a saída sai na ordem dos frames de cada fonte
+        results = pool.map(recognize_chunk, chunks) if pool is not None else map(recognize_chunk, chunks)
+        for rows in results:
+            write_rows(out, fmt, rows)
+            out.flush()
+            for row in rows:
+                stats.frame()
+                faces_total += len(row["faces"])
+                skipped += row["reused"]
+            if args.statsEvery and time.perf_counter() - last_report >= args.statsEvery:
+                stats.report("[STATS] lote", file=log)
+                last_report = time.perf_counter()
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        if out is not sys.stdout:
+            out.close()
+    stats.count("faces", faces_total)
+    if args.motion:
+        stats.count("cascade_skipped", skipped)
+    # cpu_percent só conta o processo principal; o fps é o total de frames / tempo de parede
+    stats.report("[STATS] lote", file=log)
+
+if __name__ == '__main__':
+    if args.source:
+        if args.track or args.pipeline:
+            raise SystemExit("--source não pode ser usado com --track ou --pipeline")
+        run_batch()
+    elif args.motion and (args.track or args.pipeline):
+        raise SystemExit("--motion vale para o laço simples e para --source (o --track já pula o cascade entre detecções)")
+    elif args.pipeline and args.track:
+        raise SystemExit("--pipeline e --track não podem ser usados juntos (o rastreio depende da ordem dos frames)")
+    elif args.pipeline:
+        run_pipeline()
+    else:
+        run_loop()
@@ -0,0 +1,118 @@
+# src/tracking.py
+import itertools
+
+import cv2
+import numpy as np
+
+_track_ids = itertools.count(1)
+
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0.0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0.0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+class Track:
+    """Um rosto acompanhado entre frames, com a identidade em cache"""
+
+    def __init__(self, box):
+        self.id = next(_track_ids)
+        self.box = [float(v) for v in box]
+        self.points = None
+        self.seeded = 0
+        self.quality = 1.0
+        self.label = None
+        self.name = None
+        self.confidence = None
+        self.recognized_at = None
+
+    def int_box(self):
+        x, y, w, h = self.box
+        return int(round(x)), int(round(y)), int(round(w)), int(round(h))
+
+
+class FaceTracker:
+    """Acompanha caixas de rosto entre detecções usando fluxo óptico (Lucas-Kanade).
+
+    Em cada caixa são escolhidos pontos de canto (goodFeaturesToTrack); a
+    caixa é deslocada pela mediana do movimento dos pontos e reescalada pela
+    variação da dispersão deles. A qualidade do track é a fração dos pontos
+    iniciais que o fluxo ainda consegue seguir.
+    """
+
+    def __init__(self, max_points=40, min_points=6, iou_match=0.3):
+        self.max_points = max_points
+        self.min_points = min_points
+        self.iou_match = iou_match
+        self.tracks = []
+        self._prev_gray = None
+        self._lk = dict(winSize=(15, 15), maxLevel=2,
+                        criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+
+    @property
+    def quality(self):
+        """Pior qualidade entre os tracks (0 se não há nenhum)"""
+        return min((t.quality for t in self.tracks), default=0.0)
+
+    def _seed_points(self, gray, track):
+        x, y, w, h = track.int_box()
+        mask = np.zeros_like(gray)
+        # evita o fundo: pontos só na parte central da caixa
+        mask[max(0, y + h // 8):max(0, y + h - h // 8), max(0, x + w // 8):max(0, x + w - w // 8)] = 255
+        track.points = cv2.goodFeaturesToTrack(gray, maxCorners=self.max_points, qualityLevel=0.01,
+                                               minDistance=5, mask=mask)
+        track.seeded = 0 if track.points is None else len(track.points)
+        track.quality = 1.0 if track.seeded >= self.min_points else 0.0
+
+    def reset(self, gray, boxes):
+        """Aplica uma nova detecção: mantém a identidade dos tracks que casam por IoU"""
+        new_tracks = []
+        unmatched = list(self.tracks)
+        for box in boxes:
+            best = max(unmatched, key=lambda t: iou(t.box, box), default=None)
+            if best is not None and iou(best.box, box) >= self.iou_match:
+                unmatched.remove(best)
+                best.box = [float(v) for v in box]
+                track = best
+            else:
+                track = Track(box)
+            self._seed_points(gray, track)
+            new_tracks.append(track)
+        self.tracks = new_tracks
+        self._prev_gray = gray
+        return self.tracks
+
+    def update(self, gray):
+        """Propaga as caixas para o frame atual; descarta tracks perdidos"""
+        if self._prev_gray is None:
+            self._prev_gray = gray
+            return self.tracks
+        alive = []
+        for track in self.tracks:
+            if track.points is None or len(track.points) < self.min_points:
+                continue
+            moved, status, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, track.points, None, **self._lk)
+            ok = status.ravel() == 1
+            if ok.sum() < self.min_points:
+                continue
+            old_pts = track.points[ok].reshape(-1, 2)
+            new_pts = moved[ok].reshape(-1, 2)
+            shift = np.median(new_pts - old_pts, axis=0)
+            old_spread = np.median(np.linalg.norm(old_pts - old_pts.mean(axis=0), axis=1))
+            new_spread = np.median(np.linalg.norm(new_pts - new_pts.mean(axis=0), axis=1))
+            scale = new_spread / old_spread if old_spread > 1e-3 else 1.0
+            x, y, w, h = track.box
+            cx, cy = x + w / 2 + shift[0], y + h / 2 + shift[1]
+            w, h = w * scale, h * scale
+            track.box = [cx - w / 2, cy - h / 2, w, h]
+            track.points = new_pts.reshape(-1, 1, 2)
+            track.quality = len(new_pts) / float(track.seeded)
+            alive.append(track)
+        self.tracks = alive
+        self._prev_gray = gray
+        return self.tracks
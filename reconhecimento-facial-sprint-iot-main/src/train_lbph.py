@@ -5,55 +5,130 @@ import numpy as np
 from pathlib import Path
 import argparse
 import json
+import time
+
+from dataset import scan_dataset, decode_faces, FaceCache
+from lbph_model import create_recognizer, recognizer_params, read_lbph, write_lbph_yml, write_lbph_binary, load_manifest, save_manifest
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--data', default='data/raw', help='Pasta com subpastas por pessoa')
 parser.add_argument('--model', default='models/lbph_model.yml', help='Arquivo de saída do modelo')
 parser.add_argument('--labels', default='models/labels.json', help='Mapeamento id->nome')
+parser.add_argument('--binary', default='models/lbph_model.lbph', help="Cópia do modelo no formato binário (.lbph, abre em memmap); '' desativa")
+parser.add_argument('--manifest', default='models/manifest.json', help='Imagens já treinadas (uma linha por histograma do modelo)')
 # LBPH params
 parser.add_argument('--radius', type=int, default=1)
 parser.add_argument('--neighbors', type=int, default=8)
 parser.add_argument('--grid_x', type=int, default=8)
 parser.add_argument('--grid_y', type=int, default=8)
-args = parser.parse_args()
-
-# cria recognizer
-recognizer = cv2.face.LBPHFaceRecognizer_create(
-    radius=args.radius,
-    neighbors=args.neighbors,
-    grid_x=args.grid_x,
-    grid_y=args.grid_y
-)
-
-faces = []
-labels = []
-label_map = {}
-current_label = 0
-
-for person_dir in sorted(Path(args.data).iterdir()):
-    if not person_dir.is_dir(): continue
-    name = person_dir.name
-    if name not in label_map:
-        label_map[name] = current_label
-        current_label += 1
-    label_id = label_map[name]
-    for img_path in person_dir.glob("*.jpg"):
-        img = cv2.imread(str(img_path), cv2.IMREAD_GRAYSCALE)
-        if img is None: continue
-        # optional resize
-        face = cv2.resize(img, (200,200))
-        faces.append(face)
-        labels.append(label_id)
-
-if len(faces) == 0:
-    raise SystemExit("Nenhuma imagem encontrada. Rode collect_images.py primeiro.")
-
-recognizer.train(faces, np.array(labels))
-Path(args.model).parent.mkdir(parents=True, exist_ok=True)
-recognizer.write(str(args.model))
-Path(args.labels).parent.mkdir(parents=True, exist_ok=True)
-with open(args.labels, 'w', encoding='utf-8') as f:
-    json.dump(label_map, f, ensure_ascii=False, indent=2)
-
-print(f"[OK] Modelo salvo em {args.model}")
-print(f"[OK] Labels salvo em {args.labels}")
\ No newline at end of file
+# carregamento do dataset
+parser.add_argument('--workers', type=int, default=None, help='Processos para decodificar as imagens (padrão: nº de CPUs)')
+parser.add_argument('--cache', default='models/cache', help="Cache das faces pré-processadas (memmap); '' desativa")
+# treino incremental
+parser.add_argument('--incremental', action='store_true', help='Carrega o modelo existente e só acrescenta imagens novas (LBPH update)')
+
+def load_faces(entries, args):
+    """Faces 200x200 das `entries`: [(pessoa, caminho, face)] na mesma ordem, sem as que falharam"""
+    if args.cache:
+        # só decodifica imagens novas/alteradas; o resto vem do memmap
+        cache = FaceCache(args.cache)
+        return [(name, path, cache.faces[row]) for name, path, row in cache.sync(entries, workers=args.workers)]
+    decoded = decode_faces([path for _, path, _, _ in entries], workers=args.workers)
+    return [(name, path, face) for (name, path, _, _), face in zip(entries, decoded) if face is not None]
+
+def assign_labels(names, label_map, next_label):
+    """Mantém os ids já existentes; pessoas novas recebem ids ainda não usados"""
+    for name in names:
+        if name not in label_map:
+            label_map[name] = next_label
+            next_label += 1
+    return next_label
+
+def manifest_rows(loaded, stats, label_map):
+    return [[path, stats[path][0], stats[path][1], label_map[name]] for name, path, _ in loaded]
+
+def full_train(args, entries, label_map):
+    recognizer = create_recognizer(vars(args))
+    loaded = load_faces(entries, args)
+    if len(loaded) == 0:
+        raise SystemExit("Nenhuma imagem encontrada. Rode collect_images.py primeiro.")
+    recognizer.train([face for _, _, face in loaded], np.array([label_map[name] for name, _, _ in loaded]))
+    return recognizer, loaded
+
+def incremental_train(args, entries, label_map, manifest):
+    """Compacta o modelo (remove histogramas de imagens apagadas/alteradas) e faz update com as novas"""
+    current = {path: (name, mtime, size) for name, path, mtime, size in entries}
+    params, histograms, labels = read_lbph(args.model)
+    rows = manifest['rows']
+    if len(rows) != len(labels):
+        raise SystemExit(f"Manifesto ({len(rows)} linhas) não corresponde ao modelo ({len(labels)} histogramas); rode o treino completo.")
+
+    keep = [i for i, (path, mtime, size, label) in enumerate(rows)
+            if path in current and current[path][1:] == (mtime, size) and label_map.get(current[path][0]) == label]
+    trained = {rows[i][0] for i in keep}
+    if len(keep) < len(rows):
+        # LBPH não tem remoção: regrava o modelo só com os histogramas mantidos
+        write_lbph_yml(args.model, params, histograms[keep], labels[keep])
+        print(f"[INFO] Compactação: {len(rows) - len(keep)} histogramas removidos")
+
+    recognizer = create_recognizer(params)
+    if keep:
+        recognizer.read(str(args.model))
+    new_entries = [e for e in entries if e[1] not in trained]
+    loaded = load_faces(new_entries, args)
+    if loaded:
+        faces = [face for _, _, face in loaded]
+        new_labels = np.array([label_map[name] for name, _, _ in loaded])
+        if keep:
+            recognizer.update(faces, new_labels)
+        else:
+            recognizer.train(faces, new_labels)
+    elif not keep:
+        raise SystemExit("Nenhuma imagem encontrada. Rode collect_images.py primeiro.")
+    print(f"[INFO] Incremental: {len(keep)} mantidos, {len(loaded)} novos")
+    return recognizer, [rows[i] for i in keep], loaded
+
+def main():
+    args = parser.parse_args()
+    start = time.perf_counter()
+    entries = scan_dataset(args.data)
+    stats = {path: (mtime, size) for _, path, mtime, size in entries}
+    names = sorted({name for name, _, _, _ in entries})
+
+    label_map, manifest = {}, load_manifest(args.manifest)
+    if Path(args.labels).exists():
+        with open(args.labels, 'r', encoding='utf-8') as f:
+            label_map = {k: int(v) for k, v in json.load(f).items()}
+    # ids de pessoas removidas não são reaproveitados
+    next_label = max([manifest['next_label'] if manifest else 0] + [v + 1 for v in label_map.values()])
+    label_map = {name: label_map[name] for name in names if name in label_map}
+    next_label = assign_labels(names, label_map, next_label)
+
+    if args.incremental and manifest is not None and Path(args.model).exists():
+        recognizer, kept_rows, loaded = incremental_train(args, entries, label_map, manifest)
+        rows = kept_rows + manifest_rows(loaded, stats, label_map)
+    else:
+        if args.incremental:
+            print("[INFO] Modelo/manifesto não encontrados; fazendo treino completo")
+        recognizer, loaded = full_train(args, entries, label_map)
+        rows = manifest_rows(loaded, stats, label_map)
+    print(f"[INFO] {len(rows)} imagens no modelo ({time.perf_counter() - start:.1f}s)")
+
+    Path(args.model).parent.mkdir(parents=True, exist_ok=True)
+    recognizer.write(str(args.model))
+    Path(args.labels).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.labels, 'w', encoding='utf-8') as f:
+        json.dump(label_map, f, ensure_ascii=False, indent=2)
+    save_manifest(args.manifest, rows, next_label)
+
+    print(f"[OK] Modelo salvo em {args.model}")
+    if args.binary:
+        # exporta a partir do recognizer em memória, sem reler o yml
+        histograms = np.vstack([h.reshape(1, -1) for h in recognizer.getHistograms()])
+        write_lbph_binary(args.binary, recognizer_params(recognizer), histograms, recognizer.getLabels(), label_map)
+        print(f"[OK] Modelo binário salvo em {args.binary}")
+    print(f"[OK] Labels salvo em {args.labels}")
+
+if __name__ == '__main__':
+    # guarda necessária: o pool de decodificação reimporta este módulo (spawn)
+    main()
@@ -0,0 +1,88 @@
+# src/utils.py
+import time
+from pathlib import Path
+
+import cv2
+
+
+class RunStats:
+    """Mede FPS e uso de CPU do processo (tempo de CPU / tempo de parede)"""
+
+    def __init__(self):
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        self.frames = 0
+        self.counters = {}
+
+    def frame(self):
+        self.frames += 1
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self):
+        wall = max(time.perf_counter() - self.start_wall, 1e-9)
+        cpu = time.process_time() - self.start_cpu
+        result = {
+            "frames": self.frames,
+            "seconds": round(wall, 2),
+            "fps": round(self.frames / wall, 2),
+            # 100% = um núcleo inteiro ocupado
+            "cpu_percent": round(100.0 * cpu / wall, 1),
+        }
+        result.update(self.counters)
+        return result
+
+    def report(self, label="[STATS]", file=None):
+        print(label + " " + " ".join(f"{k}={v}" for k, v in self.summary().items()), file=file)
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def iter_frames(source, max_frames=None, start=0):
+    """Frames (BGR) de um arquivo de vídeo ou de uma pasta de imagens, com o índice de cada um.
+
+    Com `start` a leitura começa nesse frame (imagem da pasta, em ordem de nome,
+    ou posição do vídeo); os índices continuam contando a partir dele.
+    """
+    path = Path(source)
+    count = 0
+    if path.is_dir():
+        images = sorted(p for p in path.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+        for idx, img_path in enumerate(images[start:], start):
+            if max_frames is not None and count >= max_frames:
+                return
+            frame = cv2.imread(str(img_path))
+            if frame is None:
+                continue
+            yield idx, frame
+            count += 1
+        return
+    cap = cv2.VideoCapture(str(path))
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    try:
+        while max_frames is None or count < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield start + count, frame
+            count += 1
+    finally:
+        cap.release()
+
+
+def frame_count(source):
+    """(nº de frames, fps) de um vídeo ou pasta de imagens; nº None se o container não informa"""
+    path = Path(source)
+    if path.is_dir():
+        return sum(1 for p in path.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS), 0.0
+    cap = cv2.VideoCapture(str(path))
+    try:
+        if not cap.isOpened():
+            raise SystemExit(f"Não foi possível abrir '{source}'")
+        count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        return (count if count > 0 else None), cap.get(cv2.CAP_PROP_FPS) or 0.0
+    finally:
+        cap.release()